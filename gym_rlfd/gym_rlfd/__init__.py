@@ -1,4 +1,5 @@
-from gym.envs.registration import register
+import gym
+from gym.envs.registration import load, register
 
 def _merge(a, b):
     a.update(b)
@@ -36,4 +37,30 @@ for reward_type in ['sparse', 'dense']:
         entry_point='gym_rlfd.robotics:FetchPickAndPlaceEnv',
         kwargs=_merge({'rand_init': True}, kwargs),
         max_episode_steps=40,
-    )
\ No newline at end of file
+    )
+
+# Pure numpy environment of default sizes, see synthetic.register_synthetic for
+# other sizes.
+register(
+    id='YWSynthetic-v0',
+    entry_point='gym_rlfd.synthetic:SyntheticEnv',
+    max_episode_steps=1000,
+)
+
+# Vector variants (see gym_rlfd.vec_env) of the environments with a batched implementation, by entry point.
+VEC_ENTRY_POINTS = {
+    'gym_rlfd.robotics:FetchPegInHoleEnv': 'gym_rlfd.robotics:VecFetchPegInHoleEnv',
+    'gym_rlfd.robotics:FetchPickAndPlaceEnv': 'gym_rlfd.robotics:VecFetchPickAndPlaceEnv',
+}
+
+
+def make_vec_env(env_id, num_envs, **kwargs):
+    """Returns num_envs copies of the registered environment env_id as one vector environment stepping them together,
+    None if the environment has no batched implementation (see vec_env.SerialVecEnv for those). Episodes are not
+    limited to max_episode_steps.
+    """
+    spec = gym.spec(env_id)
+    if not isinstance(spec.entry_point, str) or spec.entry_point not in VEC_ENTRY_POINTS:
+        return None
+    spec_kwargs = getattr(spec, 'kwargs', None) or getattr(spec, '_kwargs', {})
+    return load(VEC_ENTRY_POINTS[spec.entry_point])(num_envs, **_merge(dict(spec_kwargs), kwargs))
@@ -38,3 +38,8 @@ class FetchPegInHoleEnv(fetch_env.FetchEnv, utils.EzPickle):
             pixel=pixel,
         )
         utils.EzPickle.__init__(self)
+
+
+class VecFetchPegInHoleEnv(fetch_env.VecFetchEnv):
+    def __init__(self, num_envs, **kwargs):
+        super(VecFetchPegInHoleEnv, self).__init__(lambda: FetchPegInHoleEnv(**kwargs), num_envs)
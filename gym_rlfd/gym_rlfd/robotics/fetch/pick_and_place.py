@@ -21,3 +21,8 @@ class FetchPickAndPlaceEnv(fetch_env.FetchEnv, utils.EzPickle):
             obj_range=0.15, target_range=0.15, distance_threshold=0.05,
             initial_qpos=initial_qpos, reward_type=reward_type, rand_init=rand_init)
         utils.EzPickle.__init__(self)
+
+
+class VecFetchPickAndPlaceEnv(fetch_env.VecFetchEnv):
+    def __init__(self, num_envs, **kwargs):
+        super(VecFetchPickAndPlaceEnv, self).__init__(lambda: FetchPickAndPlaceEnv(**kwargs), num_envs)
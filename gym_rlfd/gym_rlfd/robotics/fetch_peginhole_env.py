@@ -1,7 +1,7 @@
 import numpy as np
 
 from gym.envs.robotics import rotations, utils
-from gym_rlfd.robotics import robot_env
+from gym_rlfd.robotics import robot_env, vec_robot_env
 
 
 class FetchEnv(robot_env.RobotEnv):
@@ -79,31 +79,39 @@ class FetchEnv(robot_env.RobotEnv):
         utils.ctrl_set_action(self.sim, action)
         utils.mocap_set_action(self.sim, action)
 
-    def _get_obs(self):
+    def _cache_ids(self):
+        """Looks up the ids read by _get_obs and allocates its buffers, once the simulator is set up."""
+        model = self.sim.model
+        self._grip_id = model.site_name2id("robot0:grip")
+        self._dt = self.sim.nsubsteps * model.opt.timestep
+        self._jacp = np.empty(3 * model.nv)
+        self._jacr = np.empty(3 * model.nv)
+        self._velr = np.empty(3)
+        self._empty = np.zeros((0,))
+        self._empty.flags.writeable = False
 
+    def _get_obs(self):
+        # Observations are read-only, "observation" and "_state" are the same array and "_achieved_goal" is a view
+        # of it. The state is the only array allocated per step.
+        data = self.sim.data
+        state = np.empty(6)
         # positions
-        grip_pos = self.sim.data.get_site_xpos("robot0:grip")
-        dt = self.sim.nsubsteps * self.sim.model.opt.timestep
-        grip_velp = self.sim.data.get_site_xvelp("robot0:grip") * dt
-        robot_qpos, robot_qvel = utils.robot_get_obs(self.sim)
-
-        gripper_state = robot_qpos[-2:]
-        gripper_vel = robot_qvel[-2:] * dt  # change to a scalar if the gripper is made symmetric
-
-        achieved_goal = grip_pos.copy()
-
-        state = np.concatenate([grip_pos, grip_velp])
+        state[0:3] = data.site_xpos[self._grip_id]
+        grip_velp = state[3:6]
+        robot_env.site_xvel(self.sim, self._grip_id, self._jacp, self._jacr, grip_velp, self._velr)
+        grip_velp *= self._dt
+        state.flags.writeable = False
 
         # pixel = self.render(mode="rgb_array")
 
         return {
-            "observation": state.copy(),
-            "achieved_goal": np.zeros((0,)),
-            "desired_goal": np.zeros((0,)),
+            "observation": state,
+            "achieved_goal": self._empty,
+            "desired_goal": self._empty,
             # "_pixel": pixel.copy(),
-            "_state": state.copy(),
-            "_achieved_goal": achieved_goal.copy(),
-            "_desired_goal": self.goal.copy(),
+            "_state": state,
+            "_achieved_goal": state[0:3],
+            "_desired_goal": self._goal_obs(),
         }
 
     def _viewer_setup(self):
@@ -164,6 +172,7 @@ class FetchEnv(robot_env.RobotEnv):
         # Extract information for sampling goals.
         self.goal = self.sim.data.get_site_xpos("hole").copy() + np.array((0.0, 0.0, 0.0))
         # self.goal = np.array([1.45, 0.75 ,0.5])
+        self._cache_ids()
 
     def _env_setup_helper(self, gripper_target, gripper):
         self.sim.data.set_mocap_pos("robot0:mocap", gripper_target)
@@ -173,3 +182,29 @@ class FetchEnv(robot_env.RobotEnv):
         for _ in range(10):
             self.sim.step()
             # self._get_viewer("human").render()
+
+
+class VecFetchEnv(vec_robot_env.VecRobotEnv):
+    """Copies of a FetchEnv stepped together, see vec_robot_env.VecRobotEnv.
+    """
+
+    def _cache_ids(self, model):
+        self._grip_id = model.site_name2id("robot0:grip")
+
+    def _get_obs(self):
+        grip_pos = self._site_xpos(self._grip_id)
+        grip_velp, _ = self._site_xvel(self._grip_id)
+        grip_velp *= self.dt
+        goals = self._goals()
+
+        state = np.concatenate([grip_pos, grip_velp], axis=-1)
+        empty = np.zeros((self.num_envs, 0))
+
+        return {
+            "observation": state.copy(),
+            "achieved_goal": empty,
+            "desired_goal": empty.copy(),
+            "_state": state.copy(),
+            "_achieved_goal": grip_pos.copy(),
+            "_desired_goal": goals,
+        }
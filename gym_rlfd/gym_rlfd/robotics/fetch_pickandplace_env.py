@@ -1,7 +1,7 @@
 import numpy as np
 
 from gym.envs.robotics import rotations, utils
-from gym_rlfd.robotics import robot_env
+from gym_rlfd.robotics import robot_env, vec_robot_env
 
 
 def goal_distance(goal_a, goal_b):
@@ -85,54 +85,66 @@ class FetchEnv(robot_env.RobotEnv):
         utils.ctrl_set_action(self.sim, action)
         utils.mocap_set_action(self.sim, action)
 
+    def _cache_ids(self):
+        """Looks up the ids read by _get_obs and allocates its buffers, once the simulator is set up."""
+        model = self.sim.model
+        self._grip_id = model.site_name2id('robot0:grip')
+        # the gripper joints, the last robot joints (see utils.robot_get_obs)
+        names = [n for n in model.joint_names if n.startswith('robot')][-2:]
+        self._gripper_qpos_addrs = np.array([model.get_joint_qpos_addr(n) for n in names])
+        self._gripper_qvel_addrs = np.array([model.get_joint_qvel_addr(n) for n in names])
+        if self.has_object:
+            self._object_id = model.site_name2id('object0')
+        self._state_size = 25 if self.has_object else 10
+        self._dt = self.sim.nsubsteps * model.opt.timestep
+        self._jacp = np.empty(3 * model.nv)
+        self._jacr = np.empty(3 * model.nv)
+        self._velr = np.empty(3)
+        self._empty = np.zeros((0,))
+        self._empty.flags.writeable = False
+
     def _get_obs(self):
+        # Observations are read-only, 'observation' and '_state' are the same array and '_achieved_goal' is a view
+        # of it. The state is filled in place and is the only array allocated per step. Layout: grip_pos,
+        # grip_velp, gripper_state, gripper_vel and, with an object, object_pos, object_rel_pos, object_rot,
+        # object_velp, object_velr.
+        data = self.sim.data
+        dt = self._dt
+        state = np.empty(self._state_size)
         # positions
-        grip_pos = self.sim.data.get_site_xpos('robot0:grip')
-        dt = self.sim.nsubsteps * self.sim.model.opt.timestep
-        grip_velp = self.sim.data.get_site_xvelp('robot0:grip') * dt
-        robot_qpos, robot_qvel = utils.robot_get_obs(self.sim)
+        grip_pos, grip_velp = state[0:3], state[3:6]
+        grip_pos[:] = data.site_xpos[self._grip_id]
+        robot_env.site_xvel(self.sim, self._grip_id, self._jacp, self._jacr, grip_velp, self._velr)
+        grip_velp *= dt
+        # gripper state
+        np.take(data.qpos, self._gripper_qpos_addrs, out=state[6:8])
+        gripper_vel = state[8:10]  # change to a scalar if the gripper is made symmetric
+        np.take(data.qvel, self._gripper_qvel_addrs, out=gripper_vel)
+        gripper_vel *= dt
         if self.has_object:
-            object_pos = self.sim.data.get_site_xpos('object0')
+            object_pos = state[10:13]
+            object_pos[:] = data.site_xpos[self._object_id]
+            np.subtract(object_pos, grip_pos, out=state[13:16])
             # rotations
-            object_rot = rotations.mat2euler(self.sim.data.get_site_xmat('object0'))
+            robot_env.mat2euler(data.site_xmat[self._object_id], state[16:19])
             # velocities
-            object_velp = self.sim.data.get_site_xvelp('object0') * dt
-            object_velr = self.sim.data.get_site_xvelr('object0') * dt
-            # gripper state
-            object_rel_pos = object_pos - grip_pos
+            object_velp, object_velr = state[19:22], state[22:25]
+            robot_env.site_xvel(self.sim, self._object_id, self._jacp, self._jacr, object_velp, object_velr)
+            object_velp *= dt
+            object_velr *= dt
             object_velp -= grip_velp
-        else:
-            object_pos = object_rot = object_velp = object_velr = object_rel_pos = np.zeros(0)
-        gripper_state = robot_qpos[-2:]
-        gripper_vel = robot_qvel[-2:] * dt  # change to a scalar if the gripper is made symmetric
-
-        if not self.has_object:
-            achieved_goal = grip_pos.copy()
-        else:
-            achieved_goal = np.squeeze(object_pos.copy())
-
-        state = np.concatenate([
-            grip_pos,
-            grip_velp,
-            gripper_state,
-            gripper_vel,
-            object_pos.ravel(),
-            object_rel_pos.ravel(),
-            object_rot.ravel(),
-            object_velp.ravel(),
-            object_velr.ravel(),
-        ])
+        state.flags.writeable = False
 
         # pixel = self.render(mode="rgb_array")
 
         return {
-            'observation': state.copy(),
-            "achieved_goal": np.zeros((0,)),
-            "desired_goal": np.zeros((0,)), # use fixed goal
+            'observation': state,
+            "achieved_goal": self._empty,
+            "desired_goal": self._empty, # use fixed goal
             # "_pixel": pixel.copy(),
-            "_state": state.copy(),
-            '_desired_goal': self.goal.copy(),
-            "_achieved_goal": achieved_goal.copy(),
+            "_state": state,
+            '_desired_goal': self._goal_obs(),
+            "_achieved_goal": state[10:13] if self.has_object else state[0:3],
         }
 
     def _viewer_setup(self):
@@ -214,6 +226,67 @@ class FetchEnv(robot_env.RobotEnv):
         self.initial_gripper_xpos = self.sim.data.get_site_xpos('robot0:grip').copy()
         if self.has_object:
             self.height_offset = self.sim.data.get_site_xpos('object0')[2]
+        self._cache_ids()
 
     def render(self, mode='human', width=500, height=500):
         return super(FetchEnv, self).render(mode, width, height)
+
+
+class VecFetchEnv(vec_robot_env.VecRobotEnv):
+    """Copies of a FetchEnv stepped together, see vec_robot_env.VecRobotEnv.
+    """
+
+    def _cache_ids(self, model):
+        self._has_object = self.envs[0].has_object
+        self._grip_id = model.site_name2id('robot0:grip')
+        # the gripper joints, the last robot joints (see utils.robot_get_obs)
+        names = [n for n in model.joint_names if n.startswith('robot')][-2:]
+        self._gripper_qpos_addrs = [model.get_joint_qpos_addr(n) for n in names]
+        self._gripper_qvel_addrs = [model.get_joint_qvel_addr(n) for n in names]
+        if self._has_object:
+            self._object_id = model.site_name2id('object0')
+
+    def _get_obs(self):
+        # positions
+        grip_pos = self._site_xpos(self._grip_id)
+        grip_velp, _ = self._site_xvel(self._grip_id)
+        grip_velp *= self.dt
+        empty = np.zeros((self.num_envs, 0))
+        if self._has_object:
+            object_pos = self._site_xpos(self._object_id)
+            # rotations
+            object_rot = rotations.mat2euler(self._site_xmat(self._object_id))
+            # velocities
+            object_velp, object_velr = self._site_xvel(self._object_id)
+            object_velp *= self.dt
+            object_velr *= self.dt
+            # gripper state
+            object_rel_pos = object_pos - grip_pos
+            object_velp -= grip_velp
+        else:
+            object_pos = object_rot = object_velp = object_velr = object_rel_pos = empty
+        gripper_state = self._qpos(self._gripper_qpos_addrs)
+        gripper_vel = self._qvel(self._gripper_qvel_addrs) * self.dt
+
+        achieved_goal = object_pos if self._has_object else grip_pos
+
+        state = np.concatenate([
+            grip_pos,
+            grip_velp,
+            gripper_state,
+            gripper_vel,
+            object_pos,
+            object_rel_pos,
+            object_rot,
+            object_velp,
+            object_velr,
+        ], axis=-1)
+
+        return {
+            'observation': state.copy(),
+            "achieved_goal": empty.copy(),
+            "desired_goal": empty.copy(),
+            "_state": state.copy(),
+            '_desired_goal': self._goals(),
+            "_achieved_goal": achieved_goal.copy(),
+        }
@@ -1,5 +1,6 @@
 import os
 import copy
+import math
 import numpy as np
 
 import gym
@@ -17,6 +18,32 @@ except ImportError as e:
 
 DEFAULT_SIZE = 64
 
+_EPS4 = np.finfo(float).eps * 4.0
+
+
+def site_xvel(sim, site_id, jacp, jacr, velp, velr):
+    """Writes the linear and angular velocities of a site into velp and velr, as MjData.get_site_xvelp and
+    get_site_xvelr without name lookups or allocations. jacp and jacr are buffers of 3 * nv.
+    """
+    mujoco_py.functions.mj_jacSite(sim.model, sim.data, jacp, jacr, site_id)
+    np.dot(jacp.reshape((3, -1)), sim.data.qvel, out=velp)
+    np.dot(jacr.reshape((3, -1)), sim.data.qvel, out=velr)
+
+
+def mat2euler(xmat, out):
+    """Writes rotations.mat2euler of one rotation matrix, given as a row of MjData.site_xmat, into out. Scalar math,
+    the batched numpy version costs more than the conversion itself for a single matrix.
+    """
+    m00, m01, m02, m10, m11, m12, _, _, m22 = xmat.tolist()
+    cy = math.sqrt(m22 * m22 + m12 * m12)
+    if cy > _EPS4:
+        out[0] = -math.atan2(m12, m22)
+        out[2] = -math.atan2(m01, m00)
+    else:
+        out[0] = 0.0
+        out[2] = -math.atan2(-m10, m11)
+    out[1] = -math.atan2(-m02, cy)
+
 
 class RobotEnv(gym.GoalEnv):
     def __init__(self, model_path, initial_qpos, n_actions, n_substeps):
@@ -31,6 +58,8 @@ class RobotEnv(gym.GoalEnv):
         self.sim = mujoco_py.MjSim(model, nsubsteps=n_substeps)
         self.viewer = None
         self._viewers = {}
+        self._goal_src = None
+        self._goal_copy = None
 
         self.metadata = {
             "render.modes": ["human", "rgb_array"],
@@ -139,6 +168,14 @@ class RobotEnv(gym.GoalEnv):
         self.sim.forward()
         return True
 
+    def _goal_obs(self):
+        """Read-only copy of the goal for observations, copied again only when the goal is replaced."""
+        if self._goal_src is not self.goal:
+            self._goal_src = self.goal
+            self._goal_copy = self.goal.copy()
+            self._goal_copy.flags.writeable = False
+        return self._goal_copy
+
     def _get_obs(self):
         """Returns the observation.
         """
@@ -0,0 +1,100 @@
+import numpy as np
+
+from gym_rlfd import vec_env
+from gym_rlfd.robotics import robot_env
+from gym_rlfd.robotics.robot_env import mujoco_py
+
+
+class VecRobotEnv(vec_env.VecEnv):
+    """num_envs copies of a RobotEnv whose simulators are held by a mujoco_py.MjSimPool and stepped in parallel in native
+    code, see gym_rlfd.vec_env for the interface.
+
+    Actions are applied and environments are reset with the methods of the RobotEnv copies. Subclasses implement
+    _get_obs for all simulators at once, reading the data arrays at the site and joint ids they cache in
+    _cache_ids instead of looking names up on every step.
+    """
+
+    def __init__(self, make_env, num_envs):
+        self.envs = [make_env() for _ in range(num_envs)]
+        env = self.envs[0]
+        super(VecRobotEnv, self).__init__(num_envs, env.observation_space, env.action_space)
+        self.sims = [env.sim for env in self.envs]
+        self.pool = mujoco_py.MjSimPool(self.sims, nsubsteps=env.sim.nsubsteps)
+        self.dt = env.dt
+        self._jacp = np.empty(3 * env.sim.model.nv)
+        self._jacr = np.empty(3 * env.sim.model.nv)
+        self._cache_ids(env.sim.model)
+
+    def seed(self, seed=None):
+        return [env.seed(None if seed is None else seed + i)[0] for i, env in enumerate(self.envs)]
+
+    def reset(self, indices=None):
+        # RobotEnv.reset without the observation of every single environment
+        for i in range(self.num_envs) if indices is None else indices:
+            env = self.envs[i]
+            did_reset_sim = False
+            while not did_reset_sim:
+                did_reset_sim = env._reset_sim()
+            env.goal = env._sample_goal().copy()
+        return self._get_obs()
+
+    def step(self, actions):
+        actions = np.clip(actions, self.action_space.low, self.action_space.high)
+        for env, action in zip(self.envs, actions):
+            env._set_action(action)
+        self.pool.step()
+        for env in self.envs:
+            env._step_callback()
+        obs = self._get_obs()
+
+        env = self.envs[0]  # goal distances are computed along the last axis
+        info = {
+            "is_success": env._is_success(obs["_achieved_goal"], obs["_desired_goal"]),
+            "shaping_reward": env._shaping_reward(obs["_achieved_goal"], obs["_desired_goal"]),
+        }
+        reward = env.compute_reward(obs["_achieved_goal"], obs["_desired_goal"], info)
+        return obs, reward, np.zeros(self.num_envs, dtype=bool), info
+
+    def render(self, *args, **kwargs):
+        return self.envs[0].render(*args, **kwargs)
+
+    def close(self):
+        for env in self.envs:
+            env.close()
+
+    # Batched reads
+    # ----------------------------
+
+    def _goals(self):
+        return np.stack([env.goal for env in self.envs])
+
+    def _site_xpos(self, site_id):
+        return np.stack([sim.data.site_xpos[site_id] for sim in self.sims])
+
+    def _site_xmat(self, site_id):
+        return np.stack([sim.data.site_xmat[site_id] for sim in self.sims]).reshape((self.num_envs, 3, 3))
+
+    def _site_xvel(self, site_id):
+        """Linear and angular velocities of the site in all simulators, as MjData.get_site_xvelp and get_site_xvelr."""
+        velp = np.empty((self.num_envs, 3))
+        velr = np.empty((self.num_envs, 3))
+        for i, sim in enumerate(self.sims):
+            robot_env.site_xvel(sim, site_id, self._jacp, self._jacr, velp[i], velr[i])
+        return velp, velr
+
+    def _qpos(self, addrs):
+        return np.stack([sim.data.qpos[addrs] for sim in self.sims])
+
+    def _qvel(self, addrs):
+        return np.stack([sim.data.qvel[addrs] for sim in self.sims])
+
+    # Extension methods
+    # ----------------------------
+
+    def _cache_ids(self, model):
+        """Looks up the ids of the sites and joints read by _get_obs."""
+        pass
+
+    def _get_obs(self):
+        """Returns the observations of all environments, as RobotEnv._get_obs with a leading num_envs dimension."""
+        raise NotImplementedError()
@@ -0,0 +1,101 @@
+"""Pure numpy environment for benchmarking and testing without MuJoCo.
+
+The dynamics are a fixed random linear system squashed by tanh and the reward
+is the negative squared norm of the observation. The environment provides a
+D4RL style offline dataset collected by a uniformly random policy.
+"""
+import numpy as np
+
+import gym
+from gym import spaces
+from gym.envs.registration import register, registry
+from gym.utils import seeding
+
+
+class SyntheticEnv(gym.Env):
+    metadata = {"render.modes": []}
+
+    def __init__(self, obs_dim=17, action_dim=6, dataset_size=10000):
+        self.obs_dim = obs_dim
+        self.action_dim = action_dim
+        self.dataset_size = dataset_size
+
+        # The dynamics do not depend on the seed of the environment.
+        rng = np.random.RandomState(0)
+        self._A = rng.normal(scale=1.0 / np.sqrt(obs_dim),
+                             size=(obs_dim, obs_dim)).astype(np.float32)
+        self._B = rng.normal(scale=1.0 / np.sqrt(action_dim),
+                             size=(action_dim, obs_dim)).astype(np.float32)
+
+        self.action_space = spaces.Box(-1.0, 1.0, shape=(action_dim,),
+                                       dtype="float32")
+        self.observation_space = spaces.Box(-np.inf, np.inf,
+                                            shape=(obs_dim,), dtype="float32")
+
+        self.seed()
+        self._obs = None
+
+    def seed(self, seed=None):
+        self.np_random, seed = seeding.np_random(seed)
+        self.action_space.seed(seed)
+        return [seed]
+
+    def reset(self):
+        self._obs = self.np_random.uniform(-0.1, 0.1, size=self.obs_dim)
+        self._obs = self._obs.astype(np.float32)
+        return self._obs.copy()
+
+    def step(self, action):
+        action = np.asarray(action, dtype=np.float32).reshape(self.action_dim)
+        action = np.clip(action, -1.0, 1.0)
+        noise = self.np_random.normal(scale=0.01, size=self.obs_dim)
+        self._obs = (np.tanh(self._obs.dot(self._A) + action.dot(self._B)) +
+                     noise.astype(np.float32))
+        reward = -float(np.mean(np.square(self._obs)))
+        return self._obs.copy(), reward, False, {}
+
+    def render(self, mode="human"):
+        pass
+
+    def get_dataset(self):
+        """Returns dataset_size transitions of a uniformly random policy in
+        the format of D4RL.
+        """
+        rng = np.random.RandomState(1)
+        observations = np.empty((self.dataset_size, self.obs_dim),
+                                dtype=np.float32)
+        actions = rng.uniform(-1.0, 1.0,
+                              size=(self.dataset_size, self.action_dim))
+        actions = actions.astype(np.float32)
+        obs = rng.uniform(-0.1, 0.1, size=self.obs_dim).astype(np.float32)
+        for i in range(self.dataset_size):
+            observations[i] = obs
+            obs = np.tanh(obs.dot(self._A) + actions[i].dot(self._B))
+        rewards = -np.mean(np.square(observations), axis=1)
+        return dict(
+            observations=observations,
+            actions=actions,
+            rewards=rewards.astype(np.float32),
+            terminals=np.zeros(self.dataset_size, dtype=bool),
+        )
+
+
+def register_synthetic(obs_dim=17, action_dim=6, eps_length=1000,
+                       dataset_size=10000):
+    """Registers (once) and returns the id of a synthetic environment of the
+    given sizes.
+
+    Every configuration gets its own id since cached env specs and datasets
+    are keyed by id.
+    """
+    env_id = "YWSyntheticO{}U{}T{}D{}-v0".format(obs_dim, action_dim,
+                                                 eps_length, dataset_size)
+    if env_id not in registry.env_specs:
+        register(
+            id=env_id,
+            entry_point="gym_rlfd.synthetic:SyntheticEnv",
+            kwargs=dict(obs_dim=obs_dim, action_dim=action_dim,
+                        dataset_size=dataset_size),
+            max_episode_steps=eps_length,
+        )
+    return env_id
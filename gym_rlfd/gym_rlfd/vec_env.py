@@ -0,0 +1,78 @@
+"""Vector environments: num_envs copies of an environment stepped together.
+
+Interface (see VecEnv):
+    num_envs                 - number of environments
+    observation_space        - space of the observation of a single environment
+    action_space             - space of the action of a single environment
+    seed(seed)               - seeds environment i with seed + i
+    reset(indices=None)      - resets the environments at indices (all if None), returns the observations of all of them
+    step(actions)            - steps all environments, returns observations, rewards [num_envs], dones [num_envs] and
+                               infos (a dict of [num_envs] arrays)
+
+Observations have the environments along their first dimension, dict observations are dicts of such arrays.
+Environments are not reset automatically when their episode ends.
+"""
+import numpy as np
+
+
+def _stack(values):
+    if isinstance(values[0], dict):
+        return {k: np.stack([v[k] for v in values]) for k in values[0]}
+    return np.stack(values)
+
+
+class VecEnv(object):
+    def __init__(self, num_envs, observation_space, action_space):
+        self.num_envs = num_envs
+        self.observation_space = observation_space
+        self.action_space = action_space
+
+    def seed(self, seed=None):
+        raise NotImplementedError()
+
+    def reset(self, indices=None):
+        raise NotImplementedError()
+
+    def step(self, actions):
+        raise NotImplementedError()
+
+    def render(self, *args, **kwargs):
+        """Renders the first environment."""
+        pass
+
+    def close(self):
+        pass
+
+
+class SerialVecEnv(VecEnv):
+    """Vector environment of any environment, stepped one after the other."""
+
+    def __init__(self, make_env, num_envs):
+        self.envs = [make_env() for _ in range(num_envs)]
+        super(SerialVecEnv, self).__init__(num_envs, self.envs[0].observation_space, self.envs[0].action_space)
+        self._obs = [None] * num_envs
+
+    def seed(self, seed=None):
+        return [env.seed(None if seed is None else seed + i)[0] for i, env in enumerate(self.envs)]
+
+    def reset(self, indices=None):
+        for i in range(self.num_envs) if indices is None else indices:
+            self._obs[i] = self.envs[i].reset()
+        return _stack(self._obs)
+
+    def step(self, actions):
+        rewards, dones, infos = [], [], []
+        for i, (env, action) in enumerate(zip(self.envs, actions)):
+            self._obs[i], reward, done, info = env.step(action)
+            rewards.append(reward)
+            dones.append(done)
+            infos.append(info)
+        infos = {k: np.array([info[k] for info in infos]) for k in infos[0]}
+        return _stack(self._obs), np.array(rewards), np.array(dones), infos
+
+    def render(self, *args, **kwargs):
+        return self.envs[0].render(*args, **kwargs)
+
+    def close(self):
+        for env in self.envs:
+            env.close()
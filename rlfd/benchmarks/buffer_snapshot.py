@@ -0,0 +1,94 @@
+"""Measures the time to snapshot the online replay buffer after every epoch,
+with a compressed dump of the whole buffer (ReplayBuffer.dump_to_file) and
+with incremental snapshots (ReplayBuffer.save_snapshot), and the time to
+restore it. Restored buffers are checked against the original one.
+
+  python benchmarks/buffer_snapshot.py --buffer_size 1000000
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+osp = os.path
+
+import numpy as np
+
+from rlfd import memory
+
+from throughput import machine_info, random_transitions
+
+
+def main(obs_dim, action_dim, buffer_size, epoch_size, num_epochs, output):
+  np.random.seed(0)
+  dims = dict(o=(obs_dim,), u=(action_dim,))
+  shapes = dict(o=dims["o"], o_2=dims["o"], u=dims["u"], r=(1,), done=(1,))
+  buffer = memory.StepBaseReplayBuffer(shapes, buffer_size)
+  # start from a full buffer, as after the first epochs of a long run
+  buffer.store(random_transitions(dims["o"], dims["u"], buffer_size))
+
+  results = dict(dump=[], snapshot=[])
+  with tempfile.TemporaryDirectory() as tmp_dir:
+    dump_file = osp.join(tmp_dir, "buffer.npz")
+    snapshot_dir = osp.join(tmp_dir, "snapshot")
+    for epoch in range(num_epochs):
+      buffer.store(random_transitions(dims["o"], dims["u"], epoch_size))
+      start = time.perf_counter()
+      buffer.dump_to_file(dump_file)
+      results["dump"].append(time.perf_counter() - start)
+      start = time.perf_counter()
+      manifest = buffer.save_snapshot(snapshot_dir)
+      buffer.prune_snapshots(snapshot_dir, manifest)
+      results["snapshot"].append(time.perf_counter() - start)
+      print("epoch {:>3}: dump {:8.3f}s, snapshot {:8.3f}s".format(
+          epoch, results["dump"][-1], results["snapshot"][-1]))
+
+    restored = memory.StepBaseReplayBuffer(shapes, buffer_size)
+    start = time.perf_counter()
+    restored.load_snapshot(snapshot_dir, manifest)
+    results["load_snapshot"] = time.perf_counter() - start
+    start = time.perf_counter()
+    dumped = dict(np.load(dump_file))
+    results["load_dump"] = time.perf_counter() - start
+    assert restored.current_size == buffer.current_size
+    assert restored._pointer == buffer._pointer
+    for k, v in buffer.buffers.items():
+      assert np.array_equal(restored.buffers[k], v)
+      assert np.array_equal(dumped[k], v[:buffer.current_size])
+    results["snapshot_bytes"] = sum(
+        osp.getsize(osp.join(snapshot_dir, f))
+        for f in os.listdir(snapshot_dir))
+
+  print("mean per epoch: dump {:.3f}s, snapshot {:.3f}s".format(
+      np.mean(results["dump"]), np.mean(results["snapshot"])))
+  print("restore: dump {:.3f}s, snapshot {:.3f}s".format(
+      results["load_dump"], results["load_snapshot"]))
+  with open(output, "w") as f:
+    json.dump(
+        dict(machine=machine_info(),
+             config=dict(obs_dim=obs_dim,
+                         action_dim=action_dim,
+                         buffer_size=buffer_size,
+                         epoch_size=epoch_size,
+                         num_epochs=num_epochs),
+             results=results), f, indent=2)
+  return 0
+
+
+if __name__ == "__main__":
+  parser = argparse.ArgumentParser(
+      description=__doc__, formatter_class=argparse.RawTextHelpFormatter)
+  parser.add_argument("--obs_dim", type=int, default=17)
+  parser.add_argument("--action_dim", type=int, default=6)
+  parser.add_argument("--buffer_size", type=int, default=int(1e6))
+  parser.add_argument("--epoch_size",
+                      help="transitions stored between snapshots",
+                      type=int,
+                      default=int(1e4))
+  parser.add_argument("--num_epochs", type=int, default=5)
+  parser.add_argument("--output", type=str, default="buffer_snapshot.json")
+  args = parser.parse_args()
+  sys.exit(
+      main(args.obs_dim, args.action_dim, args.buffer_size, args.epoch_size,
+           args.num_epochs, args.output))
@@ -0,0 +1,134 @@
+"""Measures how the cost of a critic update grows with the number of critics,
+for the stacked ensemble (sac_networks.EnsembleCriticQ) and for one CriticQ
+model per critic. A critic update is a forward pass of all critics, the min
+over a random subset of target critics and a gradient step.
+
+  python benchmarks/critic_ensemble.py --num_critics 2 5 10
+"""
+import argparse
+import json
+import sys
+
+import numpy as np
+import tensorflow as tf
+
+from rlfd.agents import sac_networks
+
+from throughput import machine_info, throughput
+
+
+def separate_step(critics, targets, optimizer, num_target_critics):
+  weights = [w for c in critics for w in c.trainable_weights]
+
+  @tf.function
+  def step(o, u, target):
+    indices = tf.random.shuffle(tf.range(len(targets)))[:num_target_critics]
+    next_q = tf.reduce_min(tf.gather(tf.stack([t([o, u]) for t in targets]),
+                                     indices),
+                           axis=0)
+    target = tf.stop_gradient(target + next_q)
+    with tf.GradientTape() as tape:
+      loss = tf.add_n(
+          [tf.reduce_mean(tf.square(c([o, u]) - target)) for c in critics])
+    optimizer.apply_gradients(zip(tape.gradient(loss, weights), weights))
+
+  return step
+
+
+def stacked_step(critic, target_critic, optimizer, num_target_critics):
+
+  @tf.function
+  def step(o, u, target):
+    next_q = target_critic.subset_min([o, u], num_target_critics)
+    target = tf.stop_gradient(target + next_q)
+    with tf.GradientTape() as tape:
+      loss = tf.reduce_sum(
+          tf.reduce_mean(tf.square(critic([o, u]) - target), axis=[1, 2]))
+    weights = critic.trainable_weights
+    optimizer.apply_gradients(zip(tape.gradient(loss, weights), weights))
+
+  return step
+
+
+def main(obs_dim, action_dim, batch_size, layer_sizes, num_critics_list,
+         num_target_critics, num_iters, output):
+  tf.random.set_seed(0)
+  np.random.seed(0)
+  dimo, dimu = (obs_dim,), (action_dim,)
+  o = tf.random.normal((batch_size, obs_dim))
+  u = tf.random.uniform((batch_size, action_dim), -1.0, 1.0)
+  r = tf.random.normal((batch_size, 1))
+
+  results = dict(stacked=dict(), separate=dict())
+  for num_critics in num_critics_list:
+    num_targets = min(num_target_critics, num_critics)
+    critic = sac_networks.EnsembleCriticQ(num_critics, dimo, dimu, 1.0,
+                                          layer_sizes)
+    target_critic = sac_networks.EnsembleCriticQ(num_critics, dimo, dimu, 1.0,
+                                                 layer_sizes)
+    step = stacked_step(critic, target_critic, tf.keras.optimizers.Adam(),
+                        num_targets)
+    results["stacked"][num_critics] = throughput(lambda: step(o, u, r),
+                                                 num_iters)
+
+    critics = [
+        sac_networks.CriticQ(dimo, dimu, 1.0, layer_sizes)
+        for _ in range(num_critics)
+    ]
+    targets = [
+        sac_networks.CriticQ(dimo, dimu, 1.0, layer_sizes)
+        for _ in range(num_critics)
+    ]
+    step = separate_step(critics, targets, tf.keras.optimizers.Adam(),
+                         num_targets)
+    results["separate"][num_critics] = throughput(lambda: step(o, u, r),
+                                                  num_iters)
+    print("{:>3} critics: stacked {:9.1f}/s, separate {:9.1f}/s".format(
+        num_critics, results["stacked"][num_critics]["per_sec"],
+        results["separate"][num_critics]["per_sec"]))
+
+  # Wall clock time of an update relative to the smallest ensemble
+  base = num_critics_list[0]
+  for name, entries in results.items():
+    for num_critics, entry in entries.items():
+      entry["relative_time"] = entries[base]["per_sec"] / entry["per_sec"]
+  for num_critics in num_critics_list:
+    print("{:>3} critics: relative time stacked {:5.2f}, separate {:5.2f}".
+          format(num_critics, results["stacked"][num_critics]["relative_time"],
+                 results["separate"][num_critics]["relative_time"]))
+
+  results = dict(machine=machine_info(),
+                 config=dict(obs_dim=obs_dim,
+                             action_dim=action_dim,
+                             batch_size=batch_size,
+                             layer_sizes=layer_sizes,
+                             num_target_critics=num_target_critics,
+                             num_iters=num_iters),
+                 results=results)
+  with open(output, "w") as f:
+    json.dump(results, f, indent=2)
+  return 0
+
+
+if __name__ == "__main__":
+  parser = argparse.ArgumentParser(
+      description=__doc__, formatter_class=argparse.RawTextHelpFormatter)
+  parser.add_argument("--obs_dim", type=int, default=17)
+  parser.add_argument("--action_dim", type=int, default=6)
+  parser.add_argument("--batch_size", type=int, default=256)
+  parser.add_argument("--layer_sizes", type=int, nargs="+", default=[256, 256])
+  parser.add_argument("--num_critics",
+                      type=int,
+                      nargs="+",
+                      default=[2, 4, 6, 8, 10])
+  parser.add_argument("--num_target_critics",
+                      help="size of the random subset of target critics",
+                      type=int,
+                      default=2)
+  parser.add_argument("--num_iters", type=int, default=500)
+  parser.add_argument("--output", type=str, default="critic_ensemble.json")
+  args = parser.parse_args()
+  sys.exit(
+      main(args.obs_dim, args.action_dim, args.batch_size, args.layer_sizes,
+           args.num_critics, args.num_target_critics, args.num_iters,
+           args.output))
@@ -0,0 +1,131 @@
+"""Measures the latency of RobotEnv.step and of the observation alone in the
+Fetch environments of gym_rlfd, with FetchEnv._get_obs (cached ids, state
+filled in place) and with the previous implementation (name lookups, batched
+mat2euler, concatenate and copies), kept below as a reference. Observations of
+both are checked to be equal. Needs MuJoCo.
+
+  python benchmarks/fetch_step.py --num_steps 2000
+"""
+import argparse
+import json
+import sys
+import time
+
+import numpy as np
+import gym
+import gym_rlfd
+from gym.envs.robotics import rotations, utils
+
+from throughput import machine_info
+
+ENVS = ("YWFetchPegInHole-v0", "YWFetchPickAndPlaceRandInit-v0")
+
+
+def reference_get_obs(env):
+  """FetchEnv._get_obs before ids were cached, for both Fetch modules."""
+  sim = env.sim
+  grip_pos = sim.data.get_site_xpos("robot0:grip")
+  dt = sim.nsubsteps * sim.model.opt.timestep
+  grip_velp = sim.data.get_site_xvelp("robot0:grip") * dt
+  robot_qpos, robot_qvel = utils.robot_get_obs(sim)
+  if not hasattr(env, "has_object"):  # peg in hole
+    state = np.concatenate([grip_pos, grip_velp])
+    achieved_goal = grip_pos.copy()
+  else:
+    if env.has_object:
+      object_pos = sim.data.get_site_xpos("object0")
+      object_rot = rotations.mat2euler(sim.data.get_site_xmat("object0"))
+      object_velp = sim.data.get_site_xvelp("object0") * dt
+      object_velr = sim.data.get_site_xvelr("object0") * dt
+      object_rel_pos = object_pos - grip_pos
+      object_velp -= grip_velp
+    else:
+      object_pos = object_rot = object_velp = object_velr = object_rel_pos = (
+          np.zeros(0))
+    gripper_state = robot_qpos[-2:]
+    gripper_vel = robot_qvel[-2:] * dt
+    if not env.has_object:
+      achieved_goal = grip_pos.copy()
+    else:
+      achieved_goal = np.squeeze(object_pos.copy())
+    state = np.concatenate([
+        grip_pos,
+        grip_velp,
+        gripper_state,
+        gripper_vel,
+        object_pos.ravel(),
+        object_rel_pos.ravel(),
+        object_rot.ravel(),
+        object_velp.ravel(),
+        object_velr.ravel(),
+    ])
+  return {
+      "observation": state.copy(),
+      "achieved_goal": np.zeros((0,)),
+      "desired_goal": np.zeros((0,)),
+      "_state": state.copy(),
+      "_achieved_goal": achieved_goal.copy(),
+      "_desired_goal": env.goal.copy(),
+  }
+
+
+def _time_steps(env, actions, get_obs):
+  env._get_obs = get_obs
+  env.seed(0)
+  env.reset()
+  start = time.perf_counter()
+  for action in actions:
+    env.step(action)
+  step = (time.perf_counter() - start) / len(actions)
+  start = time.perf_counter()
+  for _ in actions:
+    get_obs()
+  obs = (time.perf_counter() - start) / len(actions)
+  return step, obs
+
+
+def main(num_steps, output):
+  results = {}
+  for env_id in ENVS:
+    env = gym.make(env_id).unwrapped
+    actions = np.random.RandomState(0).uniform(
+        -1.0, 1.0, size=(num_steps,) + env.action_space.shape)
+
+    # same observations after every step
+    env.seed(0)
+    env.reset()
+    for action in actions[:100]:
+      obs = env.step(action)[0]
+      expected = reference_get_obs(env)
+      for k, v in expected.items():
+        assert np.allclose(obs[k], v), (env_id, k)
+
+    get_obs = env._get_obs
+    reference = lambda: reference_get_obs(env)
+    step, obs = _time_steps(env, actions, get_obs)
+    reference_step, reference_obs = _time_steps(env, actions, reference)
+    env._get_obs = get_obs
+    results[env_id] = dict(step_us=step * 1e6,
+                           obs_us=obs * 1e6,
+                           reference_step_us=reference_step * 1e6,
+                           reference_obs_us=reference_obs * 1e6)
+    print("{}: step {:.1f}us (was {:.1f}us), _get_obs {:.1f}us (was {:.1f}us)".
+          format(env_id, step * 1e6, reference_step * 1e6, obs * 1e6,
+                 reference_obs * 1e6))
+
+  with open(output, "w") as f:
+    json.dump(dict(machine=machine_info(),
+                   config=dict(num_steps=num_steps),
+                   results=results),
+              f,
+              indent=2)
+  return 0
+
+
+if __name__ == "__main__":
+  parser = argparse.ArgumentParser(
+      description=__doc__, formatter_class=argparse.RawTextHelpFormatter)
+  parser.add_argument("--num_steps", type=int, default=2000)
+  parser.add_argument("--output", type=str, default="fetch_step.json")
+  args = parser.parse_args()
+  sys.exit(main(args.num_steps, args.output))
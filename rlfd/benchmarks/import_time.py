@@ -0,0 +1,78 @@
+"""Checks the startup cost of the launcher and its targets.
+
+Every module is imported in a fresh interpreter with `python -X importtime`.
+The script prints the total import time and the slowest dependencies per
+module and exits with a non-zero status if a module exceeds its budget or pulls
+in a dependency it should not need.
+
+  python benchmarks/import_time.py [--scale 2.0] [--top 10]
+"""
+import argparse
+import subprocess
+import sys
+
+# module: (budget in seconds, modules that must not be imported)
+BUDGETS = {
+    "rlfd.launch": (0.3, ("mujoco_py", "tensorflow", "ray", "matplotlib")),
+    "rlfd.plot": (4.0, ("mujoco_py", "tensorflow", "ray")),
+    "rlfd.train": (15.0, ()),
+}
+
+
+def import_time(module):
+  """Returns the cumulative import time of module and of each of its
+  dependencies in seconds, and the set of imported top-level packages.
+  """
+  result = subprocess.run([sys.executable, "-X", "importtime", "-c",
+                           "import " + module],
+                          stdout=subprocess.PIPE,
+                          stderr=subprocess.PIPE,
+                          universal_newlines=True)
+  if result.returncode != 0:
+    raise RuntimeError("Failed to import {}:\n{}".format(
+        module, result.stderr))
+  times = {}
+  for line in result.stderr.splitlines():
+    if not line.startswith("import time:") or "|" not in line:
+      continue
+    _, cumulative, name = line[len("import time:"):].split("|")
+    if not cumulative.strip().isdigit():  # header
+      continue
+    times[name.strip()] = int(cumulative) * 1e-6
+  packages = {name.split(".")[0] for name in times.keys()}
+  return times, packages
+
+
+def main(scale, top):
+  failed = False
+  for module, (budget, forbidden) in BUDGETS.items():
+    times, packages = import_time(module)
+    total = times[module]
+    print("{:<16} {:7.3f}s (budget {:.3f}s)".format(module, total,
+                                                    budget * scale))
+    deps = sorted(((t, k) for k, t in times.items() if k != module),
+                  reverse=True)
+    for t, k in deps[:top]:
+      print("  {:<40} {:7.3f}s".format(k, t))
+    if total > budget * scale:
+      print("  -> over budget")
+      failed = True
+    for k in forbidden:
+      if k in packages:
+        print("  -> imports {}".format(k))
+        failed = True
+  return 1 if failed else 0
+
+
+if __name__ == "__main__":
+  parser = argparse.ArgumentParser(description=__doc__)
+  parser.add_argument("--scale",
+                      help="multiply all budgets, e.g. for slow machines",
+                      type=float,
+                      default=1.0)
+  parser.add_argument("--top",
+                      help="number of slowest dependencies to show",
+                      type=int,
+                      default=10)
+  args = parser.parse_args()
+  sys.exit(main(args.scale, args.top))
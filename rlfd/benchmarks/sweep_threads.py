@@ -0,0 +1,133 @@
+"""Measures the aggregate training throughput of a node running a sweep, i.e.
+num_trials concurrent processes each training an agent on the synthetic
+environment, with the thread pools of every trial:
+
+  - default: sized to the whole machine (the behavior without cpus_per_trial)
+  - budgeted: limited to cpus_per_trial (util.configure_cpu_threads)
+  - pinned: limited to cpus_per_trial and pinned to their own cores
+
+  python benchmarks/sweep_threads.py --algo SAC --cpus_per_trial 1
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import sys
+import tempfile
+import time
+
+
+def _trial(algo, mode, cpus_per_trial, duration, barrier, queue):
+  from rlfd.utils import util
+  if mode != "default":
+    util.configure_cpu_threads(cpus_per_trial, pin=mode == "pinned")
+
+  import numpy as np
+  import tensorflow as tf
+  import gym_rlfd.synthetic
+
+  from rlfd import agents, drivers, train
+
+  from throughput import default_params
+
+  tf.random.set_seed(0)
+  np.random.seed(0)
+  env_id = gym_rlfd.synthetic.register_synthetic(17, 6, 1000, 10000)
+  config = default_params()[algo]
+  config.update(env_name=env_id, env_args={}, fix_T=False)
+  config["agent"]["buffer_size"] = int(1e5)
+  make_env, env_params = train.get_env_constructor_and_config(config)
+  agent = agents.AGENTS[algo](**config["agent"], **env_params)
+  with tempfile.TemporaryDirectory() as data_dir:
+    agent.before_training_hook(data_dir=data_dir, env=make_env())
+  driver = drivers.StepBasedDriver(make_env=make_env,
+                                   policy=agent.expl_policy,
+                                   num_steps=1000)
+  driver.seed(0)
+  agent.store_experiences(driver.generate_rollouts())
+  if config["num_epochs"] > 0:
+    agent.before_online_hook()
+    train_step = agent.train_online
+  else:
+    agent.before_offline_hook()
+    train_step = agent.train_offline
+  for _ in range(20):  # trace the graphs
+    train_step()
+
+  # all trials are timed together
+  barrier.wait()
+  num_steps = 0
+  start = time.perf_counter()
+  while time.perf_counter() - start < duration:
+    train_step()
+    num_steps += 1
+  queue.put(num_steps / (time.perf_counter() - start))
+
+
+def run_sweep(algo, mode, num_trials, cpus_per_trial, duration):
+  ctx = multiprocessing.get_context("spawn")
+  barrier = ctx.Barrier(num_trials)
+  queue = ctx.Queue()
+  processes = [
+      ctx.Process(target=_trial,
+                  args=(algo, mode, cpus_per_trial, duration, barrier, queue))
+      for _ in range(num_trials)
+  ]
+  for p in processes:
+    p.start()
+  steps_per_sec = [queue.get() for _ in processes]
+  for p in processes:
+    p.join()
+  return dict(num_trials=num_trials,
+              aggregate_per_sec=sum(steps_per_sec),
+              trial_per_sec=steps_per_sec)
+
+
+def main(algo, cpus_per_trial, num_trials, duration, modes, output):
+  num_trials = num_trials or max(os.cpu_count() // cpus_per_trial, 1)
+  results = {}
+  for mode in modes:
+    print("{}: {} trials".format(mode, num_trials))
+    results[mode] = run_sweep(algo, mode, num_trials, cpus_per_trial,
+                              duration)
+  print("{:<10} {:>16} {:>16} {:>8}".format("mode", "steps/s (node)",
+                                             "steps/s (trial)", "ratio"))
+  base = results[modes[0]]["aggregate_per_sec"]
+  for mode, result in results.items():
+    print("{:<10} {:16.1f} {:16.1f} {:7.2f}x".format(
+        mode, result["aggregate_per_sec"],
+        result["aggregate_per_sec"] / num_trials,
+        result["aggregate_per_sec"] / base))
+  with open(output, "w") as f:
+    json.dump(
+        dict(config=dict(algo=algo,
+                         cpus_per_trial=cpus_per_trial,
+                         num_trials=num_trials,
+                         duration=duration,
+                         cpu_count=os.cpu_count()),
+             results=results), f, indent=2)
+  return 0
+
+
+if __name__ == "__main__":
+  parser = argparse.ArgumentParser(
+      description=__doc__, formatter_class=argparse.RawTextHelpFormatter)
+  parser.add_argument("--algo", type=str, default="SAC")
+  parser.add_argument("--cpus_per_trial", type=int, default=1)
+  parser.add_argument("--num_trials",
+                      help="concurrent trials, defaults to cpus/cpus_per_trial",
+                      type=int,
+                      default=None)
+  parser.add_argument("--duration",
+                      help="seconds of training timed in every trial",
+                      type=float,
+                      default=30.0)
+  parser.add_argument("--modes",
+                      nargs="+",
+                      choices=["default", "budgeted", "pinned"],
+                      default=["default", "budgeted", "pinned"])
+  parser.add_argument("--output", type=str, default="sweep_threads.json")
+  args = parser.parse_args()
+  sys.exit(
+      main(args.algo, args.cpus_per_trial, args.num_trials, args.duration,
+           args.modes, args.output))
@@ -0,0 +1,306 @@
+"""Measures the throughput of the training building blocks on a synthetic,
+MuJoCo free environment (gym_rlfd.synthetic) so that releases can be compared
+on any CPU only machine:
+
+  - replay buffer store, random sample and iterator (transitions/sec)
+  - driver with a random policy (env steps/sec)
+  - train_online/train_offline of every agent in rlfd.agents.AGENTS, with the
+    default parameters of its rlfd.params module (steps/sec)
+  - shaping training (steps/sec) and potential evaluation (evals/sec)
+
+With --xla, agents and shapings are also measured with their training graphs
+compiled by XLA (jit_compile) and a table of both is printed.
+
+Results are written as json together with information about the machine.
+
+  python benchmarks/throughput.py --output throughput.json
+  python benchmarks/throughput.py --output new.json --compare old.json
+  python benchmarks/throughput.py --xla --algos TD3 SAC CQL
+"""
+import argparse
+import copy
+import datetime
+import importlib
+import json
+import os
+import pkgutil
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+osp = os.path
+
+import numpy as np
+import tensorflow as tf
+import gym_rlfd.synthetic
+
+from rlfd import agents, drivers, memory, params, policies, shapings, train
+from rlfd.params import shaping as shaping_params
+
+
+def throughput(fn, num_iters, warmup=10, items_per_iter=1):
+  """Calls fn warmup times then times num_iters calls."""
+  for _ in range(warmup):
+    fn()
+  start = time.perf_counter()
+  for _ in range(num_iters):
+    fn()
+  seconds = time.perf_counter() - start
+  return dict(iters=num_iters,
+              seconds=seconds,
+              per_sec=num_iters * items_per_iter / seconds)
+
+
+def machine_info():
+  try:
+    commit = subprocess.run(["git", "rev-parse", "HEAD"],
+                            cwd=osp.dirname(osp.abspath(__file__)),
+                            stdout=subprocess.PIPE,
+                            stderr=subprocess.DEVNULL,
+                            universal_newlines=True).stdout.strip()
+  except OSError:
+    commit = None
+  return dict(time=datetime.datetime.now().isoformat(),
+              commit=commit,
+              platform=platform.platform(),
+              processor=platform.processor(),
+              cpu_count=os.cpu_count(),
+              python=platform.python_version(),
+              numpy=np.__version__,
+              tensorflow=tf.__version__,
+              devices=[d.name for d in tf.config.list_logical_devices()])
+
+
+def default_params():
+  """Returns {algo: default_params} of all modules in rlfd.params."""
+  algo_params = {}
+  for module_info in pkgutil.iter_modules(params.__path__):
+    module = importlib.import_module("rlfd.params." + module_info.name)
+    if hasattr(module, "default_params"):
+      algo_params[module.default_params["algo"]] = module.default_params
+  return algo_params
+
+
+def random_transitions(dimo, dimu, size):
+  return dict(o=np.random.randn(size, *dimo).astype(np.float32),
+              o_2=np.random.randn(size, *dimo).astype(np.float32),
+              u=np.random.uniform(-1, 1, (size, *dimu)).astype(np.float32),
+              r=np.random.randn(size, 1).astype(np.float32),
+              done=np.zeros((size, 1), dtype=np.float32))
+
+
+def bench_memory(dims, batch_size, num_iters):
+  size = 100000
+  shapes = dict(o=dims["o"], o_2=dims["o"], u=dims["u"], r=(1,), done=(1,))
+  data = random_transitions(dims["o"], dims["u"], size)
+  buffer = memory.StepBaseReplayBuffer(shapes, size)
+  chunk = {k: v[:1000] for k, v in data.items()}
+  results = {}
+  results["store"] = throughput(lambda: buffer.store(chunk),
+                                num_iters,
+                                items_per_iter=1000)
+  buffer.store(data)
+  results["sample"] = throughput(lambda: buffer.sample(batch_size),
+                                 num_iters,
+                                 items_per_iter=batch_size)
+
+  def iterate():
+    dataset_iter = buffer.sample(return_iterator=True,
+                                 shuffle=True,
+                                 include_partial_batch=True)
+    dataset_iter(batch_size)
+    for _ in dataset_iter:
+      pass
+
+  results["iterator"] = throughput(iterate,
+                                   max(num_iters // 100, 1),
+                                   warmup=1,
+                                   items_per_iter=size)
+  return results
+
+
+def bench_driver(make_env, env_params, num_iters):
+  driver = drivers.StepBasedDriver(
+      make_env=make_env,
+      policy=policies.RandomPolicy(env_params["dims"]["o"],
+                                   env_params["dims"]["u"],
+                                   env_params["max_u"]),
+      num_steps=100)
+  driver.seed(0)
+  return dict(random_policy=throughput(driver.generate_rollouts,
+                                       max(num_iters // 100, 1),
+                                       warmup=1,
+                                       items_per_iter=100))
+
+
+def bench_agent(algo, algo_params, env_id, num_iters, data_dir,
+                jit_compile=False):
+  config = copy.deepcopy(algo_params)
+  config.update(env_name=env_id, env_args={}, fix_T=False)
+  config["agent"]["buffer_size"] = int(1e5)
+  config["agent"]["jit_compile"] = jit_compile
+  make_env, env_params = train.get_env_constructor_and_config(config)
+  agent = agents.AGENTS[algo](**config["agent"], **env_params)
+  agent.before_training_hook(data_dir=data_dir, env=make_env())
+
+  results = {}
+  if config["offline_num_epochs"] > 0:
+    agent.before_offline_hook()
+    results["train_offline"] = throughput(agent.train_offline, num_iters)
+  if config["num_epochs"] > 0:
+    agent.before_online_hook()
+    driver = drivers.StepBasedDriver(make_env=make_env,
+                                     policy=agent.expl_policy,
+                                     num_steps=1000)
+    driver.seed(0)
+    agent.store_experiences(driver.generate_rollouts())
+    results["train_online"] = throughput(agent.train_online, num_iters)
+    o = make_env().reset()
+    results["expl_policy"] = throughput(lambda: agent.expl_policy(o),
+                                        num_iters)
+  return results
+
+
+def bench_shaping(config, dims, max_u, num_iters, jit_compile=False):
+  config = dict(config, jit_compile=jit_compile)
+  shaping = shapings.SHAPINGS[config["shaping_type"]](dims=dims,
+                                                      max_u=max_u,
+                                                      **config)
+  batch_size = config["batch_size"]
+  batch = random_transitions(dims["o"], dims["u"], batch_size)
+  shaping.before_training_hook(batch=batch)
+  o = tf.convert_to_tensor(batch["o"])
+  u = tf.convert_to_tensor(batch["u"])
+  return dict(train=throughput(lambda: shaping.train(**batch), num_iters),
+              potential=throughput(
+                  lambda: shaping.potential(o=o, u=u).numpy(),
+                  num_iters,
+                  items_per_iter=batch_size))
+
+
+def compare(results, baseline):
+  """Prints the ratio of every throughput to the one of the baseline."""
+  for group, entries in results["results"].items():
+    for name, entry in entries.items():
+      for metric, value in entry.items():
+        try:
+          old = baseline["results"][group][name][metric]["per_sec"]
+        except KeyError:
+          continue
+        print("{:<40} {:7.2f}x".format(
+            "/".join((group, name, metric)), value["per_sec"] / old))
+
+
+def xla_table(results):
+  """Prints the training throughput of agents and shapings without and with
+  XLA.
+  """
+  print("{:<40} {:>12} {:>12} {:>8}".format("", "steps/s", "xla steps/s",
+                                             "speedup"))
+  for group in ("agent", "shaping"):
+    for name, entry in results[group].items():
+      for metric, value in entry.items():
+        xla_value = results[group + "_xla"].get(name, {}).get(metric)
+        if not metric.startswith("train") or xla_value is None:
+          continue
+        print("{:<40} {:12.1f} {:12.1f} {:7.2f}x".format(
+            "/".join((group, name, metric)), value["per_sec"],
+            xla_value["per_sec"], xla_value["per_sec"] / value["per_sec"]))
+
+
+def main(obs_dim, action_dim, eps_length, dataset_size, num_iters, algos,
+         output, baseline, xla):
+  tf.random.set_seed(0)
+  np.random.seed(0)
+  env_id = gym_rlfd.synthetic.register_synthetic(obs_dim, action_dim,
+                                                 eps_length, dataset_size)
+  make_env, env_params = train.get_env_constructor_and_config(
+      dict(env_name=env_id, env_args={}, r_scale=1.0, r_shift=0.0,
+           fix_T=False))
+  dims, max_u = env_params["dims"], env_params["max_u"]
+  algo_params = default_params()
+  algos = algos or sorted(agents.AGENTS.keys())
+
+  results = dict(memory=dict(), driver=dict(), agent=dict(), shaping=dict())
+  if xla:
+    results.update(agent_xla=dict(), shaping_xla=dict())
+  print("memory")
+  results["memory"]["StepBaseReplayBuffer"] = bench_memory(
+      dims, 256, num_iters)
+  print("driver")
+  results["driver"]["StepBasedDriver"] = bench_driver(make_env, env_params,
+                                                      num_iters)
+  with tempfile.TemporaryDirectory() as data_dir:
+    for algo in algos:
+      if algo not in algo_params:
+        print("{}: no default parameters, skipped".format(algo))
+        continue
+      print(algo)
+      results["agent"][algo] = bench_agent(algo, algo_params[algo], env_id,
+                                           num_iters, data_dir)
+      if xla:
+        results["agent_xla"][algo] = bench_agent(algo,
+                                                 algo_params[algo],
+                                                 env_id,
+                                                 num_iters,
+                                                 data_dir,
+                                                 jit_compile=True)
+  for name in ("gan_params", "nf_params"):
+    config = getattr(shaping_params, name)
+    print(config["shaping_type"])
+    results["shaping"][config["shaping_type"]] = bench_shaping(
+        config, dims, max_u, num_iters)
+    if xla:
+      results["shaping_xla"][config["shaping_type"]] = bench_shaping(
+          config, dims, max_u, num_iters, jit_compile=True)
+
+  results = dict(machine=machine_info(),
+                 config=dict(obs_dim=obs_dim,
+                             action_dim=action_dim,
+                             eps_length=eps_length,
+                             dataset_size=dataset_size,
+                             num_iters=num_iters),
+                 results=results)
+  with open(output, "w") as f:
+    json.dump(results, f, indent=2)
+  for group, entries in results["results"].items():
+    for name, entry in entries.items():
+      for metric, value in entry.items():
+        print("{:<40} {:12.1f}/s".format("/".join((group, name, metric)),
+                                         value["per_sec"]))
+  if xla:
+    xla_table(results["results"])
+  if baseline:
+    with open(baseline, "r") as f:
+      compare(results, json.load(f))
+  return 0
+
+
+if __name__ == "__main__":
+  parser = argparse.ArgumentParser(
+      description=__doc__, formatter_class=argparse.RawTextHelpFormatter)
+  parser.add_argument("--obs_dim", type=int, default=17)
+  parser.add_argument("--action_dim", type=int, default=6)
+  parser.add_argument("--eps_length", type=int, default=1000)
+  parser.add_argument("--dataset_size", type=int, default=10000)
+  parser.add_argument("--num_iters",
+                      help="number of timed calls per measurement",
+                      type=int,
+                      default=1000)
+  parser.add_argument("--algos",
+                      help="agents to benchmark, defaults to all",
+                      nargs="*",
+                      default=None)
+  parser.add_argument("--output", type=str, default="throughput.json")
+  parser.add_argument("--compare",
+                      help="results of a previous run to compare against",
+                      type=str,
+                      default=None)
+  parser.add_argument("--xla",
+                      help="also measure agents and shapings with XLA",
+                      action="store_true")
+  args = parser.parse_args()
+  sys.exit(
+      main(args.obs_dim, args.action_dim, args.eps_length, args.dataset_size,
+           args.num_iters, args.algos, args.output, args.compare, args.xla))
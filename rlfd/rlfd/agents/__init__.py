@@ -1,4 +1,4 @@
 # Import modules with agent class defined
 from . import td3, sac, cql, cql_dp, bc, cql_online, sac_offline
 from . import gan, nf
-from .agent import AGENTS
+from .agent import AGENTS, load_policy
@@ -1,12 +1,92 @@
 import abc
+import collections
+from concurrent import futures
+import copyreg
 import os
 import pickle
 osp = os.path
 
 import tensorflow as tf
 
+from rlfd import metrics, profiler
+from rlfd.utils import artifact_util, tf_util
+
 AGENTS = {}
 
+# Objects referred to by policy pickles (see Agent.save), by the file they
+# were loaded from and its modification time and size, the last few loaded.
+_REFERENCED = collections.OrderedDict()
+_MAX_REFERENCED = 8
+# Directory of the policy being loaded by load_policy.
+_LOAD_DIR = None
+
+
+def load_policy(path):
+  """Unpickles a policy written by Agent.save. Objects it refers to (e.g. the
+  shaping) are looked up relative to path if they are no longer where they were
+  when it was saved, e.g. after copying the experiment directory to another
+  machine. Policies loaded from the same unchanged file of a referred object
+  share one instance of it.
+  """
+  global _LOAD_DIR
+  _LOAD_DIR = osp.dirname(osp.abspath(path))
+  try:
+    with open(artifact_util.resolve(path), "rb") as f:
+      return pickle.load(f)
+  finally:
+    _LOAD_DIR = None
+
+
+def _load_referenced(path, relpath):
+  load_path = artifact_util.resolve(path)
+  if not osp.isfile(load_path) and _LOAD_DIR is not None:
+    load_path = artifact_util.resolve(osp.join(_LOAD_DIR, relpath))
+  if not osp.isfile(load_path):
+    raise IOError("{} referred to by the policy does not exist.".format(path))
+  stat = os.stat(load_path)
+  key = (osp.realpath(load_path), stat.st_mtime_ns, stat.st_size)
+  if not key in _REFERENCED:
+    with open(load_path, "rb") as f:
+      _REFERENCED[key] = pickle.load(f)
+    while len(_REFERENCED) > _MAX_REFERENCED:
+      _REFERENCED.popitem(last=False)
+  _REFERENCED.move_to_end(key)
+  return _REFERENCED[key]
+
+
+class _Reference(object):
+  """Pickled in place of an object saved in its own file, unpickled as the
+  object loaded from that file.
+  """
+
+  def __init__(self, path, policy_dir):
+    self._path = osp.abspath(path)
+    self._relpath = osp.relpath(self._path, osp.abspath(policy_dir))
+
+  def __reduce__(self):
+    return (_load_referenced, (self._path, self._relpath))
+
+
+class _Snapshot(object):
+  """Pickled as an instance of cls with state, i.e. as the agent state was when
+  the snapshot was taken.
+  """
+
+  def __init__(self, cls, state):
+    self._cls = cls
+    self._state = state
+
+  def __reduce__(self):
+    return (copyreg.__newobj__, (self._cls,), self._state)
+
+
+def _write_pickle(obj, path):
+  # write and rename, the file is never seen partially written
+  tmp = "{}.tmp-{}".format(path, os.getpid())
+  with open(tmp, "wb") as f:
+    pickle.dump(obj, f)
+  os.replace(tmp, path)
+
 
 class Agent(tf.Module, metaclass=abc.ABCMeta):
   """Defines the general interface of an agent, registers subclasses and
@@ -27,6 +107,13 @@ class Agent(tf.Module, metaclass=abc.ABCMeta):
     self._tf_ckpt = tf.train.Checkpoint(agent=self)
     self._tf_ckpt_manager = None
     self._tf_ckpt_dir = None
+    # Policies are pickled in the background, one at a time and in order.
+    # (a deque, not a list, which tf.Module would track)
+    self._save_executor = futures.ThreadPoolExecutor(max_workers=1)
+    self._pending_saves = collections.deque()
+    # Training statistics, updated in graph and flushed to summaries.
+    self._online_stats = metrics.ScalarAccumulator("OnlineLosses/")
+    self._offline_stats = metrics.ScalarAccumulator("OfflineLosses/")
 
   @property
   @abc.abstractmethod
@@ -62,6 +149,42 @@ class Agent(tf.Module, metaclass=abc.ABCMeta):
   def store_experiences(self, experiences):
     """Stores online experiences"""
 
+  def _load_offline_data(self, data_dir, env, offline_dataset=None):
+    """Fills the offline buffer with offline_dataset if given, without copying
+    it (see train.load_offline_dataset), otherwise with the D4RL dataset of env
+    or the demonstrations in data_dir. Returns the experiences, None if there
+    is no offline data.
+    """
+    if offline_dataset is not None:
+      self.offline_buffer.load_shared(offline_dataset)
+      return offline_dataset
+    # D4RL
+    experiences = env.get_dataset()  # T not fixed by assumption
+    if experiences:
+      self.offline_buffer.store(experiences)
+      return experiences
+    # Ours
+    demo_file = artifact_util.resolve(osp.join(data_dir, "demo_data.npz"))
+    if osp.isfile(demo_file):
+      return self.offline_buffer.load_from_file(data_file=demo_file)
+    return None
+
+  def set_hyperparameters(self, **hyperparameters):
+    """Changes hyperparameters of the agent between training steps, e.g. for
+    population based training (see pbt.py). Graphs read the new values without
+    being retraced and pickles keep them. Raises ValueError for hyperparameters
+    the agent cannot change.
+    """
+    if hyperparameters:
+      raise ValueError("{} cannot change hyperparameters {}.".format(
+          type(self).__name__, sorted(hyperparameters.keys())))
+
+  def _set_learning_rate(self, name, learning_rate, *optimizers):
+    setattr(self, name, learning_rate)
+    self._init_args[name] = learning_rate
+    for optimizer in optimizers:
+      optimizer.learning_rate = learning_rate
+
   @staticmethod
   def get_default_params(self):
     """Return default parameters as a dictionary"""
@@ -89,24 +212,89 @@ class Agent(tf.Module, metaclass=abc.ABCMeta):
   def get_saved_model(self, model):
     return self._saved_model[model]
 
+  def has_saved_model(self, model):
+    return model in self._saved_model
+
+  def get_weights(self):
+    """Returns a copy of the weights of all saved vars and models."""
+    return dict(tf_var={k: v.numpy() for k, v in self._saved_var.items()},
+                tf_model={
+                    k: v.get_weights() for k, v in self._saved_model.items()
+                })
+
+  def set_weights(self, weights):
+    """Loads weights returned by get_weights."""
+    for k, v in weights["tf_var"].items():
+      self._saved_var[k].assign(v)
+    for k, v in weights["tf_model"].items():
+      self._saved_model[k].set_weights(v)
+
   def save(self, policy_path, ckpt_path=None):
-    """Pickles the current policy."""
-    with open(policy_path, "wb") as f:
-      pickle.dump(self, f)
+    """Pickles the current policy. Returns the path of the checkpoint written
+    to ckpt_path, if given.
+
+    Only the weights are copied before returning, the policy file is written by
+    a background thread (see wait_for_saves). Attributes saved in their own file
+    (with a saved_path, e.g. the shaping) are pickled as a reference to that
+    file, load such policies with load_policy.
+    """
+    with profiler.phase("pickle"):
+      # raise errors of previous saves
+      while self._pending_saves and self._pending_saves[0].done():
+        self._pending_saves.popleft().result()
+      state = self.__getstate__()
+      for k, v in state.items():
+        if getattr(v, "saved_path", None) is not None:
+          state[k] = _Reference(v.saved_path, osp.dirname(policy_path))
+      self._pending_saves.append(
+          self._save_executor.submit(_write_pickle,
+                                     _Snapshot(type(self), state),
+                                     policy_path))
 
     if ckpt_path == None:
-      return
+      return None
+    return self.save_checkpoint(ckpt_path)
+
+  def wait_for_saves(self):
+    """Blocks until all policies and checkpoints saved so far are written."""
+    while self._pending_saves:
+      self._pending_saves.popleft().result()
+    self.sync_checkpoint()
+
+  def sync_checkpoint(self):
+    """Blocks until the last checkpoint is written, see save_checkpoint."""
+    if hasattr(self._tf_ckpt, "sync"):
+      self._tf_ckpt.sync()
+
+  def save_checkpoint(self, ckpt_path):
+    """Writes a checkpoint of all variables, including optimizer states and
+    training steps, returns its path. The previous checkpoint is kept so that
+    a run state referring to it (see train.Trainer) stays valid until the next
+    one is written.
+
+    Checkpoints are written asynchronously where tensorflow supports it, call
+    sync_checkpoint before relying on the returned checkpoint being complete.
+    """
     if self._tf_ckpt_manager == None or ckpt_path != self._tf_ckpt_dir:
       self._tf_ckpt_manager = tf.train.CheckpointManager(self._tf_ckpt,
                                                          ckpt_path,
-                                                         max_to_keep=1)
-    self._tf_ckpt_manager.save()
+                                                         max_to_keep=2)
+      self._tf_ckpt_dir = ckpt_path
+    with profiler.phase("checkpoint"):
+      options = tf_util.async_checkpoint_options()
+      if options is None:
+        return self._tf_ckpt_manager.save()
+      return self._tf_ckpt_manager.save(options=options)
 
-  def load(self, ckpt_path):
-    """Loads parameters from a checkpoint"""
+  def load(self, ckpt_path, checkpoint=None):
+    """Loads parameters from the latest checkpoint in ckpt_path, or from
+    checkpoint if given.
+    """
     # for var in tf.train.list_variables(tf.train.latest_checkpoint(ckpt_path)):
     #   print("agent-->", var)
-    result = self._tf_ckpt.restore(tf.train.latest_checkpoint(ckpt_path))
+    if checkpoint is None:
+      checkpoint = tf.train.latest_checkpoint(ckpt_path)
+    result = self._tf_ckpt.restore(checkpoint)
     # Some variables may not have been contructed yet, but they should be for
     # plotting only, so no need to worry about.
     result.assert_existing_objects_matched()
@@ -118,18 +306,11 @@ class Agent(tf.Module, metaclass=abc.ABCMeta):
         for k, v in self._init_args.items()
         if not k in ["self", "__class__"]
     }
-    state["tf_var"] = {k: v.numpy() for k, v in self._saved_var.items()}
-    state["tf_model"] = {
-        k: v.get_weights() for k, v in self._saved_model.items()
-    }
+    state.update(self.get_weights())
     return state
 
   def __setstate__(self, state):
     """For pickle. Re-instantiate the class, load weights"""
-    tf_var = state.pop("tf_var")
-    tf_model = state.pop("tf_model")
+    weights = dict(tf_var=state.pop("tf_var"), tf_model=state.pop("tf_model"))
     self.__init__(**state)
-    for k, v in tf_var.items():
-      self._saved_var[k].assign(v)
-    for k, v in tf_model.items():
-      self._saved_model[k].set_weights(v)
\ No newline at end of file
+    self.set_weights(weights)
\ No newline at end of file
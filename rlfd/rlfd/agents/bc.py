@@ -6,8 +6,9 @@ import numpy as np
 import tensorflow as tf
 tfk = tf.keras
 
-from rlfd import memory, normalizer, policies
+from rlfd import memory, normalizer, policies, profiler
 from rlfd.agents import agent, sac_networks
+from rlfd.utils import tf_util
 
 
 class BC(agent.Agent):
@@ -32,7 +33,9 @@ class BC(agent.Agent):
       pi_lr,
       # replay buffer
       buffer_size,
-      info):
+      info,
+      # compile the training graphs with XLA
+      jit_compile=False):
     super().__init__(locals())
 
     self.dims = dims
@@ -54,6 +57,7 @@ class BC(agent.Agent):
     self.norm_clip = norm_clip
 
     self.info = info
+    self.jit_compile = jit_compile
 
     self._create_memory()
     self._create_model()
@@ -137,17 +141,11 @@ class BC(agent.Agent):
                            data_dir=None,
                            env=None,
                            shaping=None,
-                           pretrained_agent=None):
+                           pretrained_agent=None,
+                           offline_dataset=None):
     """Adds data to the offline replay buffer and add shaping"""
     # Offline data
-    # D4RL
-    experiences = env.get_dataset()  # T not fixed by assumption
-    if experiences:
-      self.offline_buffer.store(experiences)
-    # Ours
-    demo_file = osp.join(data_dir, "demo_data.npz")
-    if (not experiences) and osp.isfile(demo_file):
-      experiences = self.offline_buffer.load_from_file(data_file=demo_file)
+    experiences = self._load_offline_data(data_dir, env, offline_dataset)
     if self.norm_obs_offline:
       assert experiences, "Offline dataset does not exist."
       self._update_stats(experiences)
@@ -164,7 +162,7 @@ class BC(agent.Agent):
     o_tf = tf.convert_to_tensor(transitions["o"], dtype=tf.float32)
     self._actor_o_norm.update(o_tf)
 
-  @tf.function
+  @tf_util.compiled_method
   def _train_offline_graph(self, o, u):
     with tf.GradientTape() as tape:
       # pi if using td3_network actor.
@@ -174,23 +172,26 @@ class BC(agent.Agent):
     self._actor_optimizer.apply_gradients(
         zip(actor_grads, self._actor.trainable_weights))
 
-    with tf.name_scope('OfflineLosses/'):
-      tf.summary.scalar(name='bc_loss vs offline_training_step',
-                        data=bc_loss,
-                        step=self.offline_training_step)
+    self._offline_stats.update("bc_loss", bc_loss)
 
     self.offline_training_step.assign_add(1)
 
   def train_offline(self):
-    with tf.summary.record_if(lambda: self.offline_training_step % 200 == 0):
+    with profiler.phase("sample"):
       batch = self.offline_buffer.sample(self.offline_batch_size)
+    with profiler.phase("convert"):
       o_tf = tf.convert_to_tensor(batch["o"], dtype=tf.float32)
       u_tf = tf.convert_to_tensor(batch["u"], dtype=tf.float32)
+    with profiler.phase("graph"):
       self._train_offline_graph(o_tf, u_tf)
+    if self.offline_training_step % 200 == 0:
+      with profiler.phase("summary"):
+        self._offline_stats.flush(self.offline_training_step,
+                                  step_name="offline_training_step")
 
   def store_experiences(self, experiences):
     pass
 
   def train_online(self):
     # No online training
-    self.offline_training_step.assign_add(1)
\ No newline at end of file
+    self.offline_training_step.assign_add(1)
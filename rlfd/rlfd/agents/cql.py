@@ -8,8 +8,9 @@ import tensorflow_probability as tfp
 tfd = tfp.distributions
 tfk = tf.keras
 
-from rlfd import memory, normalizer, policies
+from rlfd import memory, normalizer, policies, profiler
 from rlfd.agents import agent, sac, sac_networks
+from rlfd.utils import tf_util
 
 
 class CQL(sac.SAC):
@@ -57,7 +58,12 @@ class CQL(sac.SAC):
       online_data_strategy,
       # replay buffer
       buffer_size,
-      info):
+      info,
+      # critic ensemble (REDQ when num_target_critics < num_critics)
+      num_critics=2,
+      num_target_critics=2,
+      # compile the training graphs with XLA
+      jit_compile=False):
     agent.Agent.__init__(self, locals())
 
     self.dims = dims
@@ -75,7 +81,7 @@ class CQL(sac.SAC):
     self.buffer_size = buffer_size
 
     self.auto_alpha = auto_alpha
-    self.alpha = tf.constant(alpha, dtype=tf.float32)
+    self.alpha = tf.Variable(alpha, dtype=tf.float32, trainable=False)
     self.alpha_lr = 3e-4
 
     self.auto_cql_alpha = auto_cql_alpha
@@ -91,6 +97,9 @@ class CQL(sac.SAC):
     self.action_l2 = action_l2
     self.soft_target_tau = soft_target_tau
     self.target_update_freq = target_update_freq
+    self.num_critics = num_critics
+    self.num_target_critics = num_target_critics
+    assert 1 <= self.num_target_critics <= self.num_critics
 
     self.norm_obs_online = norm_obs_online
     self.norm_obs_offline = norm_obs_offline
@@ -103,6 +112,7 @@ class CQL(sac.SAC):
     self.online_data_strategy = online_data_strategy
     assert self.online_data_strategy in ["None", "BC", "Shaping"]
     self.info = info
+    self.jit_compile = jit_compile
 
     self._create_memory()
     self._create_model()
@@ -151,7 +161,10 @@ class CQL(sac.SAC):
         get_action=lambda o: self._actor([o], sample=False)[0],
         process_observation=process_observation_eval)
 
-  def _cql_criticq_loss_graph(self, o, o_2, u, r, done, step):
+  def _pi_optimizers(self):
+    return [self._actor_optimizer, self._bc_optimizer]
+
+  def _cql_criticq_loss_graph(self, o, o_2, u, r, done, stats):
     pi_2, logprob_pi_2 = self._actor([self._actor_o_norm(o_2)])
 
     # Immediate reward
@@ -161,24 +174,23 @@ class CQL(sac.SAC):
       potential_curr = self.shaping.potential(o=o, u=u)
       potential_next = self.shaping.potential(o=o_2, u=pi_2)
       target_q += (1.0 - done) * self.gamma * potential_next - potential_curr
+      stats.update("potential", potential_curr)
     # Q value from next state
-    target_next_q1 = self._criticq1_target([self._critic_o_norm(o_2), pi_2])
-    target_next_q2 = self._criticq2_target([self._critic_o_norm(o_2), pi_2])
-    target_next_min_q = tf.minimum(target_next_q1, target_next_q2)
+    target_next_min_q = self._criticq_target.subset_min(
+        [self._critic_o_norm(o_2), pi_2], self.num_target_critics)
     target_q += ((1.0 - done) * self.gamma *
                  (target_next_min_q - self.alpha * logprob_pi_2))
     target_q = tf.stop_gradient(target_q)
 
-    td_loss_q1 = self._huber_loss(target_q,
-                                  self._criticq1([self._critic_o_norm(o), u]))
-    td_loss_q2 = self._huber_loss(target_q,
-                                  self._criticq2([self._critic_o_norm(o), u]))
-    td_loss = td_loss_q1 + td_loss_q2
-    # Being Conservative (Eqn.4)
+    # All critics, of shape [num_critics, batch, 1]
     critic_o = self._critic_o_norm(o)
+    q = self._criticq([critic_o, u])
+    td_loss = tf.reduce_sum(self._huber_loss(
+        tf.broadcast_to(target_q, tf.shape(q)), q),
+                            axis=0)
+    # Being Conservative (Eqn.4)
     # second term
-    max_term_q1 = self._criticq1([critic_o, u])
-    max_term_q2 = self._criticq2([critic_o, u])
+    max_term = q
     # first term (uniform)
     num_samples = 10
     tiled_critic_o = tf.tile(tf.expand_dims(critic_o, axis=1),
@@ -189,44 +201,34 @@ class CQL(sac.SAC):
     logprob_uni_u = tf.reduce_sum(uni_u_dist.log_prob(uni_u),
                                   axis=list(range(2, 2 + len(self.dimu))),
                                   keepdims=True)
-    uni_q1 = self._criticq1([tiled_critic_o, uni_u])
-    uni_q2 = self._criticq2([tiled_critic_o, uni_u])
-    uni_q1_logprob_uni_u = uni_q1 - logprob_uni_u
-    uni_q2_logprob_uni_u = uni_q2 - logprob_uni_u
     # first term (policy)
     actor_o = self._actor_o_norm(o)
     tiled_actor_o = tf.tile(tf.expand_dims(actor_o, axis=1),
                             [1, num_samples] + [1] * len(self.dimo))
     pi, logprob_pi = self._actor([tiled_actor_o])
-    pi_q1 = self._criticq1([tiled_critic_o, pi])
-    pi_q2 = self._criticq2([tiled_critic_o, pi])
-    pi_q1_logprob_pi = pi_q1 - logprob_pi
-    pi_q2_logprob_pi = pi_q2 - logprob_pi
-    # Note: log(2N) not included in this case since it is constant.
-    log_sum_exp_q1 = tf.math.reduce_logsumexp(tf.concat(
-        (uni_q1_logprob_uni_u, pi_q1_logprob_pi), axis=1),
-                                              axis=1)
-    log_sum_exp_q2 = tf.math.reduce_logsumexp(tf.concat(
-        (uni_q2_logprob_uni_u, pi_q2_logprob_pi), axis=1),
+    # uniform and policy actions of all critics in one call, of shape
+    # [num_critics, batch, 2 * num_samples, 1]
+    q_samples = self._criticq([
+        tf.concat((tiled_critic_o, tiled_critic_o), axis=1),
+        tf.concat((uni_u, pi), axis=1)
+    ])
+    q_samples_logprob = q_samples - tf.concat((logprob_uni_u, logprob_pi),
                                               axis=1)
-    cql_loss_q1 = (tf.exp(self.cql_log_alpha) *
-                   (log_sum_exp_q1 - max_term_q1 - self.cql_tau))
-    cql_loss_q2 = (tf.exp(self.cql_log_alpha) *
-                   (log_sum_exp_q2 - max_term_q2 - self.cql_tau))
-    cql_loss = cql_loss_q1 + cql_loss_q2
+    # Note: log(2N) not included in this case since it is constant.
+    log_sum_exp_q = tf.math.reduce_logsumexp(q_samples_logprob, axis=2)
+    cql_loss = tf.reduce_sum(tf.exp(self.cql_log_alpha) *
+                             (log_sum_exp_q - max_term - self.cql_tau),
+                             axis=0)
 
     criticq_loss = (tf.reduce_mean(td_loss) +
                     self.cql_weight * tf.reduce_mean(cql_loss))
-    tf.summary.scalar(name='criticq_loss vs {}'.format(step.name),
-                      data=criticq_loss,
-                      step=step)
+    stats.update("criticq_loss", criticq_loss)
     return criticq_loss
 
-  @tf.function
+  @tf_util.compiled_method
   def _train_offline_graph(self, o, o_2, u, r, done):
     # Train critic q
-    criticq_trainable_weights = (self._criticq1.trainable_weights +
-                                 self._criticq2.trainable_weights)
+    criticq_trainable_weights = self._criticq.trainable_weights
     with tf.GradientTape(watch_accessed_variables=False,
                          persistent=True) as tape:
       tape.watch(criticq_trainable_weights)
@@ -234,7 +236,7 @@ class CQL(sac.SAC):
         tape.watch([self.cql_log_alpha])
       with tf.name_scope('OfflineLosses/'):
         criticq_loss = self._cql_criticq_loss_graph(o, o_2, u, r, done,
-                                                    self.offline_training_step)
+                                                    self._offline_stats)
         cql_alpha_loss = -criticq_loss
     criticq_grads = tape.gradient(criticq_loss, criticq_trainable_weights)
     self._criticq_optimizer.apply_gradients(
@@ -245,19 +247,14 @@ class CQL(sac.SAC):
           zip(cql_alpha_grads, [self.cql_log_alpha]))
       # clip for numerical stability
       self.cql_log_alpha.assign(tf.clip_by_value(self.cql_log_alpha, -20., 40.))
-    with tf.name_scope('OfflineLosses/'):
-      tf.summary.scalar(name='cql alpha vs {}'.format(
-          self.offline_training_step.name),
-                        data=self.cql_log_alpha,
-                        step=self.offline_training_step)
+    self._offline_stats.update("cql alpha", self.cql_log_alpha)
 
     # Train actor
     actor_trainable_weights = self._actor.trainable_weights
     with tf.GradientTape(watch_accessed_variables=False) as tape:
       tape.watch(actor_trainable_weights)
       with tf.name_scope('OfflineLosses/'):
-        actor_loss = self._sac_actor_loss_graph(o, u,
-                                                self.offline_training_step)
+        actor_loss = self._sac_actor_loss_graph(o, u, self._offline_stats)
     actor_grads = tape.gradient(actor_loss, actor_trainable_weights)
     self._actor_optimizer.apply_gradients(
         zip(actor_grads, actor_trainable_weights))
@@ -267,7 +264,7 @@ class CQL(sac.SAC):
       with tf.GradientTape(watch_accessed_variables=False) as tape:
         tape.watch(self.log_alpha)
         with tf.name_scope('OfflineLosses/'):
-          alpha_loss = self._alpha_loss_graph(o, self.offline_training_step)
+          alpha_loss = self._alpha_loss_graph(o, self._offline_stats)
       alpha_grad = tape.gradient(alpha_loss, [self.log_alpha])
       self._alpha_optimizer.apply_gradients(zip(alpha_grad, [self.log_alpha]))
       self.alpha.assign(tf.exp(self.log_alpha))
@@ -275,16 +272,21 @@ class CQL(sac.SAC):
     self.offline_training_step.assign_add(1)
 
   def train_offline(self):
-    with tf.summary.record_if(lambda: self.offline_training_step % 1000 == 0):
+    with profiler.phase("sample"):
       batch = self.offline_buffer.sample(self.offline_batch_size)
 
+    with profiler.phase("convert"):
       o_tf = tf.convert_to_tensor(batch["o"], dtype=tf.float32)
       o_2_tf = tf.convert_to_tensor(batch["o_2"], dtype=tf.float32)
       u_tf = tf.convert_to_tensor(batch["u"], dtype=tf.float32)
       r_tf = tf.convert_to_tensor(batch["r"], dtype=tf.float32)
       done_tf = tf.convert_to_tensor(batch["done"], dtype=tf.float32)
 
+    with profiler.phase("graph"):
       self._train_offline_graph(o_tf, o_2_tf, u_tf, r_tf, done_tf)
-      if self.offline_training_step % self.target_update_freq == 0:
-        self._copy_weights(self._criticq1, self._criticq1_target)
-        self._copy_weights(self._criticq2, self._criticq2_target)
\ No newline at end of file
+    if self.offline_training_step % self.target_update_freq == 0:
+      with profiler.phase("target_update"):
+        self._copy_weights(self._criticq, self._criticq_target)
+    if self.offline_training_step % 1000 == 0:
+      with profiler.phase("summary"):
+        self._offline_stats.flush(self.offline_training_step)
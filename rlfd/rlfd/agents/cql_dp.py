@@ -59,7 +59,12 @@ class CQLDP(cql.CQL):
       online_data_strategy,
       # replay buffer
       buffer_size,
-      info):
+      info,
+      # critic ensemble (REDQ when num_target_critics < num_critics)
+      num_critics=2,
+      num_target_critics=2,
+      # compile the training graphs with XLA
+      jit_compile=False):
     agent.Agent.__init__(self, locals())
 
     self.dims = dims
@@ -77,7 +82,7 @@ class CQLDP(cql.CQL):
     self.buffer_size = buffer_size
 
     self.auto_alpha = auto_alpha
-    self.alpha = tf.constant(alpha, dtype=tf.float32)
+    self.alpha = tf.Variable(alpha, dtype=tf.float32, trainable=False)
     self.alpha_lr = 3e-4
 
     self.auto_cql_alpha = auto_cql_alpha
@@ -93,6 +98,9 @@ class CQLDP(cql.CQL):
     self.action_l2 = action_l2
     self.soft_target_tau = soft_target_tau
     self.target_update_freq = target_update_freq
+    self.num_critics = num_critics
+    self.num_target_critics = num_target_critics
+    assert 1 <= self.num_target_critics <= self.num_critics
 
     self.norm_obs_online = norm_obs_online
     self.norm_obs_offline = norm_obs_offline
@@ -105,12 +113,13 @@ class CQLDP(cql.CQL):
     self.online_data_strategy = online_data_strategy
     assert self.online_data_strategy in ["None", "BC", "Shaping"]
     self.info = info
+    self.jit_compile = jit_compile
 
     self._create_memory()
     self._create_model()
     self._initialize_training_steps()
 
-  def _cql_criticq_loss_graph(self, o, o_2, u, r, done, step):
+  def _cql_criticq_loss_graph(self, o, o_2, u, r, done, stats):
     pi_2, logprob_pi_2 = self._actor([self._actor_o_norm(o_2)])
 
     # Immediate reward
@@ -120,24 +129,23 @@ class CQLDP(cql.CQL):
       potential_curr = self.shaping.potential(o=o, u=u)
       potential_next = self.shaping.potential(o=o_2, u=pi_2)
       target_q += (1.0 - done) * self.gamma * potential_next - potential_curr
+      stats.update("potential", potential_curr)
     # Q value from next state
-    target_next_q1 = self._criticq1_target([self._critic_o_norm(o_2), pi_2])
-    target_next_q2 = self._criticq2_target([self._critic_o_norm(o_2), pi_2])
-    target_next_min_q = tf.minimum(target_next_q1, target_next_q2)
+    target_next_min_q = self._criticq_target.subset_min(
+        [self._critic_o_norm(o_2), pi_2], self.num_target_critics)
     target_q += ((1.0 - done) * self.gamma *
                  (target_next_min_q - self.alpha * logprob_pi_2))
     target_q = tf.stop_gradient(target_q)
 
-    td_loss_q1 = self._huber_loss(target_q,
-                                  self._criticq1([self._critic_o_norm(o), u]))
-    td_loss_q2 = self._huber_loss(target_q,
-                                  self._criticq2([self._critic_o_norm(o), u]))
-    td_loss = td_loss_q1 + td_loss_q2
-    # Being Conservative (Eqn.4)
+    # All critics, of shape [num_critics, batch, 1]
     critic_o = self._critic_o_norm(o)
+    q = self._criticq([critic_o, u])
+    td_loss = tf.reduce_sum(self._huber_loss(
+        tf.broadcast_to(target_q, tf.shape(q)), q),
+                            axis=0)
+    # Being Conservative (Eqn.4)
     # second term
-    max_term_q1 = self._criticq1([critic_o, u])
-    max_term_q2 = self._criticq2([critic_o, u])
+    max_term = q
     # first term (uniform)
     num_samples = 10
     tiled_critic_o = tf.tile(tf.expand_dims(critic_o, axis=1),
@@ -148,42 +156,27 @@ class CQLDP(cql.CQL):
     logprob_uni_u = tf.reduce_sum(uni_u_dist.log_prob(uni_u),
                                   axis=list(range(2, 2 + len(self.dimu))),
                                   keepdims=True)
-    uni_q1 = self._criticq1([tiled_critic_o, uni_u])
-    uni_q2 = self._criticq2([tiled_critic_o, uni_u])
-    # apply double side penalty
-    uni_q1 = tf.abs(uni_q1 - self.target_lower_bound)
-    uni_q2 = tf.abs(uni_q2 - self.target_lower_bound)
-    # apply double side penalty
-    uni_q1_logprob_uni_u = uni_q1 - logprob_uni_u
-    uni_q2_logprob_uni_u = uni_q2 - logprob_uni_u
     # first term (policy)
     actor_o = self._actor_o_norm(o)
     tiled_actor_o = tf.tile(tf.expand_dims(actor_o, axis=1),
                             [1, num_samples] + [1] * len(self.dimo))
     pi, logprob_pi = self._actor([tiled_actor_o])
-    pi_q1 = self._criticq1([tiled_critic_o, pi])
-    pi_q2 = self._criticq2([tiled_critic_o, pi])
+    # uniform and policy actions of all critics in one call, of shape
+    # [num_critics, batch, 2 * num_samples, 1]
+    q_samples = self._criticq([
+        tf.concat((tiled_critic_o, tiled_critic_o), axis=1),
+        tf.concat((uni_u, pi), axis=1)
+    ])
     # apply double side penalty
-    pi_q1 = tf.abs(pi_q1 - self.target_lower_bound)
-    pi_q2 = tf.abs(pi_q2 - self.target_lower_bound)
-    # apply double side penalty
-    pi_q1_logprob_pi = pi_q1 - logprob_pi
-    pi_q2_logprob_pi = pi_q2 - logprob_pi
-    # Note: log(2N) not included in this case since it is constant.
-    log_sum_exp_q1 = tf.math.reduce_logsumexp(tf.concat(
-        (uni_q1_logprob_uni_u, pi_q1_logprob_pi), axis=1),
+    q_samples = tf.abs(q_samples - self.target_lower_bound)
+    q_samples_logprob = q_samples - tf.concat((logprob_uni_u, logprob_pi),
                                               axis=1)
-    log_sum_exp_q2 = tf.math.reduce_logsumexp(tf.concat(
-        (uni_q2_logprob_uni_u, pi_q2_logprob_pi), axis=1),
-                                              axis=1)
-    cql_loss_q1 = (tf.exp(self.cql_log_alpha) *
-                   (log_sum_exp_q1 - max_term_q1 - self.cql_tau))
-    cql_loss_q2 = (tf.exp(self.cql_log_alpha) *
-                   (log_sum_exp_q2 - max_term_q2 - self.cql_tau))
-    cql_loss = cql_loss_q1 + cql_loss_q2
+    # Note: log(2N) not included in this case since it is constant.
+    log_sum_exp_q = tf.math.reduce_logsumexp(q_samples_logprob, axis=2)
+    cql_loss = tf.reduce_sum(tf.exp(self.cql_log_alpha) *
+                             (log_sum_exp_q - max_term - self.cql_tau),
+                             axis=0)
 
     criticq_loss = tf.reduce_mean(td_loss) + tf.reduce_mean(cql_loss)
-    tf.summary.scalar(name='criticq_loss vs {}'.format(step.name),
-                      data=criticq_loss,
-                      step=step)
+    stats.update("criticq_loss", criticq_loss)
     return criticq_loss
\ No newline at end of file
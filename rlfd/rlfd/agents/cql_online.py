@@ -10,6 +10,7 @@ tfk = tf.keras
 
 from rlfd import memory
 from rlfd.agents import agent, cql
+from rlfd.utils import tf_util
 
 
 class CQLOnline(cql.CQL):
@@ -57,7 +58,12 @@ class CQLOnline(cql.CQL):
       online_data_strategy,
       # replay buffer
       buffer_size,
-      info):
+      info,
+      # critic ensemble (REDQ when num_target_critics < num_critics)
+      num_critics=2,
+      num_target_critics=2,
+      # compile the training graphs with XLA
+      jit_compile=False):
     agent.Agent.__init__(self, locals())
 
     self.dims = dims
@@ -75,7 +81,7 @@ class CQLOnline(cql.CQL):
     self.buffer_size = buffer_size
 
     self.auto_alpha = auto_alpha
-    self.alpha = tf.constant(alpha, dtype=tf.float32)
+    self.alpha = tf.Variable(alpha, dtype=tf.float32, trainable=False)
     self.alpha_lr = 3e-4
 
     self.auto_cql_alpha = auto_cql_alpha
@@ -91,6 +97,9 @@ class CQLOnline(cql.CQL):
     self.action_l2 = action_l2
     self.soft_target_tau = soft_target_tau
     self.target_update_freq = target_update_freq
+    self.num_critics = num_critics
+    self.num_target_critics = num_target_critics
+    assert 1 <= self.num_target_critics <= self.num_critics
 
     self.norm_obs_online = norm_obs_online
     self.norm_obs_offline = norm_obs_offline
@@ -103,16 +112,16 @@ class CQLOnline(cql.CQL):
     self.online_data_strategy = online_data_strategy
     assert self.online_data_strategy in ["None", "BC", "Shaping"]
     self.info = info
+    self.jit_compile = jit_compile
 
     self._create_memory()
     self._create_model()
     self._initialize_training_steps()
 
-  @tf.function
+  @tf_util.compiled_method
   def _train_online_graph(self, o, o_2, u, r, done):
     # Train critic q
-    criticq_trainable_weights = (self._criticq1.trainable_weights +
-                                 self._criticq2.trainable_weights)
+    criticq_trainable_weights = self._criticq.trainable_weights
     with tf.GradientTape(watch_accessed_variables=False,
                          persistent=True) as tape:
       tape.watch(criticq_trainable_weights)
@@ -120,7 +129,7 @@ class CQLOnline(cql.CQL):
         tape.watch([self.cql_log_alpha])
       with tf.name_scope('OnlineLosses/'):
         criticq_loss = self._cql_criticq_loss_graph(o, o_2, u, r, done,
-                                                    self.online_training_step)
+                                                    self._online_stats)
         cql_alpha_loss = -criticq_loss
     criticq_grads = tape.gradient(criticq_loss, criticq_trainable_weights)
     self._criticq_optimizer.apply_gradients(
@@ -131,18 +140,14 @@ class CQLOnline(cql.CQL):
           zip(cql_alpha_grads, [self.cql_log_alpha]))
       # clip for numerical stability
       self.cql_log_alpha.assign(tf.clip_by_value(self.cql_log_alpha, -20., 40.))
-    with tf.name_scope('OnlineLosses/'):
-      tf.summary.scalar(name='cql alpha vs {}'.format(
-          self.online_training_step.name),
-                        data=self.cql_log_alpha,
-                        step=self.online_training_step)
+    self._online_stats.update("cql alpha", self.cql_log_alpha)
 
     # Train actor
     actor_trainable_weights = self._actor.trainable_weights
     with tf.GradientTape(watch_accessed_variables=False) as tape:
       tape.watch(actor_trainable_weights)
       with tf.name_scope('OnlineLosses/'):
-        actor_loss = self._sac_actor_loss_graph(o, u, self.online_training_step)
+        actor_loss = self._sac_actor_loss_graph(o, u, self._online_stats)
     actor_grads = tape.gradient(actor_loss, actor_trainable_weights)
     self._actor_optimizer.apply_gradients(
         zip(actor_grads, actor_trainable_weights))
@@ -152,17 +157,13 @@ class CQLOnline(cql.CQL):
       with tf.GradientTape(watch_accessed_variables=False) as tape:
         tape.watch(self.log_alpha)
         with tf.name_scope('OnlineLosses/'):
-          alpha_loss = self._alpha_loss_graph(o, self.online_training_step)
+          alpha_loss = self._alpha_loss_graph(o, self._online_stats)
       alpha_grad = tape.gradient(alpha_loss, [self.log_alpha])
       self._alpha_optimizer.apply_gradients(zip(alpha_grad, [self.log_alpha]))
       self.alpha.assign(tf.exp(self.log_alpha))
 
     # Reduce weight on cql regularization term.
     self.cql_weight.assign(self.cql_weight * self.cql_weight_decay_factor)
-    with tf.name_scope('OnlineLosses/'):
-      tf.summary.scalar(name='cql_weight vs {}'.format(
-          self.online_training_step.name),
-                        data=self.cql_weight,
-                        step=self.online_training_step)
+    self._online_stats.update("cql_weight", self.cql_weight)
 
     self.online_training_step.assign_add(1)
\ No newline at end of file
@@ -7,8 +7,9 @@ import tensorflow as tf
 tfk = tf.keras
 tfl = tfk.layers
 
-from rlfd import memory, normalizer, policies
+from rlfd import memory, normalizer, policies, profiler
 from rlfd.agents import agent, sac_networks
+from rlfd.utils import tf_util
 
 
 class Generator(tfk.Model):
@@ -66,7 +67,9 @@ class GAN(agent.Agent):
       critic_freq,
       # replay buffer
       buffer_size,
-      info):
+      info,
+      # compile the training graphs with XLA
+      jit_compile=False):
     super().__init__(locals())
 
     self.dims = dims
@@ -90,6 +93,7 @@ class GAN(agent.Agent):
     self.norm_clip = norm_clip
 
     self.info = info
+    self.jit_compile = jit_compile
 
     self._create_memory()
     self._create_model()
@@ -175,17 +179,14 @@ class GAN(agent.Agent):
     """A convenient function for shaping"""
     return self._discriminator([self._discriminator_o_norm(o), u])
 
-  def before_training_hook(self, data_dir=None, env=None, **kwargs):
+  def before_training_hook(self,
+                           data_dir=None,
+                           env=None,
+                           offline_dataset=None,
+                           **kwargs):
     """Adds data to the offline replay buffer and add shaping"""
     # Offline data
-    # D4RL
-    experiences = env.get_dataset()  # T not fixed by assumption
-    if experiences:
-      self.offline_buffer.store(experiences)
-    # Ours
-    demo_file = osp.join(data_dir, "demo_data.npz")
-    if (not experiences) and osp.isfile(demo_file):
-      experiences = self.offline_buffer.load_from_file(data_file=demo_file)
+    experiences = self._load_offline_data(data_dir, env, offline_dataset)
     if self.norm_obs_offline:
       assert experiences, "Offline dataset does not exist."
       self._update_stats(experiences)
@@ -202,8 +203,8 @@ class GAN(agent.Agent):
     o_tf = tf.convert_to_tensor(transitions["o"], dtype=tf.float32)
     self._discriminator_o_norm.update(o_tf)
 
-  @tf.function
-  def _train_offline_graph(self, o, u):
+  @tf_util.compiled_method
+  def _train_offline_graph(self, o, u, train_generator):
     with tf.name_scope('OfflineLosses/'):
 
       o = self._discriminator_o_norm(o)
@@ -238,33 +239,34 @@ class GAN(agent.Agent):
         gradient_penalty = tf.reduce_mean((slopes - 1)**2)
         disc_loss = (tf.reduce_mean(disc_fake) - tf.reduce_mean(disc_real) +
                      self.gp_lambda * gradient_penalty)
-        tf.summary.scalar(name='discriminator_loss vs {}'.format(
-            self.offline_training_step.name),
-                          data=disc_loss,
-                          step=self.offline_training_step)
+        self._offline_stats.update("discriminator_loss", disc_loss)
         # Generator loss
         gen_loss = -tf.reduce_mean(disc_fake)
-        tf.summary.scalar(name='generator_loss vs {}'.format(
-            self.offline_training_step.name),
-                          data=gen_loss,
-                          step=self.offline_training_step)
+        self._offline_stats.update("generator_loss", gen_loss)
     disc_grads = tape.gradient(disc_loss, self._discriminator.trainable_weights)
     gen_grads = tape.gradient(gen_loss, self._generator.trainable_weights)
 
     self._discriminator_optimizer.apply_gradients(
         zip(disc_grads, self._discriminator.trainable_weights))
-    if self.offline_training_step % self.critic_freq == 0:
+    if train_generator:  # python bool, see TD3._train_online_graph
       self._generator_optimizer.apply_gradients(
           zip(gen_grads, self._generator.trainable_weights))
 
     self.offline_training_step.assign_add(1)
 
   def train_offline(self):
-    with tf.summary.record_if(lambda: self.offline_training_step % 200 == 0):
+    with profiler.phase("sample"):
       batch = self.offline_buffer.sample(self.offline_batch_size)
+    with profiler.phase("convert"):
       o_tf = tf.convert_to_tensor(batch["o"], dtype=tf.float32)
       u_tf = tf.convert_to_tensor(batch["u"], dtype=tf.float32)
-      self._train_offline_graph(o_tf, u_tf)
+    with profiler.phase("graph"):
+      train_generator = bool(
+          self.offline_training_step % self.critic_freq == 0)
+      self._train_offline_graph(o_tf, u_tf, train_generator)
+    if self.offline_training_step % 200 == 0:
+      with profiler.phase("summary"):
+        self._offline_stats.flush(self.offline_training_step)
 
   def store_experiences(self, experiences):
     pass  # no online training
@@ -10,8 +10,9 @@ tfd = tfp.distributions
 tfk = tf.keras
 tfl = tfk.layers
 
-from rlfd import memory, normalizer, policies
+from rlfd import memory, normalizer, policies, profiler
 from rlfd.agents import agent, sac_networks
+from rlfd.utils import tf_util
 
 
 class ClippedAutoregressiveNetwork(tfk.Model):
@@ -90,7 +91,9 @@ class NF(agent.Agent):
       min_logprob,
       # replay buffer
       buffer_size,
-      info):
+      info,
+      # compile the training graphs with XLA
+      jit_compile=False):
     super().__init__(locals())
 
     self.dims = dims
@@ -120,6 +123,7 @@ class NF(agent.Agent):
     self.norm_clip = norm_clip
 
     self.info = info
+    self.jit_compile = jit_compile
 
     self._create_memory()
     self._create_model()
@@ -208,17 +212,14 @@ class NF(agent.Agent):
     """A convenient function for shaping"""
     return self._critic([self._critic_o_norm(o), u])
 
-  def before_training_hook(self, data_dir=None, env=None, **kwargs):
+  def before_training_hook(self,
+                           data_dir=None,
+                           env=None,
+                           offline_dataset=None,
+                           **kwargs):
     """Adds data to the offline replay buffer and add shaping"""
     # Offline data
-    # D4RL
-    experiences = env.get_dataset()  # T not fixed by assumption
-    if experiences:
-      self.offline_buffer.store(experiences)
-    # Ours
-    demo_file = osp.join(data_dir, "demo_data.npz")
-    if (not experiences) and osp.isfile(demo_file):
-      experiences = self.offline_buffer.load_from_file(data_file=demo_file)
+    experiences = self._load_offline_data(data_dir, env, offline_dataset)
     if self.norm_obs_offline:
       assert experiences, "Offline dataset does not exist."
       self._update_stats(experiences)
@@ -236,7 +237,7 @@ class NF(agent.Agent):
     self._maf_o_norm.update(o_tf)
     self._critic_o_norm.update(o_tf)
 
-  @tf.function
+  @tf_util.compiled_method
   def _train_offline_graph(self, o, u):
     with tf.name_scope('OfflineLosses/'):
       # Train maf
@@ -254,10 +255,7 @@ class NF(agent.Agent):
         regularizer = tf.norm(jacobian, ord=2)
         maf_loss = (self.prm_loss_weight * neg_logprob +
                     self.reg_loss_weight * regularizer)
-        tf.summary.scalar(name='maf_loss vs {}'.format(
-            self.offline_training_step.name),
-                          data=maf_loss,
-                          step=self.offline_training_step)
+        self._offline_stats.update("maf_loss", maf_loss)
 
       maf_grads = tape.gradient(maf_loss, self._maf.trainable_weights)
       self._maf_optimizer.apply_gradients(
@@ -286,10 +284,7 @@ class NF(agent.Agent):
             tf.stop_gradient(logprob),
             self._critic([self._critic_o_norm(o), u]))
         critic_loss = tf.reduce_mean(critic_loss)
-        tf.summary.scalar(name='critic_loss vs {}'.format(
-            self.offline_training_step.name),
-                          data=critic_loss,
-                          step=self.offline_training_step)
+        self._offline_stats.update("critic_loss", critic_loss)
       critic_grads = tape.gradient(critic_loss, self._critic.trainable_weights)
       self._critic_optimizer.apply_gradients(
           zip(critic_grads, self._critic.trainable_weights))
@@ -297,11 +292,16 @@ class NF(agent.Agent):
     self.offline_training_step.assign_add(1)
 
   def train_offline(self):
-    with tf.summary.record_if(lambda: self.offline_training_step % 200 == 0):
+    with profiler.phase("sample"):
       batch = self.offline_buffer.sample(self.offline_batch_size)
+    with profiler.phase("convert"):
       o_tf = tf.convert_to_tensor(batch["o"], dtype=tf.float32)
       u_tf = tf.convert_to_tensor(batch["u"], dtype=tf.float32)
+    with profiler.phase("graph"):
       self._train_offline_graph(o_tf, u_tf)
+    if self.offline_training_step % 200 == 0:
+      with profiler.phase("summary"):
+        self._offline_stats.flush(self.offline_training_step)
 
   def store_experiences(self, experiences):
     pass  # no online training
@@ -6,8 +6,9 @@ import numpy as np
 import tensorflow as tf
 tfk = tf.keras
 
-from rlfd import memory, normalizer, policies
+from rlfd import memory, normalizer, policies, profiler
 from rlfd.agents import agent, sac_networks
+from rlfd.utils import tf_util
 
 
 class SAC(agent.Agent):
@@ -47,7 +48,12 @@ class SAC(agent.Agent):
       online_data_strategy,
       # replay buffer
       buffer_size,
-      info):
+      info,
+      # critic ensemble (REDQ when num_target_critics < num_critics)
+      num_critics=2,
+      num_target_critics=2,
+      # compile the training graphs with XLA
+      jit_compile=False):
     super().__init__(locals())
 
     self.dims = dims
@@ -65,7 +71,7 @@ class SAC(agent.Agent):
     self.buffer_size = buffer_size
 
     self.auto_alpha = auto_alpha
-    self.alpha = tf.constant(alpha, dtype=tf.float32)
+    self.alpha = tf.Variable(alpha, dtype=tf.float32, trainable=False)
     self.alpha_lr = 3e-4
 
     self.layer_sizes = layer_sizes
@@ -74,6 +80,9 @@ class SAC(agent.Agent):
     self.action_l2 = action_l2
     self.soft_target_tau = soft_target_tau
     self.target_update_freq = target_update_freq
+    self.num_critics = num_critics
+    self.num_target_critics = num_target_critics
+    assert 1 <= self.num_target_critics <= self.num_critics
 
     self.norm_obs_online = norm_obs_online
     self.norm_obs_offline = norm_obs_offline
@@ -86,6 +95,7 @@ class SAC(agent.Agent):
     self.online_data_strategy = online_data_strategy
     assert self.online_data_strategy in ["None", "BC", "Shaping"]
     self.info = info
+    self.jit_compile = jit_compile
 
     self._create_memory()
     self._create_model()
@@ -128,27 +138,23 @@ class SAC(agent.Agent):
     self._critic_o_norm = normalizer.Normalizer(self.dimo, self.norm_eps,
                                                 self.norm_clip)
 
-    self._criticq1 = sac_networks.CriticQ(self.dimo, self.dimu, self.max_u,
-                                          self.layer_sizes)
-    self._criticq1_target = sac_networks.CriticQ(self.dimo, self.dimu,
-                                                 self.max_u, self.layer_sizes)
-    self._copy_weights(self._criticq1, self._criticq1_target, 1.0)
-
-    self._criticq2 = sac_networks.CriticQ(self.dimo, self.dimu, self.max_u,
-                                          self.layer_sizes)
-    self._criticq2_target = sac_networks.CriticQ(self.dimo, self.dimu,
-                                                 self.max_u, self.layer_sizes)
-    self._copy_weights(self._criticq2, self._criticq2_target, 1.0)
+    # All critics are evaluated in one call, criticq1, criticq2, ... are views
+    # of a single critic for saving and pretrained critics.
+    self._criticq = sac_networks.EnsembleCriticQ(self.num_critics, self.dimo,
+                                                 self.dimu, self.max_u,
+                                                 self.layer_sizes)
+    self._criticq_target = sac_networks.EnsembleCriticQ(
+        self.num_critics, self.dimo, self.dimu, self.max_u, self.layer_sizes)
+    self._copy_weights(self._criticq, self._criticq_target, 1.0)
+    self._criticq1 = self._criticq.get_heads()[0]
 
     self._criticq_optimizer = tfk.optimizers.Adam(learning_rate=self.q_lr)
 
-    self._critic_models = {
-        "critic_o_norm": self._critic_o_norm,
-        "criticq1": self._criticq1,
-        "criticq2": self._criticq2,
-        "criticq1_target": self._criticq1_target,
-        "criticq2_target": self._criticq2_target,
-    }
+    self._critic_models = {"critic_o_norm": self._critic_o_norm}
+    for i, (head, target_head) in enumerate(
+        zip(self._criticq.get_heads(), self._criticq_target.get_heads())):
+      self._critic_models["criticq{}".format(i + 1)] = head
+      self._critic_models["criticq{}_target".format(i + 1)] = target_head
     self.save_model(self._critic_models)
 
   def _create_model(self):
@@ -213,17 +219,11 @@ class SAC(agent.Agent):
                            data_dir=None,
                            env=None,
                            shaping=None,
-                           pretrained_agent=None):
+                           pretrained_agent=None,
+                           offline_dataset=None):
     """Adds data to the offline replay buffer and add shaping"""
     # Offline data
-    # D4RL
-    experiences = env.get_dataset()  # T not fixed by assumption
-    if experiences:
-      self.offline_buffer.store(experiences)
-    # Ours
-    demo_file = osp.join(data_dir, "demo_data.npz")
-    if (not experiences) and osp.isfile(demo_file):
-      experiences = self.offline_buffer.load_from_file(data_file=demo_file)
+    experiences = self._load_offline_data(data_dir, env, offline_dataset)
     if self.norm_obs_offline:
       assert experiences, "Offline dataset does not exist."
       self._update_stats(experiences)
@@ -251,16 +251,37 @@ class SAC(agent.Agent):
   def before_online_hook(self):
     if self.use_pretrained_actor:
       for k, v in self._actor_models.items():
-        self._copy_weights(self.pretrained_agent.get_saved_model(k), v, 1.0)
+        v.set_weights(self.pretrained_agent.get_saved_model(k).get_weights())
 
     if self.use_pretrained_critic:
+      # heads beyond those of the pretrained agent keep their initialization
       for k, v in self._critic_models.items():
-        self._copy_weights(self.pretrained_agent.get_saved_model(k), v, 1.0)
+        if self.pretrained_agent.has_saved_model(k):
+          v.set_weights(self.pretrained_agent.get_saved_model(k).get_weights())
 
     if self.use_pretrained_alpha:
       self.log_alpha.assign(self.pretrained_agent.get_saved_var("log_alpha"))
       self.alpha.assign(self.pretrained_agent.get_saved_var("alpha"))
 
+  def set_hyperparameters(self,
+                          q_lr=None,
+                          pi_lr=None,
+                          alpha=None,
+                          **hyperparameters):
+    if q_lr is not None:
+      self._set_learning_rate("q_lr", q_lr, self._criticq_optimizer)
+    if pi_lr is not None:
+      self._set_learning_rate("pi_lr", pi_lr, *self._pi_optimizers())
+    if alpha is not None:
+      self._init_args["alpha"] = alpha
+      self.alpha.assign(alpha)
+      if self.auto_alpha:  # training continues from the new value
+        self.log_alpha.assign(np.log(alpha))
+    super(SAC, self).set_hyperparameters(**hyperparameters)
+
+  def _pi_optimizers(self):
+    return [self._actor_optimizer]
+
   def store_experiences(self, experiences):
     self.online_buffer.store(experiences)
     if self.norm_obs_online:
@@ -284,7 +305,7 @@ class SAC(agent.Agent):
     batch = self._merge_batch_experiences(online_batch, offline_batch)
     return batch
 
-  def _sac_criticq_loss_graph(self, o, o_2, u, r, done, step):
+  def _sac_criticq_loss_graph(self, o, o_2, u, r, done, stats):
     pi_2, logprob_pi_2 = self._actor([self._actor_o_norm(o_2)])
 
     # Immediate reward
@@ -294,80 +315,73 @@ class SAC(agent.Agent):
       potential_curr = self.shaping.potential(o=o, u=u)
       potential_next = self.shaping.potential(o=o_2, u=pi_2)
       target_q += (1.0 - done) * self.gamma * potential_next - potential_curr
+      stats.update("potential", potential_curr)
     # Q value from next state
-    target_next_q1 = self._criticq1_target([self._critic_o_norm(o_2), pi_2])
-    target_next_q2 = self._criticq2_target([self._critic_o_norm(o_2), pi_2])
-    target_next_min_q = tf.minimum(target_next_q1, target_next_q2)
+    target_next_min_q = self._criticq_target.subset_min(
+        [self._critic_o_norm(o_2), pi_2], self.num_target_critics)
     target_q += ((1.0 - done) * self.gamma *
                  (target_next_min_q - self.alpha * logprob_pi_2))
     target_q = tf.stop_gradient(target_q)
 
-    td_loss_q1 = self._huber_loss(target_q,
-                                  self._criticq1([self._critic_o_norm(o), u]))
-    td_loss_q2 = self._huber_loss(target_q,
-                                  self._criticq2([self._critic_o_norm(o), u]))
-    td_loss = td_loss_q1 + td_loss_q2
+    q = self._criticq([self._critic_o_norm(o), u])
+    td_loss = tf.reduce_sum(self._huber_loss(
+        tf.broadcast_to(target_q, tf.shape(q)), q),
+                            axis=0)
 
     criticq_loss = tf.reduce_mean(td_loss)
-    tf.summary.scalar(name='criticq_loss vs {}'.format(step.name),
-                      data=criticq_loss,
-                      step=step)
+    stats.update("criticq_loss", criticq_loss)
     return criticq_loss
 
-  def _sac_actor_loss_graph(self, o, u, step):
+  def _sac_actor_loss_graph(self, o, u, stats):
     pi, logprob_pi = self._actor([self._actor_o_norm(o)])
-    current_q1 = self._criticq1([self._critic_o_norm(o), pi])
-    current_q2 = self._criticq2([self._critic_o_norm(o), pi])
-    current_min_q = tf.minimum(current_q1, current_q2)
+    current_q = self._criticq([self._critic_o_norm(o), pi])
+    if self.num_target_critics < self.num_critics:
+      # REDQ: the actor maximizes the mean of the ensemble
+      current_min_q = tf.reduce_mean(current_q, axis=0)
+    else:
+      current_min_q = tf.reduce_min(current_q, axis=0)
 
     actor_loss = tf.reduce_mean(self.alpha * logprob_pi - current_min_q)
     if self.online_data_strategy == "Shaping":
       actor_loss += -tf.reduce_mean(self.shaping.potential(o=o, u=pi))
     if self.online_data_strategy == "BC":
       pass  # TODO add behavior clone.
-    tf.summary.scalar(name='actor_loss vs {}'.format(step.name),
-                      data=actor_loss,
-                      step=step)
+    stats.update("actor_loss", actor_loss)
     return actor_loss
 
-  def _alpha_loss_graph(self, o, step):
+  def _alpha_loss_graph(self, o, stats):
     _, logprob_pi = self._actor([self._actor_o_norm(o)])
     alpha_loss = -tf.reduce_mean(
         (self.log_alpha * tf.stop_gradient(logprob_pi + self.target_alpha)))
 
     return alpha_loss
 
-  @tf.function
+  @tf_util.compiled_method
   def _train_online_graph(self, o, o_2, u, r, done):
     # Train alpha (entropy weight)
     if self.auto_alpha:
       with tf.GradientTape(watch_accessed_variables=False) as tape:
         tape.watch(self.log_alpha)
         with tf.name_scope('OnlineLosses/'):
-          alpha_loss = self._alpha_loss_graph(o, self.online_training_step)
+          alpha_loss = self._alpha_loss_graph(o, self._online_stats)
       alpha_grad = tape.gradient(alpha_loss, [self.log_alpha])
       self._alpha_optimizer.apply_gradients(zip(alpha_grad, [self.log_alpha]))
       self.alpha.assign(tf.exp(self.log_alpha))
-      with tf.name_scope('OnlineLosses/'):
-        tf.summary.scalar(name='alpha vs {}'.format(
-            self.online_training_step.name),
-                          data=self.log_alpha,
-                          step=self.online_training_step)
+      self._online_stats.update("alpha", self.log_alpha)
     # Critic q loss
-    criticq_trainable_weights = (self._criticq1.trainable_weights +
-                                 self._criticq2.trainable_weights)
+    criticq_trainable_weights = self._criticq.trainable_weights
     with tf.GradientTape(watch_accessed_variables=False) as tape:
       tape.watch(criticq_trainable_weights)
       with tf.name_scope('OnlineLosses/'):
         criticq_loss = self._sac_criticq_loss_graph(o, o_2, u, r, done,
-                                                    self.online_training_step)
+                                                    self._online_stats)
     criticq_grads = tape.gradient(criticq_loss, criticq_trainable_weights)
     # Actor loss
     actor_trainable_weights = self._actor.trainable_weights
     with tf.GradientTape(watch_accessed_variables=False) as tape:
       tape.watch(actor_trainable_weights)
       with tf.name_scope('OnlineLosses/'):
-        actor_loss = self._sac_actor_loss_graph(o, u, self.online_training_step)
+        actor_loss = self._sac_actor_loss_graph(o, u, self._online_stats)
     actor_grads = tape.gradient(actor_loss, actor_trainable_weights)
 
     # Update networks
@@ -379,20 +393,24 @@ class SAC(agent.Agent):
     self.online_training_step.assign_add(1)
 
   def train_online(self):
-    with tf.summary.record_if(lambda: self.online_training_step % 200 == 0):
-
+    with profiler.phase("sample"):
       batch = self.sample_batch()
 
+    with profiler.phase("convert"):
       o_tf = tf.convert_to_tensor(batch["o"], dtype=tf.float32)
       o_2_tf = tf.convert_to_tensor(batch["o_2"], dtype=tf.float32)
       u_tf = tf.convert_to_tensor(batch["u"], dtype=tf.float32)
       r_tf = tf.convert_to_tensor(batch["r"], dtype=tf.float32)
       done_tf = tf.convert_to_tensor(batch["done"], dtype=tf.float32)
 
+    with profiler.phase("graph"):
       self._train_online_graph(o_tf, o_2_tf, u_tf, r_tf, done_tf)
-      if self.online_training_step % self.target_update_freq == 0:
-        self._copy_weights(self._criticq1, self._criticq1_target)
-        self._copy_weights(self._criticq2, self._criticq2_target)
+    if self.online_training_step % self.target_update_freq == 0:
+      with profiler.phase("target_update"):
+        self._copy_weights(self._criticq, self._criticq_target)
+    if self.online_training_step % 200 == 0:
+      with profiler.phase("summary"):
+        self._online_stats.flush(self.online_training_step)
 
   def _copy_weights(self, source, target, soft_target_tau=None):
     soft_target_tau = (soft_target_tau
@@ -1,6 +1,8 @@
 import tensorflow as tf
 import tensorflow_probability as tfp
 
+from rlfd.agents import stacked_networks
+
 tfk = tf.keras
 tfl = tfk.layers
 tfd = tfp.distributions
@@ -163,3 +165,21 @@ class CriticQ(tfk.Model):
       res = l(res)
     res = self._output_layer(res)
     return res
+
+
+class EnsembleCriticQ(stacked_networks.StackedCriticQ):
+  """num_critics CriticQ networks with stacked weights, evaluated in one call.
+  """
+
+  def __init__(self, num_critics, dimo, dimu, max_u, layer_sizes, name="qf"):
+    super().__init__(
+        num_critics,
+        dimo,
+        dimu,
+        max_u,
+        layer_sizes,
+        kernel_initializer="glorot_uniform",
+        bias_initializer=tfk.initializers.constant(0.1),
+        output_kernel_initializer="glorot_uniform",
+        output_bias_initializer="glorot_uniform",
+        name=name)
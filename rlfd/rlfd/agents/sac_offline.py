@@ -6,8 +6,9 @@ import numpy as np
 import tensorflow as tf
 tfk = tf.keras
 
-from rlfd import memory
+from rlfd import memory, profiler
 from rlfd.agents import agent, sac
+from rlfd.utils import tf_util
 
 
 class SACOffline(sac.SAC):
@@ -49,7 +50,12 @@ class SACOffline(sac.SAC):
       online_data_strategy,
       # replay buffer
       buffer_size,
-      info):
+      info,
+      # critic ensemble (REDQ when num_target_critics < num_critics)
+      num_critics=2,
+      num_target_critics=2,
+      # compile the training graphs with XLA
+      jit_compile=False):
     agent.Agent.__init__(self, locals())
 
     self.dims = dims
@@ -67,7 +73,7 @@ class SACOffline(sac.SAC):
     self.buffer_size = buffer_size
 
     self.auto_alpha = auto_alpha
-    self.alpha = tf.constant(alpha, dtype=tf.float32)
+    self.alpha = tf.Variable(alpha, dtype=tf.float32, trainable=False)
     self.alpha_lr = 3e-4
 
     self.layer_sizes = layer_sizes
@@ -76,6 +82,9 @@ class SACOffline(sac.SAC):
     self.action_l2 = action_l2
     self.soft_target_tau = soft_target_tau
     self.target_update_freq = target_update_freq
+    self.num_critics = num_critics
+    self.num_target_critics = num_target_critics
+    assert 1 <= self.num_target_critics <= self.num_critics
 
     self.norm_obs_online = norm_obs_online
     self.norm_obs_offline = norm_obs_offline
@@ -88,43 +97,38 @@ class SACOffline(sac.SAC):
     self.online_data_strategy = online_data_strategy
     assert self.online_data_strategy in ["None", "BC", "Shaping"]
     self.info = info
+    self.jit_compile = jit_compile
 
     self._create_memory()
     self._create_model()
     self._initialize_training_steps()
 
-  @tf.function
+  @tf_util.compiled_method
   def _train_offline_graph(self, o, o_2, u, r, done):
     # Train alpha (entropy weight)
     if self.auto_alpha:
       with tf.GradientTape(watch_accessed_variables=False) as tape:
         tape.watch(self.log_alpha)
         with tf.name_scope('OfflineLosses/'):
-          alpha_loss = self._alpha_loss_graph(o, self.offline_training_step)
+          alpha_loss = self._alpha_loss_graph(o, self._offline_stats)
       alpha_grad = tape.gradient(alpha_loss, [self.log_alpha])
       self._alpha_optimizer.apply_gradients(zip(alpha_grad, [self.log_alpha]))
       self.alpha.assign(tf.exp(self.log_alpha))
-      with tf.name_scope('OfflineLosses/'):
-        tf.summary.scalar(name='alpha vs {}'.format(
-            self.offline_training_step.name),
-                          data=self.log_alpha,
-                          step=self.offline_training_step)
+      self._offline_stats.update("alpha", self.log_alpha)
     # Critic q loss
-    criticq_trainable_weights = (self._criticq1.trainable_weights +
-                                 self._criticq2.trainable_weights)
+    criticq_trainable_weights = self._criticq.trainable_weights
     with tf.GradientTape(watch_accessed_variables=False) as tape:
       tape.watch(criticq_trainable_weights)
       with tf.name_scope('OfflineLosses/'):
         criticq_loss = self._sac_criticq_loss_graph(o, o_2, u, r, done,
-                                                    self.offline_training_step)
+                                                    self._offline_stats)
     criticq_grads = tape.gradient(criticq_loss, criticq_trainable_weights)
     # Actor loss
     actor_trainable_weights = self._actor.trainable_weights
     with tf.GradientTape(watch_accessed_variables=False) as tape:
       tape.watch(actor_trainable_weights)
       with tf.name_scope('OfflineLosses/'):
-        actor_loss = self._sac_actor_loss_graph(o, u,
-                                                self.offline_training_step)
+        actor_loss = self._sac_actor_loss_graph(o, u, self._offline_stats)
     actor_grads = tape.gradient(actor_loss, actor_trainable_weights)
 
     # Update networks
@@ -136,16 +140,21 @@ class SACOffline(sac.SAC):
     self.offline_training_step.assign_add(1)
 
   def train_offline(self):
-    with tf.summary.record_if(lambda: self.offline_training_step % 1000 == 0):
+    with profiler.phase("sample"):
       batch = self.offline_buffer.sample(self.offline_batch_size)
 
+    with profiler.phase("convert"):
       o_tf = tf.convert_to_tensor(batch["o"], dtype=tf.float32)
       o_2_tf = tf.convert_to_tensor(batch["o_2"], dtype=tf.float32)
       u_tf = tf.convert_to_tensor(batch["u"], dtype=tf.float32)
       r_tf = tf.convert_to_tensor(batch["r"], dtype=tf.float32)
       done_tf = tf.convert_to_tensor(batch["done"], dtype=tf.float32)
 
+    with profiler.phase("graph"):
       self._train_offline_graph(o_tf, o_2_tf, u_tf, r_tf, done_tf)
-      if self.offline_training_step % self.target_update_freq == 0:
-        self._copy_weights(self._criticq1, self._criticq1_target)
-        self._copy_weights(self._criticq2, self._criticq2_target)
\ No newline at end of file
+    if self.offline_training_step % self.target_update_freq == 0:
+      with profiler.phase("target_update"):
+        self._copy_weights(self._criticq, self._criticq_target)
+    if self.offline_training_step % 1000 == 0:
+      with profiler.phase("summary"):
+        self._offline_stats.flush(self.offline_training_step)
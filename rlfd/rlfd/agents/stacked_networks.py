@@ -0,0 +1,178 @@
+import tensorflow as tf
+
+tfk = tf.keras
+tfl = tfk.layers
+
+
+class StackedDense(tfl.Layer):
+  """num_stacked independent dense layers applied to inputs of shape
+  [num_stacked, batch, input_dim] with one batched matmul. The kernel is stored
+  as [num_stacked, input_dim, units] and the bias as [num_stacked, units].
+  """
+
+  def __init__(self,
+               num_stacked,
+               units,
+               activation=None,
+               kernel_initializer="glorot_uniform",
+               bias_initializer="zeros",
+               **kwargs):
+    super().__init__(**kwargs)
+    self.num_stacked = num_stacked
+    self.units = units
+    self.activation = tfk.activations.get(activation)
+    self.kernel_initializer = tfk.initializers.get(kernel_initializer)
+    self.bias_initializer = tfk.initializers.get(bias_initializer)
+
+  def _stacked_initializer(self, initializer):
+    # Initialize every layer as a [input_dim, units] kernel so that fan in and
+    # fan out are the ones of a single dense layer, with a new initializer per
+    # layer so that they do not share values.
+    def initialize(shape, dtype=None):
+      return tf.stack([
+          initializer.__class__.from_config(initializer.get_config())(
+              shape[1:], dtype=dtype) for _ in range(shape[0])
+      ])
+
+    return initialize
+
+  def build(self, input_shape):
+    input_dim = int(input_shape[-1])
+    self.kernel = self.add_weight(
+        "kernel",
+        shape=[self.num_stacked, input_dim, self.units],
+        initializer=self._stacked_initializer(self.kernel_initializer))
+    self.bias = self.add_weight(
+        "bias",
+        shape=[self.num_stacked, self.units],
+        initializer=self._stacked_initializer(self.bias_initializer))
+    super().build(input_shape)
+
+  def call(self, inputs):
+    return self.activation(
+        tf.matmul(inputs, self.kernel) + tf.expand_dims(self.bias, axis=1))
+
+  def call_one(self, inputs, i):
+    """Applies only the i-th layer to inputs of shape [batch, input_dim]."""
+    return self.activation(tf.matmul(inputs, self.kernel[i]) + self.bias[i])
+
+  def call_subset(self, inputs, indices):
+    """Applies the layers in indices to inputs of shape
+    [len(indices), batch, input_dim].
+    """
+    kernel = tf.gather(self.kernel, indices)
+    bias = tf.gather(self.bias, indices)
+    return self.activation(
+        tf.matmul(inputs, kernel) + tf.expand_dims(bias, axis=1))
+
+
+class CriticHead(tf.Module):
+  """View of one critic of a StackedCriticQ. It can be called and saved like a
+  single critic: its weights are the ones of a single critic network (kernel
+  and bias of every layer), stored as slices of the stacked weights.
+  """
+
+  def __init__(self, critic, index):
+    super().__init__(name="{}_{}".format(critic.name, index))
+    self._critic = critic
+    self._index = index
+
+  def __call__(self, inputs):
+    return self._critic.call_one(inputs, self._index)
+
+  def get_weights(self):
+    return [w[self._index].numpy() for w in self._critic.weights]
+
+  def set_weights(self, weights):
+    for w, v in zip(self._critic.weights, weights):
+      w[self._index].assign(v)
+
+
+class StackedCriticQ(tfk.Model):
+  """num_critics Q functions with the same architecture, evaluated together.
+  Calling it returns the Q values of all critics, of shape
+  [num_critics, ..., 1]. The cost of a call grows with the number of critics
+  only through the size of the batched matmuls.
+  """
+
+  def __init__(self,
+               num_critics,
+               dimo,
+               dimu,
+               max_u,
+               layer_sizes,
+               kernel_initializer="glorot_uniform",
+               bias_initializer="zeros",
+               output_kernel_initializer="glorot_uniform",
+               output_bias_initializer="zeros",
+               name="qf"):
+    super().__init__(name=name)
+
+    self._num_critics = num_critics
+    self._dimo = dimo
+    self._dimu = dimu
+    self._max_u = max_u
+
+    self._mlp_layers = []
+    for size in layer_sizes:
+      layer = StackedDense(num_critics,
+                           units=size,
+                           activation="relu",
+                           kernel_initializer=kernel_initializer,
+                           bias_initializer=bias_initializer)
+      self._mlp_layers.append(layer)
+    self._output_layer = StackedDense(
+        num_critics,
+        units=1,
+        kernel_initializer=output_kernel_initializer,
+        bias_initializer=output_bias_initializer)
+    # Create weights
+    self([tf.zeros([0, *self._dimo]), tf.zeros([0, *self._dimu])])
+
+  @property
+  def num_critics(self):
+    return self._num_critics
+
+  def get_heads(self):
+    """Returns a CriticHead for every critic."""
+    return [CriticHead(self, i) for i in range(self._num_critics)]
+
+  def _flatten_inputs(self, inputs):
+    o, u = inputs
+    res = tf.concat([o, u / self._max_u], axis=-1)
+    return tf.reshape(res, [-1, res.shape[-1]]), tf.shape(res)[:-1]
+
+  @tf.function
+  def call(self, inputs):
+    res, batch_shape = self._flatten_inputs(inputs)
+    res = tf.tile(tf.expand_dims(res, axis=0), [self._num_critics, 1, 1])
+    for l in self._mlp_layers:
+      res = l(res)
+    res = self._output_layer(res)
+    return tf.reshape(res, tf.concat([[self._num_critics], batch_shape, [1]],
+                                     axis=0))
+
+  @tf.function
+  def subset_min(self, inputs, subset_size):
+    """Minimum of the Q values of subset_size critics drawn at random, of shape
+    [..., 1] (REDQ target). Only the drawn critics are evaluated.
+    """
+    if subset_size >= self._num_critics:
+      return tf.reduce_min(self(inputs), axis=0)
+    indices = tf.random.shuffle(tf.range(self._num_critics))[:subset_size]
+    res, batch_shape = self._flatten_inputs(inputs)
+    res = tf.tile(tf.expand_dims(res, axis=0), [subset_size, 1, 1])
+    for l in self._mlp_layers:
+      res = l.call_subset(res, indices)
+    res = self._output_layer.call_subset(res, indices)
+    res = tf.reduce_min(res, axis=0)
+    return tf.reshape(res, tf.concat([batch_shape, [1]], axis=0))
+
+  @tf.function
+  def call_one(self, inputs, i):
+    """Q values of the i-th critic only, of shape [..., 1]."""
+    res, batch_shape = self._flatten_inputs(inputs)
+    for l in self._mlp_layers:
+      res = l.call_one(res, i)
+    res = self._output_layer.call_one(res, i)
+    return tf.reshape(res, tf.concat([batch_shape, [1]], axis=0))
@@ -6,8 +6,9 @@ import numpy as np
 import tensorflow as tf
 tfk = tf.keras
 
-from rlfd import memory, normalizer, policies
+from rlfd import memory, normalizer, policies, profiler
 from rlfd.agents import agent, td3_networks
+from rlfd.utils import tf_util
 
 
 class TD3(agent.Agent):
@@ -50,7 +51,12 @@ class TD3(agent.Agent):
       online_data_strategy,
       # replay buffer
       buffer_size,
-      info):
+      info,
+      # critic ensemble (REDQ when num_target_critics < num_critics)
+      num_critics=2,
+      num_target_critics=2,
+      # compile the training graphs with XLA
+      jit_compile=False):
     super().__init__(locals())
 
     self.dims = dims
@@ -80,6 +86,9 @@ class TD3(agent.Agent):
     self.action_l2 = action_l2
     self.soft_target_tau = soft_target_tau
     self.target_update_freq = target_update_freq
+    self.num_critics = num_critics
+    self.num_target_critics = num_target_critics
+    assert 1 <= self.num_target_critics <= self.num_critics
 
     self.norm_obs_online = norm_obs_online
     self.norm_obs_offline = norm_obs_offline
@@ -91,6 +100,7 @@ class TD3(agent.Agent):
     self.online_data_strategy = online_data_strategy
     assert self.online_data_strategy in ["None", "BC", "Shaping"]
     self.info = info
+    self.jit_compile = jit_compile
 
     self._create_memory()
     self._create_model()
@@ -137,27 +147,23 @@ class TD3(agent.Agent):
   def _initialize_critic(self):
     self._critic_o_norm = normalizer.Normalizer(self.dimo, self.norm_eps,
                                                 self.norm_clip)
-    self._criticq1 = td3_networks.Critic(self.dimo, self.dimu, self.max_u,
-                                         self.layer_sizes)
-    self._criticq1_target = td3_networks.Critic(self.dimo, self.dimu,
-                                                self.max_u, self.layer_sizes)
-    self._copy_weights(self._criticq1, self._criticq1_target, 1.0)
-
-    self._criticq2 = td3_networks.Critic(self.dimo, self.dimu, self.max_u,
-                                         self.layer_sizes)
-    self._criticq2_target = td3_networks.Critic(self.dimo, self.dimu,
-                                                self.max_u, self.layer_sizes)
-    self._copy_weights(self._criticq2, self._criticq2_target, 1.0)
+    # All critics are evaluated in one call, criticq1, criticq2, ... are views
+    # of a single critic for saving and pretrained critics.
+    self._criticq = td3_networks.EnsembleCritic(self.num_critics, self.dimo,
+                                                self.dimu, self.max_u,
+                                                self.layer_sizes)
+    self._criticq_target = td3_networks.EnsembleCritic(
+        self.num_critics, self.dimo, self.dimu, self.max_u, self.layer_sizes)
+    self._copy_weights(self._criticq, self._criticq_target, 1.0)
+    self._criticq1 = self._criticq.get_heads()[0]
 
     self._criticq_optimizer = tfk.optimizers.Adam(learning_rate=self.q_lr)
 
-    self._critic_models = {
-        "critic_o_norm": self._critic_o_norm,
-        "criticq1": self._criticq1,
-        "criticq2": self._criticq2,
-        "criticq1_target": self._criticq1_target,
-        "criticq2_target": self._criticq2_target,
-    }
+    self._critic_models = {"critic_o_norm": self._critic_o_norm}
+    for i, (head, target_head) in enumerate(
+        zip(self._criticq.get_heads(), self._criticq_target.get_heads())):
+      self._critic_models["criticq{}".format(i + 1)] = head
+      self._critic_models["criticq{}_target".format(i + 1)] = target_head
     self.save_model(self._critic_models)
 
   def _create_model(self):
@@ -217,17 +223,11 @@ class TD3(agent.Agent):
                            data_dir=None,
                            env=None,
                            shaping=None,
-                           pretrained_agent=None):
+                           pretrained_agent=None,
+                           offline_dataset=None):
     """Adds data to the offline replay buffer and add shaping"""
     # Offline data
-    # D4RL
-    experiences = env.get_dataset()  # T not fixed by assumption
-    if experiences:
-      self.offline_buffer.store(experiences)
-    # Ours
-    demo_file = osp.join(data_dir, "demo_data.npz")
-    if (not experiences) and osp.isfile(demo_file):
-      experiences = self.offline_buffer.load_from_file(data_file=demo_file)
+    experiences = self._load_offline_data(data_dir, env, offline_dataset)
     if self.norm_obs_offline:
       assert experiences, "Offline dataset does not exist."
       self._update_stats(experiences)
@@ -255,11 +255,20 @@ class TD3(agent.Agent):
   def before_online_hook(self):
     if self.use_pretrained_actor:
       for k, v in self._actor_models.items():
-        self._copy_weights(self.pretrained_agent.get_saved_model(k), v, 1.0)
+        v.set_weights(self.pretrained_agent.get_saved_model(k).get_weights())
 
     if self.use_pretrained_critic:
+      # heads beyond those of the pretrained agent keep their initialization
       for k, v in self._critic_models.items():
-        self._copy_weights(self.pretrained_agent.get_saved_model(k), v, 1.0)
+        if self.pretrained_agent.has_saved_model(k):
+          v.set_weights(self.pretrained_agent.get_saved_model(k).get_weights())
+
+  def set_hyperparameters(self, q_lr=None, pi_lr=None, **hyperparameters):
+    if q_lr is not None:
+      self._set_learning_rate("q_lr", q_lr, self._criticq_optimizer)
+    if pi_lr is not None:
+      self._set_learning_rate("pi_lr", pi_lr, self._actor_optimizer)
+    super(TD3, self).set_hyperparameters(**hyperparameters)
 
   def store_experiences(self, experiences):
     self.online_buffer.store(experiences)
@@ -284,7 +293,7 @@ class TD3(agent.Agent):
     batch = self._merge_batch_experiences(online_batch, offline_batch)
     return batch
 
-  def _td3_criticq_loss_graph(self, o, o_2, u, r, done, step):
+  def _td3_criticq_loss_graph(self, o, o_2, u, r, done, stats):
     # Add noise to target policy output
     noise = tf.random.normal(tf.shape(u), 0.0, self.policy_noise)
     noise = tf.clip_by_value(noise, -self.policy_noise_clip,
@@ -300,77 +309,69 @@ class TD3(agent.Agent):
       potential_curr = self.shaping.potential(o=o, u=u)
       potential_next = self.shaping.potential(o=o_2, u=u_2)
       target_q += (1.0 - done) * self.gamma * potential_next - potential_curr
+      stats.update("potential", potential_curr)
     # Q value from next state
-    target_next_q1 = self._criticq1_target([self._critic_o_norm(o_2), u_2])
-    target_next_q2 = self._criticq2_target([self._critic_o_norm(o_2), u_2])
-    target_next_min_q = tf.minimum(target_next_q1, target_next_q2)
+    target_next_min_q = self._criticq_target.subset_min(
+        [self._critic_o_norm(o_2), u_2], self.num_target_critics)
     target_q += (1.0 - done) * self.gamma * target_next_min_q
     target_q = tf.stop_gradient(target_q)
 
-    td_loss_q1 = self._huber_loss(target_q,
-                                  self._criticq1([self._critic_o_norm(o), u]))
-    td_loss_q2 = self._huber_loss(target_q,
-                                  self._criticq2([self._critic_o_norm(o), u]))
-    td_loss = td_loss_q1 + td_loss_q2
+    q = self._criticq([self._critic_o_norm(o), u])
+    td_loss = tf.reduce_sum(self._huber_loss(
+        tf.broadcast_to(target_q, tf.shape(q)), q),
+                            axis=0)
 
     criticq_loss = tf.reduce_mean(td_loss)
-    tf.summary.scalar(name='criticq_loss vs {}'.format(step.name),
-                      data=criticq_loss,
-                      step=step)
+    stats.update("criticq_loss", criticq_loss)
     return criticq_loss
 
-  def _td3_actor_loss_graph(self, o, u, step):
+  def _td3_actor_loss_graph(self, o, u, stats):
     pi = self._actor([self._actor_o_norm(o)])
     actor_loss = -tf.reduce_mean(self._criticq1([self._critic_o_norm(o), pi]))
     actor_loss += self.action_l2 * tf.reduce_mean(tf.square(pi / self.max_u))
     if self.online_data_strategy == "Shaping":
       actor_loss += -tf.reduce_mean(self.shaping.potential(o=o, u=pi))
     if self.online_data_strategy == "BC":
-      mask = np.concatenate(
-          (np.zeros(self.online_batch_size - self.offline_batch_size),
-           np.ones(self.offline_batch_size)),
-          axis=0)
-      demo_pi = tf.boolean_mask((pi), mask)
-      demo_u = tf.boolean_mask((u), mask)
+      # demonstrations are the last offline_batch_size transitions, sliced and
+      # masked with static shapes so that the graph can be compiled
+      demo_o = o[-self.offline_batch_size:]
+      demo_pi = pi[-self.offline_batch_size:]
+      demo_u = u[-self.offline_batch_size:]
       if self.bc_params["q_filter"]:
-        q_u = self._criticq1([self._critic_o_norm(o), u])
-        q_pi = self._criticq1([self._critic_o_norm(o), pi])
-        q_filter_mask = tf.reshape(tf.boolean_mask(q_u > q_pi, mask), [-1])
-        bc_loss = tf.reduce_mean(
-            tf.square(
-                tf.boolean_mask(demo_pi, q_filter_mask, axis=0) -
-                tf.boolean_mask(demo_u, q_filter_mask, axis=0)))
+        q_u = self._criticq1([self._critic_o_norm(demo_o), demo_u])
+        q_pi = self._criticq1([self._critic_o_norm(demo_o), demo_pi])
+        q_filter_mask = tf.cast(q_u > q_pi, tf.float32)
+        bc_loss = tf.math.divide_no_nan(
+            tf.reduce_sum(q_filter_mask * tf.square(demo_pi - demo_u)),
+            tf.reduce_sum(q_filter_mask) * np.prod(self.dimu))
       else:
         bc_loss = tf.reduce_mean(tf.square(demo_pi - demo_u))
       actor_loss = (self.bc_params["prm_loss_weight"] * actor_loss +
                     self.bc_params["aux_loss_weight"] * bc_loss)
-    tf.summary.scalar(name='actor_loss vs {}'.format(step.name),
-                      data=actor_loss,
-                      step=step)
+    stats.update("actor_loss", actor_loss)
     return actor_loss
 
-  @tf.function
-  def _train_online_graph(self, o, o_2, u, r, done):
+  @tf_util.compiled_method
+  def _train_online_graph(self, o, o_2, u, r, done, train_actor):
     # Train critic q
-    criticq_trainable_weights = (self._criticq1.trainable_weights +
-                                 self._criticq2.trainable_weights)
+    criticq_trainable_weights = self._criticq.trainable_weights
     with tf.GradientTape(watch_accessed_variables=False) as tape:
       tape.watch(criticq_trainable_weights)
       with tf.name_scope('OnlineLosses/'):
         criticq_loss = self._td3_criticq_loss_graph(o, o_2, u, r, done,
-                                                    self.online_training_step)
+                                                    self._online_stats)
     criticq_grads = tape.gradient(criticq_loss, criticq_trainable_weights)
     self._criticq_optimizer.apply_gradients(
         zip(criticq_grads, criticq_trainable_weights))
 
-    # Train actor
-    if self.online_training_step % self.policy_freq == 0:
+    # Train actor, train_actor is a python bool so that the graph with and the
+    # graph without the actor update are traced (and compiled) separately.
+    if train_actor:
       actor_trainable_weights = self._actor.trainable_weights
       with tf.GradientTape(watch_accessed_variables=False) as tape:
         tape.watch(actor_trainable_weights)
         with tf.name_scope('OnlineLosses/'):
-          actor_loss = self._td3_actor_loss_graph(o, u,
-                                                  self.online_training_step)
+          actor_loss = self._td3_actor_loss_graph(o, u, self._online_stats)
       actor_grads = tape.gradient(actor_loss, actor_trainable_weights)
       self._actor_optimizer.apply_gradients(
           zip(actor_grads, actor_trainable_weights))
@@ -378,21 +379,26 @@ class TD3(agent.Agent):
     self.online_training_step.assign_add(1)
 
   def train_online(self):
-    with tf.summary.record_if(lambda: self.online_training_step % 200 == 0):
-
+    with profiler.phase("sample"):
       batch = self.sample_batch()
 
+    with profiler.phase("convert"):
       o_tf = tf.convert_to_tensor(batch["o"], dtype=tf.float32)
       o_2_tf = tf.convert_to_tensor(batch["o_2"], dtype=tf.float32)
       u_tf = tf.convert_to_tensor(batch["u"], dtype=tf.float32)
       r_tf = tf.convert_to_tensor(batch["r"], dtype=tf.float32)
       done_tf = tf.convert_to_tensor(batch["done"], dtype=tf.float32)
 
-      self._train_online_graph(o_tf, o_2_tf, u_tf, r_tf, n_tf, done_tf)
-      if self.online_training_step % self.target_update_freq == 0:
+    with profiler.phase("graph"):
+      train_actor = bool(self.online_training_step % self.policy_freq == 0)
+      self._train_online_graph(o_tf, o_2_tf, u_tf, r_tf, done_tf, train_actor)
+    if self.online_training_step % self.target_update_freq == 0:
+      with profiler.phase("target_update"):
         self._copy_weights(self._actor, self._actor_target)
-        self._copy_weights(self._criticq1, self._criticq1_target)
-        self._copy_weights(self._criticq2, self._criticq2_target)
+        self._copy_weights(self._criticq, self._criticq_target)
+    if self.online_training_step % 200 == 0:
+      with profiler.phase("summary"):
+        self._online_stats.flush(self.online_training_step)
 
   def _copy_weights(self, source, target, soft_target_tau=None):
     soft_target_tau = (soft_target_tau
@@ -1,5 +1,7 @@
 import tensorflow as tf
 
+from rlfd.agents import stacked_networks
+
 tfk = tf.keras
 tfl = tfk.layers
 
@@ -60,3 +62,19 @@ class Critic(tfk.Model):
       res = l(res)
     res = self._output_layer(res)
     return res
+
+
+class EnsembleCritic(stacked_networks.StackedCriticQ):
+  """num_critics Critic networks with stacked weights, evaluated in one call."""
+
+  def __init__(self, num_critics, dimo, dimu, max_u, layer_sizes, name="q"):
+    super().__init__(num_critics,
+                     dimo,
+                     dimu,
+                     max_u,
+                     layer_sizes,
+                     kernel_initializer="glorot_normal",
+                     bias_initializer="zeros",
+                     output_kernel_initializer="glorot_normal",
+                     output_bias_initializer="zeros",
+                     name=name)
@@ -1,13 +1,15 @@
 import json
+import multiprocessing
 import os
-import pickle
+import shutil
 import sys
 osp = os.path
 
 import numpy as np
 import tensorflow as tf
 
-from rlfd import train
+from rlfd import agents, train
+from rlfd.utils import shard_util
 from rlfd.utils.util import set_global_seeds
 
 DEFAULT_PARAMS = {
@@ -20,7 +22,49 @@ DEFAULT_PARAMS = {
 }
 
 
-def main(policy, root_dir, **kwargs):
+def _episode_seed(seed, episode):
+  return int(np.random.SeedSequence([seed, episode]).generate_state(1)[0])
+
+
+def _generate_shard(policy_file, params, shard_dir, first_episode,
+                    num_episodes):
+  """Streams episodes [first_episode, first_episode + num_episodes) into the
+  shard in shard_dir, resuming after the episodes already in it. Every episode
+  is seeded by its index so that the demonstrations do not depend on the
+  number of workers.
+  """
+  policy = agents.load_policy(policy_file)
+
+  env_params = params.copy()
+  env_params["env_name"] = policy.info["env_name"]
+  env_params["r_scale"] = policy.info["r_scale"]
+  env_params["r_shift"] = policy.info["r_shift"]
+  env_params["env_args"] = policy.info["env_args"]
+  make_env, _ = train.get_env_constructor_and_config(params=env_params)
+
+  writer = shard_util.ShardWriter(shard_dir)
+  if params["num_steps"] != None:
+    # a single rollout of num_steps steps
+    driver_params = dict(num_steps=params["num_steps"], num_episodes=None)
+  else:
+    driver_params = dict(num_steps=None, num_episodes=1)
+  driver = train.config_driver(params["fix_T"],
+                               params["seed"],
+                               make_env=make_env,
+                               policy=policy.eval_policy,
+                               render=params["render"],
+                               **driver_params)
+  for episode in range(first_episode + writer.num_episodes,
+                       first_episode + num_episodes):
+    seed = _episode_seed(params["seed"], episode)
+    set_global_seeds(seed)
+    driver.seed(seed)
+    driver.done = True  # start from a fresh episode
+    writer.append(driver.generate_rollouts())
+  writer.close()
+
+
+def main(policy, root_dir, num_workers=1, **kwargs):
   """Generate demo from policy file"""
 
   # Get default params from config and update params.
@@ -35,25 +79,34 @@ def main(policy, root_dir, **kwargs):
     with open(param_file, "w") as f:
       json.dump(env_params, f)
 
-  set_global_seeds(env_params["seed"])
-
-  with open(policy, "rb") as f:
-    policy = pickle.load(f)
-
   filename = env_params.pop("filename")
 
-  params = env_params.copy()
-  params["env_name"] = policy.info["env_name"]
-  params["r_scale"] = policy.info["r_scale"]
-  params["r_shift"] = policy.info["r_shift"]
-  params["env_args"] = policy.info["env_args"]
-  make_env, _ = train.get_env_constructor_and_config(params=params)
-  eval_driver = train.config_driver(make_env=make_env,
-                                    policy=policy.eval_policy,
-                                    **env_params)
+  if env_params["num_steps"] != None:
+    num_episodes, num_workers = 1, 1
+  else:
+    num_episodes = env_params["num_episodes"]
+    num_workers = max(min(num_workers, num_episodes), 1)
+  if env_params["render"]:
+    num_workers = 1
 
-  episode = eval_driver.generate_rollouts()
+  # Contiguous ranges of episodes, one shard per worker. Shards are resumed if
+  # generation was interrupted, and removed once merged.
+  shard_root = osp.join(
+      root_dir, filename + ".shards",
+      "seed_{}_episodes_{}_workers_{}".format(env_params["seed"], num_episodes,
+                                              num_workers))
+  bounds = np.linspace(0, num_episodes, num_workers + 1).astype(int)
+  tasks = [(policy, env_params, osp.join(shard_root, "shard_{}".format(i)),
+            int(bounds[i]), int(bounds[i + 1] - bounds[i]))
+           for i in range(num_workers)]
+  if num_workers == 1:
+    _generate_shard(*tasks[0])
+  else:
+    with multiprocessing.get_context("spawn").Pool(num_workers) as pool:
+      pool.starmap(_generate_shard, tasks, chunksize=1)
 
   os.makedirs(root_dir, exist_ok=True)
-  np.savez_compressed(osp.join(root_dir, filename), **episode)  # save the file
-  print("Demo file has been stored into {}.".format(filename))
\ No newline at end of file
+  shard_util.merge_shards([task[2] for task in tasks],
+                          osp.join(root_dir, filename))
+  shutil.rmtree(osp.join(root_dir, filename + ".shards"))
+  print("Demo file has been stored into {}.".format(filename))
@@ -5,6 +5,8 @@ from collections import deque
 import numpy as np
 import tensorflow as tf
 
+from rlfd import profiler
+
 
 class Driver(object, metaclass=abc.ABCMeta):
 
@@ -62,6 +64,7 @@ class StepBasedDriver(Driver):
       return None
 
     experiences = {k: [] for k in ("o", "o_2", "u", "r", "done")}
+    resets, infos = [], []
 
     current_step = 0
     current_episode = 0
@@ -71,21 +74,18 @@ class StepBasedDriver(Driver):
       if self.done or (self.curr_eps_step == self.eps_length):
         self.done = False
         self.curr_eps_step = 0
-        self.o = self.env.reset()
-      u = self.policy(self.o)
+        with profiler.phase("env_reset"):
+          self.o = self.env.reset()
+      with profiler.phase("policy"):
+        u = self.policy(self.o)
       # compute new states and observations
-      o_2, r, self.done, info = self.env.step(u)
+      with profiler.phase("env_step"):
+        o_2, r, self.done, info = self.env.step(u)
       if self.render:
         self.env.render()
 
-      for observer in observers:
-        observer(o=self.o,
-                 o_2=o_2,
-                 u=u,
-                 r=r,
-                 done=self.done,
-                 info=info,
-                 reset=self.done or (self.curr_eps_step + 1 == self.eps_length))
+      resets.append(self.done or (self.curr_eps_step + 1 == self.eps_length))
+      infos.append(info)
 
       experiences["o"].append(self.o)
       experiences["o_2"].append(o_2)
@@ -103,6 +103,11 @@ class StepBasedDriver(Driver):
     for key, value in experiences.items():
       experiences[key] = np.array(value).reshape(len(value), -1)
 
+    # Observers see all steps of this call at once.
+    with profiler.phase("observers"):
+      for observer in observers:
+        observer.call_batch(info=infos, reset=np.array(resets), **experiences)
+
     return experiences
 
 
@@ -129,3 +134,109 @@ class EpisodeBasedDriver(StepBasedDriver):
         for k, v in experiences.items()
     }
     return experiences
+
+
+class VectorStepBasedDriver(Driver):
+  """Driver of a vector environment (see env_manager.EnvManager.get_vec_env)
+  that steps all of its environments together, with one policy call per step.
+  num_steps counts the steps of all environments.
+
+  Experiences are returned with the steps of every environment contiguous.
+  Observers see the steps of every episode at once when it ends, so that
+  metrics written for the consecutive steps of a single environment apply.
+  """
+
+  def __init__(self,
+               make_env,
+               policy,
+               num_steps=None,
+               num_episodes=None,
+               render=False):
+    super().__init__(make_env=make_env, policy=policy, render=render)
+
+    self.env = make_env()
+    assert (any([num_steps == None, num_episodes == None]) and
+            not all([num_steps == None, num_episodes == None]))
+    self.num_steps = num_steps
+    self.num_episodes = num_episodes
+    self.num_envs = self.env.num_envs
+    self.eps_length = self.env.eps_length
+
+    self.done = True  # start new episodes in all environments
+    self.curr_eps_step = np.zeros(self.num_envs, dtype=np.int64)
+
+  def seed(self, seed):
+    """Set seed for environments, environment i gets seed + i"""
+    self.env.seed(seed)
+
+  def generate_rollouts(self, observers=()):
+    """generate at least `num_steps` steps or `num_episodes` episodes"""
+
+    # Special case for 0 step/episode.
+    if not self.num_steps and not self.num_episodes:
+      return None
+
+    if self.done:
+      self.done = False
+      self.curr_eps_step[:] = 0
+      # steps of the unfinished episodes, not seen by the observers yet
+      self._episodes = [[] for _ in range(self.num_envs)]
+      with profiler.phase("env_reset"):
+        self.o = self.env.reset()
+
+    keys = ("o", "o_2", "u", "r", "done")
+    experiences = {k: [] for k in keys}
+    finished = []
+
+    current_step = 0
+    current_episode = 0
+    while ((self.num_steps != None and current_step < self.num_steps) or
+           (self.num_episodes != None and current_episode < self.num_episodes)):
+      with profiler.phase("policy"):
+        u = self.policy(self.o)
+      with profiler.phase("env_step"):
+        o_2, r, done, info = self.env.step(u)
+      if self.render:
+        self.env.render()
+
+      self.curr_eps_step += 1
+      reset = np.logical_or(done, self.curr_eps_step == self.eps_length)
+      step = dict(o=self.o, o_2=o_2, u=u, r=r, done=done)
+      for k in keys:
+        experiences[k].append(step[k])
+      for i in range(self.num_envs):
+        self._episodes[i].append(
+            ({k: v[i] for k, v in step.items()},
+             {k: v[i] for k, v in info.items()}, reset[i]))
+
+      current_step += self.num_envs
+      ended = np.flatnonzero(reset)
+      current_episode += ended.shape[0]
+      for i in ended:
+        finished.extend(self._episodes[i])
+        self._episodes[i] = []
+      self.curr_eps_step[ended] = 0
+      if ended.shape[0] > 0:
+        with profiler.phase("env_reset"):
+          self.o = self.env.reset(indices=ended)
+      else:
+        self.o = o_2
+
+    # [steps, envs, ...] to the steps of every environment one after the other
+    for key, value in experiences.items():
+      value = np.swapaxes(np.array(value), 0, 1)
+      experiences[key] = value.reshape(value.shape[0] * value.shape[1], -1)
+
+    with profiler.phase("observers"):
+      if finished:
+        steps, infos, resets = zip(*finished)
+        transitions = {
+            k: np.array([s[k] for s in steps]).reshape(len(steps), -1)
+            for k in keys
+        }
+        for observer in observers:
+          observer.call_batch(info=list(infos),
+                              reset=np.array(resets),
+                              **transitions)
+
+    return experiences
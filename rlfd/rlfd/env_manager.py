@@ -1,4 +1,8 @@
+import hashlib
+import importlib.util
+import json
 import os
+osp = os.path
 
 import numpy as np
 import gym
@@ -7,59 +11,120 @@ from gym import spaces
 
 import d4rl
 import gym_rlfd
+from gym_rlfd import vec_env
+
+from rlfd.utils import dataset_util
+from rlfd.utils.util import get_cache_dir
+
+# Env specs already loaded by this process, keyed by env name and arguments.
+_ENV_SPECS = {}
+
+
+def _remove_time_limit(env):
+  """Returns the environment without its top-level TimeLimit wrapper and the
+  max episode length.
+  """
+  if "_max_episode_steps" in env.__dict__:
+    eps_length = env._max_episode_steps
+  elif "max_path_length" in env.__dict__:
+    eps_length = env.max_path_length
+  else:
+    raise RuntimeError("max episode length unknown.")
+  if isinstance(env, gym.wrappers.TimeLimit):
+    env = env.env
+    env_ = env
+    while isinstance(env_, gym.Wrapper):
+      if isinstance(env_, gym.wrappers.TimeLimit):
+        raise ValueError("Can remove only top-level TimeLimit gym.Wrapper.")
+      env_ = env_.env
+  return env, eps_length
 
 
 class EnvWrapper:
   """Wrapper of the environment that does the following:
     1. adjust rewards: r = (r + r_shift) / r_scale
     2. modify state to contain: observation, achieved_goal, desired_goal
+
+  If env_spec is given, the environment is only created when it is first used.
   """
 
-  def __init__(self, make_env, r_scale, r_shift):
-    self.env = make_env()
+  def __init__(self, make_env, r_scale, r_shift, env_spec=None):
+    self.make_env = make_env
     self.r_scale = r_scale
     self.r_shift = r_shift
-    if "_max_episode_steps" in self.env.__dict__:
-      self.eps_length = self.env._max_episode_steps
-    elif "max_path_length" in self.env.__dict__:
-      self.eps_length = self.env.max_path_length
-    else:
-      raise RuntimeError("max episode length unknown.")
-    if isinstance(self.env, gym.wrappers.TimeLimit):
-      self.env = self.env.env
-      env_ = self.env
-      while isinstance(env_, gym.Wrapper):
-        if isinstance(env_, gym.wrappers.TimeLimit):
-          raise ValueError("Can remove only top-level TimeLimit gym.Wrapper.")
-          env_ = env_.env
+    self._env = None
+    self._seed = None
+    if env_spec is None:
+      env_spec = self._make_spec()
+    self.env_spec = env_spec
     # need the following properties
-    self.action_space = self.env.action_space
-    self.observation_space = self.env.observation_space
-    self.max_u = self.action_space.high[0]
+    self.env_name = env_spec["env_name"]
+    self.eps_length = env_spec["eps_length"]
+    self.max_u = env_spec["max_u"]
+    self.has_dataset = env_spec["has_dataset"]
+
+  @property
+  def env(self):
+    if self._env is None:
+      self._env, _ = _remove_time_limit(self.make_env())
+      if self._seed is not None:
+        self._env.seed(self._seed)
+    return self._env
+
+  @property
+  def action_space(self):
+    return self.env.action_space
+
+  @property
+  def observation_space(self):
+    return self.env.observation_space
+
+  def _make_spec(self):
+    env = self.make_env()
+    env_name = env.spec.id if env.spec is not None else None
+    self._env, eps_length = _remove_time_limit(env)
+    return dict(env_name=env_name,
+                eps_length=eps_length,
+                max_u=float(self.action_space.high[0]),
+                dims=dict(o=self.observation_space.shape,
+                          u=self.action_space.shape),
+                has_dataset=hasattr(self.env, "get_dataset"))
 
   def reset(self, **kwargs):
     state = self.env.reset(**kwargs)
     return self._transform_state(state)
 
   def get_dataset(self):
-    """This is for d4rl environments only"""
+    """This is for d4rl environments only
+
+    The dataset is converted once per task and memory-mapped read-only from the
+    cache afterwards, so the returned arrays must not be modified in place.
+    """
     # observations, actions, rewards, terminals
-    try:
+    if not self.has_dataset:
+      return None
+    if self.env_name is None:
       dataset = self.env.get_dataset()
-      dataset = dict(o=dataset["observations"][:-1],
-                     o_2=dataset["observations"][1:],
-                     u=dataset["actions"][:-1],
-                     r=dataset["rewards"][:-1].reshape((-1, 1)),
-                     done=dataset["terminals"][:-1].reshape((-1, 1)))
-    except AttributeError:
-      dataset = None
+    else:
+      keys = ("observations", "actions", "rewards", "terminals")
+      dataset = dataset_util.load_dataset(
+          self.env_name,
+          lambda: {k: v for k, v in self.env.get_dataset().items() if k in keys})
+    dataset = dict(o=dataset["observations"][:-1],
+                   o_2=dataset["observations"][1:],
+                   u=dataset["actions"][:-1],
+                   r=dataset["rewards"][:-1].reshape((-1, 1)),
+                   done=dataset["terminals"][:-1].reshape((-1, 1)))
     return dataset
 
   def render(self, **kwargs):
     return self.env.render(**kwargs)
 
   def seed(self, seed=0):
-    return self.env.seed(seed)
+    if self._env is None:  # applied once the environment is created
+      self._seed = seed
+      return [seed]
+    return self._env.seed(seed)
 
   def step(self, action):
     state, r, done, info = self.env.step(action)
@@ -67,7 +132,8 @@ class EnvWrapper:
     return self._transform_state(state), r, done, info
 
   def close(self):
-    return self.env.close()
+    if self._env is not None:
+      return self._env.close()
 
   def _transform_state(self, state):
     return state
@@ -75,18 +141,19 @@ class EnvWrapper:
 
 class NoGoalEnvWrapper(EnvWrapper):
 
-  def __init__(self, make_env, r_scale, r_shift):
-    super().__init__(make_env, r_scale, r_shift)
-
-    if type(self.observation_space) is spaces.Dict:
-      assert len(self.observation_space["desired_goal"].low.shape) == 1
-      assert len(self.observation_space["observation"].low.shape) == 1
-      shape = (self.observation_space["observation"].high.shape[0] +
-               self.observation_space["desired_goal"].high.shape[0],)
-      self.observation_space = spaces.Box(-np.inf,
-                                          np.inf,
-                                          shape=shape,
-                                          dtype="float32")
+  @property
+  def observation_space(self):
+    observation_space = self.env.observation_space
+    if type(observation_space) is spaces.Dict:
+      assert len(observation_space["desired_goal"].low.shape) == 1
+      assert len(observation_space["observation"].low.shape) == 1
+      shape = (observation_space["observation"].high.shape[0] +
+               observation_space["desired_goal"].high.shape[0],)
+      observation_space = spaces.Box(-np.inf,
+                                     np.inf,
+                                     shape=shape,
+                                     dtype="float32")
+    return observation_space
 
   def _transform_state(self, state):
     """
@@ -97,6 +164,46 @@ class NoGoalEnvWrapper(EnvWrapper):
     return state
 
 
+class VecEnvWrapper(EnvWrapper):
+  """EnvWrapper of a vector environment (see gym_rlfd.vec_env), observations,
+  rewards and dones have the environments along their first dimension. Episode
+  lengths are not limited by the environment, drivers end episodes after
+  eps_length steps.
+  """
+
+  @property
+  def env(self):
+    if self._env is None:
+      self._env = self.make_env()
+      if self._seed is not None:
+        self._env.seed(self._seed)
+    return self._env
+
+  @property
+  def num_envs(self):
+    return self.env.num_envs
+
+
+def _env_code_version(env_name):
+  """Identifies the code behind an environment: the gym and d4rl versions and
+  the entry point module of the environment with its modification time.
+  """
+  entry_point = gym.spec(env_name).entry_point
+  mtime = None
+  if isinstance(entry_point, str):
+    module_spec = importlib.util.find_spec(entry_point.split(":")[0])
+    if module_spec is not None and module_spec.origin and osp.isfile(
+        module_spec.origin):
+      mtime = os.stat(module_spec.origin).st_mtime_ns
+  else:
+    entry_point = "{}.{}".format(entry_point.__module__,
+                                 entry_point.__qualname__)
+  return dict(gym=gym.__version__,
+              d4rl=getattr(d4rl, "__version__", None),
+              entry_point=entry_point,
+              entry_point_mtime=mtime)
+
+
 class EnvManager:
 
   def __init__(self, env_name, env_args={}, r_scale=1, r_shift=0.0):
@@ -107,22 +214,81 @@ class EnvManager:
     #                  YWPegInHole2D-v0
     if self.make_env is None and gym is not None:
       try:
-        gym.make(env_name, **env_args)
+        gym.spec(env_name)
         self.make_env = lambda: gym.make(env_name, **env_args)
-      except gym.error.UnregisteredEnv:
+      except gym.error.Error:
         pass
 
     if self.make_env is None:
       raise NotImplementedError
 
+    self.env_name = env_name
+    self.env_args = env_args
+    # The following line concatenates o and g.
+    # self.env_wrapper = NoGoalEnvWrapper
+    self.env_wrapper = EnvWrapper
+
     # Add extra properties on the environment.
     self.r_scale = r_scale
     self.r_shift = r_shift
 
+  def get_env_spec(self):
+    """Returns eps_length, max_u and dims of the environment. The spec is stored
+    on disk per env name, arguments and version of the environment code (see
+    _env_code_version) so that it can be answered without building the
+    simulator.
+    """
+    key = json.dumps(dict(env_name=self.env_name,
+                          env_args=self.env_args,
+                          wrapper=self.env_wrapper.__name__,
+                          code=_env_code_version(self.env_name)),
+                     sort_keys=True)
+    if key not in _ENV_SPECS:
+      spec_file = osp.join(
+          get_cache_dir("env_specs"), "{}-{}.json".format(
+              self.env_name,
+              hashlib.sha1(key.encode()).hexdigest()[:16]))
+      if osp.isfile(spec_file):
+        with open(spec_file, "r") as f:
+          env_spec = json.load(f)
+      else:
+        env = self.env_wrapper(self.make_env, self.r_scale, self.r_shift)
+        env_spec = env.env_spec
+        tmp_file = "{}.tmp-{}".format(spec_file, os.getpid())
+        with open(tmp_file, "w") as f:
+          json.dump(env_spec, f)
+        os.replace(tmp_file, spec_file)
+        env.close()
+      env_spec["dims"] = {
+          k: None if v is None else tuple(v)
+          for k, v in env_spec["dims"].items()
+      }
+      _ENV_SPECS[key] = env_spec
+    return _ENV_SPECS[key]
+
   def get_env(self):
-    return EnvWrapper(self.make_env, self.r_scale, self.r_shift)
-    # The following line concatenates o and g.
-    # return NoGoalEnvWrapper(self.make_env, self.r_scale, self.r_shift)
+    return self.env_wrapper(self.make_env,
+                            self.r_scale,
+                            self.r_shift,
+                            env_spec=self.get_env_spec())
+
+  def get_vec_env(self, num_envs):
+    """Returns num_envs copies of the environment as a VecEnvWrapper. Copies of
+    environments with a batched implementation (gym_rlfd.make_vec_env) are
+    stepped together, others one after the other.
+    """
+
+    def make_vec_env():
+      env = gym_rlfd.make_vec_env(self.env_name, num_envs, **self.env_args)
+      if env is None:
+        env = vec_env.SerialVecEnv(
+            lambda: _remove_time_limit(self.make_env())[0], num_envs)
+      return env
+
+    return VecEnvWrapper(make_vec_env,
+                         self.r_scale,
+                         self.r_shift,
+                         env_spec=self.get_env_spec())
 
 
 if __name__ == "__main__":
@@ -1,37 +1,202 @@
-import os
+"""Evaluation of the policies matching a glob, e.g. every online_policy_*.pkl of
+a sweep, in a pool of processes.
+
+Every policy runs the same episodes: episode i is seeded by the seed and i, so
+returns can be compared across policies and do not depend on the number of
+workers. The episodes of a policy run on num_envs environments in lockstep,
+the actions of all running environments are computed in one policy call.
+
+Policies with the same agent class and init args (e.g. the policies of a
+trial) share one agent per worker, only their weights are loaded, so graphs
+are built and traced once per group instead of once per policy.
+
+Results (one row per policy) are written to a csv file.
+"""
+import csv
+import glob
+import multiprocessing
 import pickle
-import sys
 
 import numpy as np
 import tensorflow as tf
 
 from rlfd import train
+from rlfd.agents import agent as agent_lib
+from rlfd.shapings import shaping as shaping_lib
+from rlfd.utils import artifact_util
 from rlfd.utils.util import set_global_seeds
 
 DEFAULT_PARAMS = {
-    "fix_T": False,
     "seed": 0,
-    "num_steps": None,
     "num_episodes": 10,
-    "render": True,
+    "num_envs": 1,
 }
 
+FIELDS = ("policy", "num_episodes", "average_return", "std_return",
+          "average_length", "success_rate")
+
+# Agents and environments of a worker process, see _evaluate_policy.
+_AGENTS = {}
+_ENVS = {}
+
+
+class _AgentState(object):
+  """Unpickled in place of an agent, keeps its state without building it."""
+  agent_class = None
+
+  def __setstate__(self, state):
+    self.state = state
+
+
+class _Ignored(object):
+  """Unpickled in place of the shaping, which evaluation does not use."""
+
+  def __setstate__(self, state):
+    pass
+
+
+def _ignore_referenced(path, relpath):
+  return None
+
+
+class _PolicyUnpickler(pickle.Unpickler):
+
+  def find_class(self, module, name):
+    cls = super().find_class(module, name)
+    if cls is agent_lib._load_referenced:
+      return _ignore_referenced
+    if isinstance(cls, type) and issubclass(
+        cls, (shaping_lib.EnsembleShaping, shaping_lib.Shaping)):
+      return _Ignored
+    if isinstance(cls, type) and issubclass(cls, agent_lib.Agent):
+      return type(name, (_AgentState,), dict(agent_class=cls))
+    return cls
+
+
+def _load_state(policy_file):
+  """Returns the agent class and state pickled in policy_file."""
+  with open(artifact_util.resolve(policy_file), "rb") as f:
+    agent_state = _PolicyUnpickler(f).load()
+  return agent_state.agent_class, agent_state.state
+
+
+def _episode_seed(seed, episode):
+  return int(np.random.SeedSequence([seed, episode]).generate_state(1)[0])
+
+
+def _get_agent(agent_class, state):
+  """Agent of the group of the policy with state, holding its weights."""
+  weights = dict(tf_var=state.pop("tf_var"), tf_model=state.pop("tf_model"))
+  # agents that pickle their shaping expect the key, not the (ignored) value
+  has_shaping = "shaping" in state
+  state.pop("shaping", None)
+  key = (agent_class.__name__, repr(sorted(state.items())))
+  if not key in _AGENTS:
+    agent = agent_class.__new__(agent_class)
+    if has_shaping:
+      state["shaping"] = None
+    agent.__setstate__(dict(state, tf_var={}, tf_model={}))
+    _AGENTS[key] = agent
+  _AGENTS[key].set_weights(weights)
+  return _AGENTS[key]
+
+
+def _get_envs(info, num_envs):
+  key = (repr(sorted(info.items())), num_envs)
+  if not key in _ENVS:
+    params = dict(env_name=info["env_name"],
+                  r_scale=info["r_scale"],
+                  r_shift=info["r_shift"],
+                  env_args=info["env_args"])
+    make_env, _ = train.get_env_constructor_and_config(params=params)
+    _ENVS[key] = [make_env() for _ in range(num_envs)]
+  return _ENVS[key]
+
+
+def _run_episodes(policy, envs, seeds, render):
+  """Runs one episode per seed, returns their returns, lengths and successes
+  (None for environments without is_success) in the order of seeds.
+  """
+  episodes = list(enumerate(seeds))
+  results = [None] * len(seeds)
+  o = [None] * len(envs)
+  running = [None] * len(envs)  # episode, return and length
+  for i, env in enumerate(envs):
+    if episodes:
+      episode, seed = episodes.pop(0)
+      env.seed(seed)
+      o[i], running[i] = env.reset(), [episode, 0.0, 0]
+  while any(running):
+    active = [i for i, r in enumerate(running) if r]
+    u = policy(np.stack([o[i] for i in active]))
+    for j, i in enumerate(active):
+      o[i], r, done, info = envs[i].step(u[j])
+      if render and i == 0:
+        envs[i].render()
+      running[i][1] += float(np.squeeze(r))
+      running[i][2] += 1
+      if done or running[i][2] == envs[i].eps_length:
+        episode, episode_return, length = running[i]
+        results[episode] = (episode_return, length, info.get("is_success"))
+        running[i] = None
+        if episodes:
+          episode, seed = episodes.pop(0)
+          envs[i].seed(seed)
+          o[i], running[i] = envs[i].reset(), [episode, 0.0, 0]
+  return results
+
+
+def _evaluate_policy(policy_file, params, render=False):
+  agent_class, state = _load_state(policy_file)
+  envs = _get_envs(state["info"], params["num_envs"])
+  agent = _get_agent(agent_class, state)
+  seeds = [
+      _episode_seed(params["seed"], episode)
+      for episode in range(params["num_episodes"])
+  ]
+  set_global_seeds(params["seed"])
+  results = _run_episodes(agent.eval_policy, envs, seeds, render)
+  returns, lengths, successes = zip(*results)
+  successes = [float(s) for s in successes if s is not None]
+  return dict(policy=policy_file,
+              num_episodes=len(results),
+              average_return=np.mean(returns),
+              std_return=np.std(returns),
+              average_length=np.mean(lengths),
+              success_rate=np.mean(successes) if successes else "")
+
+
+def _initialize_worker():
+  # Workers share the cpus, rollouts are dominated by the environments.
+  tf.config.set_visible_devices([], "GPU")
 
-def main(policy, **kwargs):
-  env_params = DEFAULT_PARAMS.copy()
 
-  set_global_seeds(env_params["seed"])
+def main(policy, output, num_workers=1, **kwargs):
+  """Evaluates the policies matching the glob policy, writes the results to
+  output. A single policy is evaluated in this process and rendered.
+  """
+  params = DEFAULT_PARAMS.copy()
+  params.update({k: v for k, v in kwargs.items() if k in params})
 
-  with open(policy, "rb") as f:
-    policy = pickle.load(f)
+  policy_files = sorted(glob.glob(policy))
+  assert policy_files, "No policy matches {}.".format(policy)
+  if len(policy_files) == 1:
+    results = [_evaluate_policy(policy_files[0], params, render=True)]
+  else:
+    # policies of the same trial are next to each other
+    num_workers = max(min(num_workers, len(policy_files)), 1)
+    with multiprocessing.get_context("spawn").Pool(
+        num_workers, initializer=_initialize_worker) as pool:
+      results = pool.starmap(_evaluate_policy,
+                             [(f, params) for f in policy_files],
+                             chunksize=1)
 
-  params = env_params.copy()
-  params["env_name"] = policy.info["env_name"]
-  params["r_scale"] = policy.info["r_scale"]
-  params["r_shift"] = policy.info["r_shift"]
-  params["env_args"] = policy.info["env_args"]
-  make_env, _ = train.get_env_constructor_and_config(params=params)
-  eval_driver = train.config_driver(make_env=make_env,
-                                    policy=policy.eval_policy,
-                                    **env_params)
-  eval_driver.generate_rollouts()
\ No newline at end of file
+  with open(output, "w", newline="") as f:
+    writer = csv.DictWriter(f, fieldnames=FIELDS)
+    writer.writeheader()
+    writer.writerows(results)
+  for result in sorted(results, key=lambda r: -r["average_return"]):
+    print("{:>12.3f} +- {:<10.3f} {}".format(result["average_return"],
+                                            result["std_return"],
+                                            result["policy"]))
+  print("Results have been stored into {}.".format(output))
@@ -0,0 +1,212 @@
+"""Evaluation of the agent in a pool of background processes.
+
+Every evaluation is a snapshot of the agent weights together with the values
+of the steps its summaries are written against. The episodes of an evaluation
+run in parallel, each with its own seed derived from the evaluation seed, the
+evaluation index and the episode index, so results do not depend on the number
+of workers. Results are fed to the observers and summarized in the order the
+evaluations were submitted.
+"""
+import multiprocessing
+import pickle
+
+import numpy as np
+import tensorflow as tf
+
+from rlfd import drivers, env_manager
+
+# Evaluation state of a worker process, see _initialize_worker.
+_WORKER = None
+
+
+class _Recorder(object):
+  """Observer that keeps the transitions passed to it by a driver."""
+
+  def __init__(self):
+    self.transitions = None
+
+  def call_batch(self, **transitions):
+    self.transitions = transitions
+
+
+class _FrozenStepMetric(object):
+  """Value of a step metric at the time an evaluation was submitted."""
+
+  def __init__(self, name, value):
+    self.name = name
+    self._value = value
+
+  def result(self):
+    return self._value
+
+
+class _Worker(object):
+
+  def __init__(self, agent, make_env, fix_T):
+    self.agent = agent
+    driver = drivers.EpisodeBasedDriver if fix_T else drivers.StepBasedDriver
+    self.driver = driver(make_env=make_env,
+                         policy=agent.eval_policy,
+                         num_episodes=1)
+    self.evaluation = None
+
+  def run(self, seed, num_steps, num_episodes):
+    """Runs num_steps or num_episodes from a fresh episode seeded with seed."""
+    self.driver.num_steps = num_steps
+    self.driver.num_episodes = num_episodes
+    self.driver.done = True
+    self.driver.seed(seed)
+    recorder = _Recorder()
+    self.driver.generate_rollouts(observers=[recorder])
+    return recorder.transitions
+
+
+def _initialize_worker(agent, env_config, fix_T):
+  global _WORKER
+  # Evaluation does not compete with training for the GPUs.
+  tf.config.set_visible_devices([], "GPU")
+  manager = env_manager.EnvManager(**env_config)
+  _WORKER = _Worker(pickle.loads(agent), manager.get_env, fix_T)
+
+
+def _run(evaluation, weights, seed, num_steps, num_episodes):
+  if _WORKER.evaluation != evaluation:
+    _WORKER.agent.set_weights(weights)
+    _WORKER.evaluation = evaluation
+  # only in workers, in the training process it would reseed training
+  tf.random.set_seed(seed)
+  return _WORKER.run(seed, num_steps, num_episodes)
+
+
+class Evaluator(object):
+
+  def __init__(self,
+               agent,
+               env_config,
+               make_env,
+               seed,
+               fix_T=False,
+               num_steps=None,
+               num_episodes=None,
+               num_workers=0):
+    """
+    Runs the eval policy of agent in num_workers processes, or in this process
+    (blocking) if num_workers is 0. Environments are seeded the same way in
+    both, tensorflow only in the workers: evaluations in this process draw from
+    the random ops of training and do not reset them.
+
+    Args:
+        agent       (Agent)    - agent to evaluate, its weights are copied at every evaluation
+        env_config  (dict)     - arguments of env_manager.EnvManager to create environments in workers
+        make_env    (function) - creates an environment in this process
+        seed        (int)      - seed of the evaluations
+        fix_T       (bool)     - run episodes of fixed length (drivers.EpisodeBasedDriver)
+        num_steps   (int)      - number of steps per evaluation
+        num_episodes(int)      - number of episodes per evaluation (exclusive with num_steps)
+        num_workers (int)      - number of background processes
+    """
+    assert (num_steps == None) != (num_episodes == None)
+    assert not fix_T or num_episodes != None, "fix_T evaluations run episodes."
+    self._agent = agent
+    self._seed = seed
+    self._num_steps = num_steps
+    self._num_episodes = num_episodes
+    self._num_evaluations = 0
+    self._pending = []
+    if num_workers > 0:
+      self._worker = None
+      self._pool = multiprocessing.get_context("spawn").Pool(
+          num_workers,
+          initializer=_initialize_worker,
+          initargs=(pickle.dumps(agent), env_config, fix_T))
+    else:
+      self._worker = _Worker(agent, make_env, fix_T)
+      self._pool = None
+
+  @property
+  def num_evaluations(self):
+    """Number of evaluations so far, seeds of the next ones depend on it. Set
+    it to continue a run (see train.Trainer).
+    """
+    return self._num_evaluations
+
+  @num_evaluations.setter
+  def num_evaluations(self, num_evaluations):
+    self._num_evaluations = num_evaluations
+
+  @property
+  def num_finished(self):
+    """Number of evaluations passed to their observers so far, evaluations
+    finish in submission order.
+    """
+    return self._num_evaluations - len(self._pending)
+
+  def _seeds(self, evaluation, num_tasks):
+    return [
+        int(np.random.SeedSequence([self._seed, evaluation, i
+                                   ]).generate_state(1)[0])
+        for i in range(num_tasks)
+    ]
+
+  def evaluate(self, observers, summarized, name_scope, step=None,
+               step_metrics=()):
+    """Evaluates the current weights of the agent. Once the episodes are done
+    (see poll), their transitions are passed to observers and the summarized
+    metrics are written under name_scope against step and step_metrics, with
+    the values they had when evaluate was called (step metrics that are also
+    observers are read after the transitions are observed).
+    """
+    evaluation = self._num_evaluations
+    self._num_evaluations += 1
+    if self._num_episodes != None:
+      tasks = [(None, 1)] * self._num_episodes
+    else:
+      tasks = [(self._num_steps, None)] if self._num_steps else []
+    seeds = self._seeds(evaluation, len(tasks))
+    if step is not None:
+      step = int(step.numpy()) if hasattr(step, "numpy") else int(step)
+    step_metrics = [
+        m if m in observers else _FrozenStepMetric(m.name, m.result())
+        for m in step_metrics
+    ]
+    if self._pool is None:
+      results = [
+          self._worker.run(seed, num_steps, num_episodes)
+          for seed, (num_steps, num_episodes) in zip(seeds, tasks)
+      ]
+    else:
+      weights = self._agent.get_weights()
+      results = [
+          self._pool.apply_async(_run,
+                                 (evaluation, weights, seed) + task)
+          for seed, task in zip(seeds, tasks)
+      ]
+    self._pending.append(
+        (results, observers, summarized, name_scope, step, step_metrics))
+    self.poll()
+
+  def poll(self, block=False):
+    """Summarizes the finished evaluations, in submission order. If block,
+    waits for all evaluations to finish.
+    """
+    while self._pending:
+      results, observers, summarized, name_scope, step, step_metrics = (
+          self._pending[0])
+      if self._pool is not None:
+        if not block and not all(r.ready() for r in results):
+          return
+        results = [r.get() for r in results]
+      self._pending.pop(0)
+      for transitions in results:
+        for observer in observers:
+          observer.call_batch(**transitions)
+      with tf.name_scope(name_scope):
+        for metric in summarized:
+          metric.summarize(step=step, step_metrics=step_metrics)
+
+  def close(self):
+    """Waits for all evaluations to finish and stops the workers."""
+    self.poll(block=True)
+    if self._pool is not None:
+      self._pool.close()
+      self._pool.join()
@@ -4,19 +4,14 @@ import copy
 import importlib
 import glob
 import json
+import math
 import os
 import shutil
 import sys
 osp = os.path
 
-import mujoco_py  # include at the beginning (bug on compute canada cluster)
-import numpy as np
-import tensorflow as tf
-import ray
-from ray import tune
-
-from rlfd import plot, train, evaluate
-from rlfd.demo_utils import generate_demo
+# Heavy dependencies (mujoco_py, tensorflow, ray, matplotlib) are imported by the
+# target handlers that need them so that e.g. rename: and slurm: start quickly.
 
 
 def import_param_config(load_dir):
@@ -63,6 +58,7 @@ def get_search_params(param_config):
   """Returns a list of parameter keys we want to grid-search for and a dict of
   grid-search values.
   """
+  from ray import tune
 
   def update_dictionary(dictionary, key, value):  # without overwriting keys
     while key in dictionary.keys():
@@ -88,8 +84,260 @@ def transform_config_name(config_name):
   return config_name
 
 
-def main(targets, exp_dir, policy, save_dir, num_cpus, num_gpus, memory, time,
-         port, ip_head, redis_password, **kwargs):
+def rename_target(target, exp_dir, **kwargs):
+  print("\n\n=================================================")
+  print("Renaming the config to params_renamed.json!")
+  print("=================================================")
+  # excluded params
+  inc_params = exc_params = []
+  inc_params = []  # CHANGE this!
+  exc_params = ["seed"]  # CHANGE this!
+  # adding checking
+  config_file = target.replace("rename:", "")
+  params_config = import_param_config(config_file)
+  dir_param_dict = generate_params(exp_dir, params_config)
+  for k, v in dir_param_dict.items():
+    if not os.path.exists(k):
+      continue
+    # copy params.json file, rename the config entry
+    varied_params = k[len(exp_dir) + 1:].split("/")
+    if inc_params:
+      config_name = [
+          x for x in varied_params
+          if any([x.startswith(y) for y in inc_params])
+      ]
+    else:
+      config_name = [
+          x for x in varied_params
+          if not any([x.startswith(y) for y in exc_params])
+      ]
+    print(config_name)
+    config_name = transform_config_name(config_name)
+    print("||||---> ", config_name)
+    v["config"] = "-".join(config_name)
+    with open(os.path.join(k, "params_renamed.json"), "w") as f:
+      json.dump(v, f)
+
+
+def slurm_target(target, num_cpus, num_gpus, memory, time, port, **kwargs):
+  print("\n\n=================================================")
+  print("Generating the slurm launch script!")
+  print("=================================================")
+
+  max_cpus_per_node = 16  # for graham and beluga
+  max_gpus_per_node = 2
+
+  nodes = max(math.ceil(num_cpus / max_cpus_per_node),
+              math.ceil(num_gpus / max_gpus_per_node))
+
+  cpus_per_node = math.ceil(num_cpus / nodes)
+  gpus_per_node = math.ceil(num_gpus / nodes)
+
+  config_file = target.replace("slurm:", "")
+
+  with open(
+      osp.join(osp.dirname(osp.realpath(__file__)),
+               "scripts/slurm_launch.sh")) as f:
+    slurm = f.read()
+
+  slurm = slurm.replace('%%NAME%%', config_file.replace(".py", ""))
+  slurm = slurm.replace('%%NODES%%', str(int(nodes)))
+  slurm = slurm.replace('%%CPUS_PER_NODE%%', str(int(cpus_per_node)))
+  slurm = slurm.replace('%%GPUS_PER_NODE%%', str(int(gpus_per_node)))
+  slurm = slurm.replace('%%MEM_PER_CPU%%', str(int(memory)))
+  slurm = slurm.replace('%%CONFIG_FILE%%', str(config_file))
+  slurm = slurm.replace('%%TIME%%', str(int(time)))
+  slurm = slurm.replace('%%PORT%%', str(int(port)))
+
+  save_file = osp.join(os.getcwd(), config_file.replace(".py", ".sh"))
+  with open(save_file, "w") as f:
+    f.write(slurm)
+
+  print("The slurm script has been stored to {}".format(save_file))
+  print(
+      "If this is the same directory as {}, use `sbatch {}` to rerun with the same configuration."
+      .format(config_file, save_file))
+  os.system("echo '=> sbatch {}' && sbatch {}".format(save_file, save_file))
+
+
+def make_scheduler(scheduler, max_t, grace_period, reduction_factor):
+  """Trial scheduler stopping trials with a low average_return early, its time
+  unit is the number of epochs (offline then online) reported by train.main as
+  trial_epoch. None runs every trial to completion. See pbt.make_scheduler for
+  "pbt".
+  """
+  from ray.tune import schedulers
+
+  if scheduler == "none":
+    return None
+  if scheduler == "asha":
+    return schedulers.ASHAScheduler(time_attr="trial_epoch",
+                                    metric="average_return",
+                                    mode="max",
+                                    max_t=max_t,
+                                    grace_period=grace_period,
+                                    reduction_factor=reduction_factor)
+  if scheduler == "median":
+    return schedulers.MedianStoppingRule(time_attr="trial_epoch",
+                                         metric="average_return",
+                                         mode="max",
+                                         grace_period=grace_period)
+  raise ValueError("Unknown scheduler: {}".format(scheduler))
+
+
+def train_target(target, exp_dir, num_cpus, num_gpus, cpus_per_trial,
+                 pin_cpus, scheduler, grace_period, reduction_factor,
+                 perturbation_interval, snapshot_epochs, snapshot_cycles,
+                 resume, ip_head, redis_password, **kwargs):
+  import mujoco_py  # include at the beginning (bug on compute canada cluster)
+  import ray
+  from ray import tune
+  from rlfd import train
+  from rlfd.utils import artifact_util
+
+  print("\n\n=================================================")
+  print("Launching the training experiment!")
+  print("=================================================")
+  # adding checking
+  config_file = target.replace("train:", "")
+  params_config = import_param_config(config_file)
+  dir_param_dict = generate_params(exp_dir, params_config)
+  config_name = params_config.pop("config")
+  config_name = config_name[0] if type(config_name) == tuple else config_name
+  search_params_list, search_params_dict = get_search_params(params_config)
+  # store json config file to the target directory
+  # Pretrained policies (.pkl) and demonstrations (.npz) are stored once and
+  # linked into every trial directory.
+  artifacts = {
+      osp.basename(f): artifact_util.store(f, exp_dir)
+      for f in glob.glob(osp.join(exp_dir, "*.pkl")) +
+      glob.glob(osp.join(exp_dir, "*.npz"))
+      if osp.isfile(f)
+  }
+  # resuming keeps the directories, trials continue from their run state
+  overwrite_all, remove_all = resume, False
+  for k, v in dir_param_dict.items():
+    if os.path.exists(k) and (not overwrite_all and not remove_all):
+      resp = input("Directory {} exists! (R)emove/(O)verwrite?".format(k))
+      if resp.lower() == "r":
+        remove_all = True
+      elif resp.lower() == "o":
+        overwrite_all = True
+      else:
+        exit(1)
+    if remove_all:
+      try:
+        shutil.rmtree(k)
+      except FileNotFoundError:
+        pass
+    os.makedirs(k, exist_ok=True)
+    # copy params.json file
+    with open(os.path.join(k, "params.json"), "w") as f:
+      json.dump(v, f)
+    for f, stored in artifacts.items():
+      artifact_util.link(stored, os.path.join(k, f))
+  ray.init(num_cpus=num_cpus if not ip_head else None,
+           num_gpus=num_gpus if not ip_head else None,
+           temp_dir=osp.join(osp.expanduser("~"), ".ray")
+           if not ip_head else None,
+           address=ip_head,
+           redis_password=redis_password)
+  # Load every distinct offline dataset once, trials use read-only views of
+  # the object store copy instead of loading their own.
+  offline_datasets, dataset_refs = {}, {}
+  for k, v in dir_param_dict.items():
+    key = train.offline_dataset_key(v, k)
+    if key is None:
+      continue
+    if key not in dataset_refs:
+      dataset_refs[key] = ray.put(train.load_offline_dataset(v, k))
+    offline_datasets[k] = dataset_refs[key]
+  max_t = max(v["offline_num_epochs"] + v["num_epochs"]
+              for v in dir_param_dict.values())
+  if scheduler == "pbt":
+    from rlfd import pbt
+    hyperparameters, mutations = pbt.get_hyperparameters(
+        dir_param_dict, search_params_dict)
+    trial_scheduler = pbt.make_scheduler(mutations, perturbation_interval)
+    trainable = pbt.Trainable
+    scheduler_config = dict(hyperparameters=hyperparameters)
+  else:
+    trial_scheduler = make_scheduler(scheduler, max(max_t, 1), grace_period,
+                                     reduction_factor)
+    trainable = train.main
+    scheduler_config = {}
+  tune.run(trainable,
+           verbose=1,
+           scheduler=trial_scheduler,
+           local_dir=os.path.join(exp_dir, "config_" + config_name),
+           resources_per_trial={
+               "cpu": cpus_per_trial,
+               "gpu": num_gpus * cpus_per_trial / num_cpus,
+           },
+           config=dict(root_dir=exp_dir,
+                       config=config_name,
+                       search_params_list=search_params_list,
+                       cpus_per_trial=cpus_per_trial,
+                       pin_cpus=pin_cpus,
+                       snapshot_epochs=snapshot_epochs,
+                       snapshot_cycles=snapshot_cycles,
+                       offline_datasets=offline_datasets,
+                       scheduler=None if trial_scheduler is None else scheduler,
+                       **scheduler_config,
+                       **search_params_dict),
+           progress_reporter=tune.CLIReporter(
+               ["mode", "epoch", "average_return", "evaluation_trial_epoch",
+                "time_total_s"]))
+
+
+def demo_target(exp_dir, policy, num_cpus, **kwargs):
+  import mujoco_py  # include at the beginning (bug on compute canada cluster)
+  from rlfd.demo_utils import generate_demo
+
+  assert policy != None
+  print("\n\n=================================================")
+  print("Using policy file from {} to generate demo data.".format(policy))
+  print("=================================================")
+  generate_demo.main(policy=policy, root_dir=exp_dir, num_workers=num_cpus)
+
+
+def evaluate_target(exp_dir, policy, num_cpus, num_episodes, seed, num_envs,
+                    output, **kwargs):
+  import mujoco_py  # include at the beginning (bug on compute canada cluster)
+  from rlfd import evaluate
+
+  assert policy != None
+  print("\n\n=================================================")
+  print("Evaluating using policy files matching {}.".format(policy))
+  print("=================================================")
+  evaluate.main(policy=policy,
+                output=output or os.path.join(exp_dir, "evaluation.csv"),
+                num_workers=num_cpus,
+                num_episodes=num_episodes,
+                seed=seed,
+                num_envs=num_envs)
+
+
+def plot_target(target, exp_dir, save_dir, **kwargs):
+  from rlfd import plot
+
+  print("\n\n=================================================")
+  print("Plotting.")
+  print("=================================================")
+  save_name = target.replace("plot:", "") if "plot:" in target else ""
+  plot.main(
+      dirs=[exp_dir],
+      save_dir=save_dir,
+      save_name=save_name,
+      xys=[
+          "OnlineTesting/AverageReturn vs EnvironmentSteps",
+          # "OfflineTesting/AverageReturn",
+      ],
+      smooth=True,
+  )
+
+
+def main(targets, exp_dir, policy, **kwargs):
   # Setup
   exp_dir = os.path.abspath(os.path.expanduser(exp_dir))
   if policy is not None:
@@ -97,170 +345,20 @@ def main(targets, exp_dir, policy, save_dir, num_cpus, num_gpus, memory, time,
 
   for target in targets:
     if "rename:" in target:
-      print("\n\n=================================================")
-      print("Renaming the config to params_renamed.json!")
-      print("=================================================")
-      # excluded params
-      inc_params = exc_params = []
-      inc_params = []  # CHANGE this!
-      exc_params = ["seed"]  # CHANGE this!
-      # adding checking
-      config_file = target.replace("rename:", "")
-      params_config = import_param_config(config_file)
-      dir_param_dict = generate_params(exp_dir, params_config)
-      for k, v in dir_param_dict.items():
-        if not os.path.exists(k):
-          continue
-        # copy params.json file, rename the config entry
-        varied_params = k[len(exp_dir) + 1:].split("/")
-        if inc_params:
-          config_name = [
-              x for x in varied_params
-              if any([x.startswith(y) for y in inc_params])
-          ]
-        else:
-          config_name = [
-              x for x in varied_params
-              if not any([x.startswith(y) for y in exc_params])
-          ]
-        print(config_name)
-        config_name = transform_config_name(config_name)
-        print("||||---> ", config_name)
-        v["config"] = "-".join(config_name)
-        with open(os.path.join(k, "params_renamed.json"), "w") as f:
-          json.dump(v, f)
-
+      handler = rename_target
     elif "slurm:" in target:
-      print("\n\n=================================================")
-      print("Generating the slurm launch script!")
-      print("=================================================")
-
-      max_cpus_per_node = 16  # for graham and beluga
-      max_gpus_per_node = 2
-
-      nodes = max(np.ceil(num_cpus / max_cpus_per_node),
-                  np.ceil(num_gpus / max_gpus_per_node))
-
-      cpus_per_node = np.ceil(num_cpus / nodes)
-      gpus_per_node = np.ceil(num_gpus / nodes)
-
-      config_file = target.replace("slurm:", "")
-
-      with open(
-          osp.join(osp.dirname(osp.realpath(__file__)),
-                   "scripts/slurm_launch.sh")) as f:
-        slurm = f.read()
-
-      slurm = slurm.replace('%%NAME%%', config_file.replace(".py", ""))
-      slurm = slurm.replace('%%NODES%%', str(int(nodes)))
-      slurm = slurm.replace('%%CPUS_PER_NODE%%', str(int(cpus_per_node)))
-      slurm = slurm.replace('%%GPUS_PER_NODE%%', str(int(gpus_per_node)))
-      slurm = slurm.replace('%%MEM_PER_CPU%%', str(int(memory)))
-      slurm = slurm.replace('%%CONFIG_FILE%%', str(config_file))
-      slurm = slurm.replace('%%TIME%%', str(int(time)))
-      slurm = slurm.replace('%%PORT%%', str(int(port)))
-
-      save_file = osp.join(os.getcwd(), config_file.replace(".py", ".sh"))
-      with open(save_file, "w") as f:
-        f.write(slurm)
-
-      print("The slurm script has been stored to {}".format(save_file))
-      print(
-          "If this is the same directory as {}, use `sbatch {}` to rerun with the same configuration."
-          .format(config_file, save_file))
-      os.system("echo '=> sbatch {}' && sbatch {}".format(save_file, save_file))
-
+      handler = slurm_target
     elif "train:" in target:
-      print("\n\n=================================================")
-      print("Launching the training experiment!")
-      print("=================================================")
-      # adding checking
-      config_file = target.replace("train:", "")
-      params_config = import_param_config(config_file)
-      dir_param_dict = generate_params(exp_dir, params_config)
-      config_name = params_config.pop("config")
-      config_name = config_name[0] if type(
-          config_name) == tuple else config_name
-      search_params_list, search_params_dict = get_search_params(params_config)
-      # store json config file to the target directory
-      overwrite_all = remove_all = False
-      for k, v in dir_param_dict.items():
-        if os.path.exists(k) and (not overwrite_all and not remove_all):
-          resp = input("Directory {} exists! (R)emove/(O)verwrite?".format(k))
-          if resp.lower() == "r":
-            remove_all = True
-          elif resp.lower() == "o":
-            overwrite_all = True
-          else:
-            exit(1)
-        if remove_all:
-          try:
-            shutil.rmtree(k)
-          except FileNotFoundError:
-            pass
-        os.makedirs(k, exist_ok=True)
-        # copy params.json file
-        with open(os.path.join(k, "params.json"), "w") as f:
-          json.dump(v, f)
-        # copy demo_sata file if exist
-        for f in glob.glob("*.pkl") + glob.glob("*.npz"):
-          # .pkl -> pretrained policies, .npz -> demonstrations
-          source = os.path.join(exp_dir, f)
-          destination = os.path.join(k, f)
-          if os.path.isfile(source):
-            shutil.copyfile(source, destination)
-      ray.init(num_cpus=num_cpus if not ip_head else None,
-               num_gpus=num_gpus if not ip_head else None,
-               temp_dir=osp.join(osp.expanduser("~"), ".ray")
-               if not ip_head else None,
-               address=ip_head,
-               redis_password=redis_password)
-      tune.run(train.main,
-               verbose=1,
-               local_dir=os.path.join(exp_dir, "config_" + config_name),
-               resources_per_trial={
-                   "cpu": 1,
-                   "gpu": num_gpus / num_cpus,
-               },
-               config=dict(root_dir=exp_dir,
-                           config=config_name,
-                           search_params_list=search_params_list,
-                           **search_params_dict),
-               progress_reporter=tune.CLIReporter(
-                   ["mode", "epoch", "time_total_s"]))
-
+      handler = train_target
     elif target == "demo":
-      assert policy != None
-      print("\n\n=================================================")
-      print("Using policy file from {} to generate demo data.".format(policy))
-      print("=================================================")
-      generate_demo.main(policy=policy, root_dir=exp_dir)
-
+      handler = demo_target
     elif target == "evaluate":
-      assert policy != None
-      print("\n\n=================================================")
-      print("Evaluating using policy file from {}.".format(policy))
-      print("=================================================")
-      evaluate.main(policy=policy)
-
+      handler = evaluate_target
     elif "plot" in target:
-      print("\n\n=================================================")
-      print("Plotting.")
-      print("=================================================")
-      save_name = target.replace("plot:", "") if "plot:" in target else ""
-      plot.main(
-          dirs=[exp_dir],
-          save_dir=save_dir,
-          save_name=save_name,
-          xys=[
-              "OnlineTesting/AverageReturn vs EnvironmentSteps",
-              # "OfflineTesting/AverageReturn",
-          ],
-          smooth=True,
-      )
-
+      handler = plot_target
     else:
       raise ValueError("Unknown target: {}".format(target))
+    handler(target=target, exp_dir=exp_dir, policy=policy, **kwargs)
 
 
 if __name__ == "__main__":
@@ -285,7 +383,32 @@ if __name__ == "__main__":
   )
   exp_parser.parser.add_argument(
       "--policy",
-      help="The policy file to be used for evaluate or demo, <policy name>.pkl",
+      help="The policy file to be used for evaluate or demo, <policy name>.pkl, "
+      "evaluate also takes a quoted glob, e.g. '*/policies/online_policy_*.pkl'",
+      type=str,
+      default=None,
+  )
+  exp_parser.parser.add_argument(
+      "--num_episodes",
+      help="evaluate: episodes per policy",
+      type=int,
+      default=10,
+  )
+  exp_parser.parser.add_argument(
+      "--seed",
+      help="evaluate: seed of the episodes, the same for all policies",
+      type=int,
+      default=0,
+  )
+  exp_parser.parser.add_argument(
+      "--num_envs",
+      help="evaluate: environments stepped together for each policy",
+      type=int,
+      default=1,
+  )
+  exp_parser.parser.add_argument(
+      "--output",
+      help="evaluate: csv file of the results, default <exp_dir>/evaluation.csv",
       type=str,
       default=None,
   )
@@ -301,6 +424,60 @@ if __name__ == "__main__":
       type=int,
       default=0,
   )
+  exp_parser.parser.add_argument(
+      "--cpus_per_trial",
+      help="cpus of each trial, its tensorflow and numpy threads",
+      type=int,
+      default=1,
+  )
+  exp_parser.parser.add_argument(
+      "--pin_cpus",
+      help="pin every trial to its own cpus",
+      action="store_true",
+  )
+  exp_parser.parser.add_argument(
+      "--scheduler",
+      help="stop trials with a low average return early (asha, median) or "
+      "train them with population based training (pbt)",
+      type=str,
+      choices=["none", "asha", "median", "pbt"],
+      default="none",
+  )
+  exp_parser.parser.add_argument(
+      "--grace_period",
+      help="epochs every trial runs before the scheduler may stop it",
+      type=int,
+      default=10,
+  )
+  exp_parser.parser.add_argument(
+      "--reduction_factor",
+      help="asha: 1/reduction_factor of the trials continue at every rung",
+      type=int,
+      default=3,
+  )
+  exp_parser.parser.add_argument(
+      "--perturbation_interval",
+      help="pbt: epochs between exploiting and exploring hyperparameters",
+      type=int,
+      default=10,
+  )
+  exp_parser.parser.add_argument(
+      "--snapshot_epochs",
+      help="write the run state every snapshot_epochs epochs (0 for never)",
+      type=int,
+      default=0,
+  )
+  exp_parser.parser.add_argument(
+      "--snapshot_cycles",
+      help="also write the run state every snapshot_cycles online cycles",
+      type=int,
+      default=0,
+  )
+  exp_parser.parser.add_argument(
+      "--resume",
+      help="continue the trials of existing directories from their run state",
+      action="store_true",
+  )
   exp_parser.parser.add_argument(
       "--memory",
       help="ray.init memory per cpu",
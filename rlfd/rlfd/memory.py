@@ -1,4 +1,8 @@
 import abc
+import json
+import os
+osp = os.path
+
 import numpy as np
 
 
@@ -43,6 +47,40 @@ class SampleIterator(object):
     return batch
 
 
+def _chunk_file(directory, chunk, key):
+  return osp.join(directory, "chunk-{:06d}-{}.npy".format(chunk, key))
+
+
+def _manifest_file(snapshot):
+  return "manifest-{:06d}.json".format(snapshot)
+
+
+def _file_id(f):
+  """Snapshot id of a chunk or manifest file name, None for other files."""
+  if f.startswith("chunk-") or (f.startswith("manifest-") and
+                                f.endswith(".json")):
+    return int(f.split("-")[1].split(".")[0])
+  return None
+
+
+def _read_manifest(directory, manifest):
+  with open(osp.join(directory, manifest), "r") as f:
+    return json.load(f)
+
+
+def latest_snapshot(directory):
+  """Returns the manifest of the last snapshot written to directory, None if
+  there is none.
+  """
+  if not osp.isdir(directory):
+    return None
+  manifests = [
+      f for f in os.listdir(directory)
+      if f.startswith("manifest-") and f.endswith(".json")
+  ]
+  return max(manifests, key=_file_id) if manifests else None
+
+
 class ReplayBuffer(object, metaclass=abc.ABCMeta):
 
   def __init__(self, buffer_shapes, size):
@@ -53,6 +91,10 @@ class ReplayBuffer(object, metaclass=abc.ABCMeta):
     # memory management
     self._size = size
     self._current_size = 0
+    # slots stored since the last snapshot, once there is one
+    self._snapshot_dir = None
+    self._snapshot_chunks = None
+    self._unsaved_idxs = None
 
     # buffer
     self.buffers = {
@@ -65,12 +107,114 @@ class ReplayBuffer(object, metaclass=abc.ABCMeta):
     self.store(episode_batch)
     return episode_batch
 
+  def load_shared(self, data):
+    """Uses the arrays in data as the content of the buffer without copying
+    them, e.g. read-only arrays of the Ray object store shared by all trials of
+    a node. The buffer then holds exactly these transitions (or episodes) and
+    must not be stored into.
+    """
+    sizes = [len(data[k]) for k in self.buffers.keys()]
+    assert np.all(np.array(sizes) == sizes[0]), "Inconsistent batch size."
+    for k, v in self.buffers.items():
+      assert data[k].shape[1:] == v.shape[1:], "Inconsistent shape."
+      assert data[k].dtype == v.dtype, "Inconsistent dtype."
+    self.buffers = {k: data[k] for k in self.buffers.keys()}
+    self._size = self._current_size = sizes[0]
+    self._clear_buffer()
+
   def dump_to_file(self, path):
     if self._current_size == 0:
       return
     buffers = {k: v[:self._current_size] for k, v in self.buffers.items()}
     np.savez_compressed(path, **buffers)  # save the file
 
+  def save_snapshot(self, directory):
+    """Writes the content of the buffer to directory, returns the name of the
+    manifest of the snapshot (see load_snapshot).
+
+    The first snapshot of the buffer writes all stored transitions (or
+    episodes), later ones to the same directory append a chunk with only those
+    stored since. Chunks are uncompressed .npy files of the stored slots and
+    their indices, listed with the storage state of the buffer in a manifest
+    written last. Every snapshot has its own manifest and previous snapshots
+    stay intact, until they are removed with prune_snapshots once the new one
+    is committed (e.g. referred to by a run state). Once the chunks hold twice
+    the content of the buffer (it was overwritten), they are compacted into
+    one.
+    """
+    os.makedirs(directory, exist_ok=True)
+    ids = [_file_id(f) for f in os.listdir(directory)]
+    snapshot = max([i for i in ids if i is not None], default=-1) + 1
+    if directory != self._snapshot_dir:
+      chunks, idxs = [], np.arange(self._current_size)
+    else:
+      chunks = self._snapshot_chunks
+      idxs = np.unique(np.concatenate([np.empty(0, np.int64)] +
+                                      self._unsaved_idxs))
+      if sum(c["size"] for c in chunks) + len(idxs) > 2 * self._current_size:
+        chunks, idxs = [], np.arange(self._current_size)  # compact
+    if len(idxs) > 0:
+      np.save(_chunk_file(directory, snapshot, "idx"), idxs)
+      for k, v in self.buffers.items():
+        np.save(_chunk_file(directory, snapshot, k), v[idxs])
+      chunks = chunks + [dict(id=snapshot, size=len(idxs))]
+    manifest = dict(current_size=self._current_size,
+                    chunks=chunks,
+                    **self._snapshot_state())
+    manifest_file = osp.join(directory, _manifest_file(snapshot))
+    tmp = "{}.tmp-{}".format(manifest_file, os.getpid())
+    with open(tmp, "w") as f:
+      json.dump(manifest, f)
+    os.replace(tmp, manifest_file)
+    self._snapshot_dir = directory
+    self._snapshot_chunks = chunks
+    self._unsaved_idxs = []
+    return _manifest_file(snapshot)
+
+  @staticmethod
+  def prune_snapshots(directory, manifest):
+    """Removes the files of directory that the snapshot manifest does not use:
+    the other manifests, compacted chunks and those of other snapshots.
+    """
+    chunks = _read_manifest(directory, manifest)["chunks"]
+    chunk_ids = set(c["id"] for c in chunks)
+    for f in os.listdir(directory):
+      if f.startswith("manifest-") and f != manifest:
+        os.remove(osp.join(directory, f))
+      elif f.startswith("chunk-") and _file_id(f) not in chunk_ids:
+        os.remove(osp.join(directory, f))
+
+  def load_snapshot(self, directory, manifest=None):
+    """Restores the buffer from the snapshot manifest (the latest one if None)
+    written by save_snapshot, the buffer must have the same shapes and size.
+    Chunks are memory-mapped and copied into the buffer in the order they were
+    written. Later snapshots of the buffer to directory append to it.
+    """
+    if manifest is None:
+      manifest = latest_snapshot(directory)
+      assert manifest is not None, "No snapshot in {}.".format(directory)
+    manifest = _read_manifest(directory, manifest)
+    assert manifest["current_size"] <= self._size, "Snapshot too large."
+    for chunk in manifest["chunks"]:
+      idxs = np.load(_chunk_file(directory, chunk["id"], "idx"))
+      for k, v in self.buffers.items():
+        data = np.load(_chunk_file(directory, chunk["id"], k), mmap_mode="r")
+        assert data.shape[1:] == v.shape[1:], "Inconsistent shape."
+        v[idxs] = data
+    self._current_size = manifest["current_size"]
+    self._load_snapshot_state(manifest)
+    self._snapshot_dir = directory
+    self._snapshot_chunks = manifest["chunks"]
+    self._unsaved_idxs = []
+
+  def _snapshot_state(self):
+    """Storage state to save in snapshots besides the current size"""
+    return {}
+
+  def _load_snapshot_state(self, state):
+    """Restores the state returned by _snapshot_state"""
+    pass
+
   def sample(self,
              batch_size=None,
              return_iterator=False,
@@ -96,7 +240,9 @@ class ReplayBuffer(object, metaclass=abc.ABCMeta):
     assert np.all(np.array(batch_sizes) == batch_sizes[0])
     batch_size = batch_sizes[0]
 
-    self._store(data)
+    idxs = self._store(data)
+    if self._unsaved_idxs is not None:
+      self._unsaved_idxs.append(np.atleast_1d(idxs))
 
     # memory management
     self._current_size = min(self._size, self._current_size + batch_size)
@@ -104,6 +250,8 @@ class ReplayBuffer(object, metaclass=abc.ABCMeta):
   def clear_buffer(self):
     self._clear_buffer()
     self._current_size = 0
+    # next snapshot is full
+    self._snapshot_dir = self._snapshot_chunks = self._unsaved_idxs = None
 
   @property
   def full(self):
@@ -129,7 +277,7 @@ class ReplayBuffer(object, metaclass=abc.ABCMeta):
 
   @abc.abstractmethod
   def _store(self, data):
-    """store batch of data into the replay buffer"""
+    """store batch of data into the replay buffer, return the indices used"""
 
   @abc.abstractmethod
   def _sample_random(self, batch_size):
@@ -173,6 +321,14 @@ class StepBaseReplayBuffer(ReplayBuffer):
     replay_buffer.store(experiences)
     return replay_buffer
 
+  @staticmethod
+  def construct_shared(experiences):
+    """Replay buffer holding all keys of experiences, see load_shared."""
+    buffer_shapes = {k: v.shape[1:] for k, v in experiences.items()}
+    replay_buffer = StepBaseReplayBuffer(buffer_shapes, 0)
+    replay_buffer.load_shared(experiences)
+    return replay_buffer
+
   @property
   def stored_steps(self):
     """current number of environment steps stored in the replay buffer"""
@@ -244,10 +400,17 @@ class StepBaseReplayBuffer(ReplayBuffer):
     # load inputs into buffers
     for key in self.buffers.keys():
       self.buffers[key][idxs] = data[key]
+    return idxs
 
   def _clear_buffer(self):
     self._pointer = 0
 
+  def _snapshot_state(self):
+    return dict(pointer=self._pointer)
+
+  def _load_snapshot_state(self, state):
+    self._pointer = state["pointer"]
+
   def _get_storage_idx(self, inc):
     assert inc <= self._size, "batch committed to replay is too large!"
     assert inc > 0, "invalid increment"
@@ -299,6 +462,15 @@ class EpisodeBaseReplayBuffer(ReplayBuffer):
     replay_buffer.store(experiences)
     return replay_buffer
 
+  @staticmethod
+  def construct_shared(experiences):
+    """Replay buffer holding all keys of experiences, see load_shared."""
+    buffer_shapes = {k: v.shape[1:] for k, v in experiences.items()}
+    T = experiences["o"].shape[1]
+    replay_buffer = EpisodeBaseReplayBuffer(buffer_shapes, 0, T)
+    replay_buffer.load_shared(experiences)
+    return replay_buffer
+
   @property
   def stored_steps(self):
     """current number of environment steps stored in the replay buffer"""
@@ -309,6 +481,9 @@ class EpisodeBaseReplayBuffer(ReplayBuffer):
     """current number of environment episodes stored in the replay buffer"""
     return self._current_size
 
+  def _snapshot_state(self):
+    return dict(stored_episodes=self.stored_episodes)
+
   def _sample_random(self, batch_size):
     """ Returns a dict {key: array(batch_size x shapes[key])}
     """
@@ -391,6 +566,7 @@ class EpisodeBaseReplayBuffer(ReplayBuffer):
     # load inputs into buffers
     for key in self.buffers.keys():
       self.buffers[key][idxs] = data[key]
+    return idxs
 
   def _clear_buffer(self):
     pass
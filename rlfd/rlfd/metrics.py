@@ -40,8 +40,24 @@ class NumpyDeque(object):
       self._start_index = np.mod(self._start_index + 1, self._maxlen)
 
   def extend(self, values):
-    for value in values:
-      self.add(value)
+    values = np.asarray(values, dtype=self._buffer.dtype).reshape(-1)
+    if np.isinf(self._maxlen):
+      new_len = self._len + values.shape[0]
+      if new_len > self._buffer.shape[0]:
+        self._buffer.resize((max(self._buffer.shape[0] * 2, new_len),))
+      self._buffer[self._len:new_len] = values
+      self._len = np.int64(new_len)
+      return
+
+    maxlen = int(self._maxlen)
+    values = values[-maxlen:]  # older values would be evicted anyway
+    insert_idxs = (self._start_index + self._len +
+                   np.arange(values.shape[0])) % maxlen
+    self._buffer[insert_idxs] = values
+    new_len = min(maxlen, self._len + values.shape[0])
+    self._start_index = np.mod(
+        self._start_index + self._len + values.shape[0] - new_len, maxlen)
+    self._len = np.int64(new_len)
 
   def __len__(self):
     return self._len
@@ -72,6 +88,16 @@ class StepMetric(object, metaclass=abc.ABCMeta):
   def call(self, *args, **kwargs):
     """Implement step metric update"""
 
+  def call_batch(self, **transitions):
+    """Update metric given a batch of consecutive steps. Every entry of
+    transitions has the steps along its first dimension.
+
+    Subclasses should override this with a vectorized implementation.
+    """
+    num_steps = len(transitions["reset"])
+    for i in range(num_steps):
+      self.call(**{k: v[i] for k, v in transitions.items()})
+
   @abc.abstractmethod
   def result(self):
     """Computes and returns a final value for the metric."""
@@ -80,6 +106,12 @@ class StepMetric(object, metaclass=abc.ABCMeta):
   def reset(self, *args, **kwargs):
     """Implement step metric update"""
 
+  def discard_episode(self):
+    """Forgets the steps of the unfinished episode, e.g. when training resumes
+    with a new episode (see train.Trainer).
+    """
+    pass
+
   def summarize(self, step=None, step_metrics=()):
     """Generates summaries against train_step and all step_metrics.
 
@@ -106,6 +138,21 @@ class StepMetric(object, metaclass=abc.ABCMeta):
                         step=int(step_metric.result()))
 
 
+def _episode_sums(values, reset):
+  """Sums values per episode given the reset flags of consecutive steps.
+
+  Returns:
+    sums of the episodes ending in this batch, where the first one may have
+    started in an earlier batch, and the sum of the unfinished last episode.
+  """
+  ends = np.flatnonzero(reset)
+  if ends.shape[0] == 0:
+    return np.zeros(0, dtype=values.dtype), values.sum()
+  starts = np.concatenate(([0], ends[:-1] + 1))
+  return (np.add.reduceat(values[:ends[-1] + 1], starts),
+          values[ends[-1] + 1:].sum())
+
+
 class StreamingMetric(StepMetric, metaclass=abc.ABCMeta):
   """Abstract base class for streaming metrics.
 
@@ -150,6 +197,19 @@ class AverageReturnMetric(StreamingMetric):
       self.add_to_buffer([self._episode_return])
       self._episode_return = 0.0
 
+  def call_batch(self, **transitions):
+    r = np.asarray(transitions["r"], dtype=np.float64).reshape(-1)
+    reset = np.asarray(transitions["reset"], dtype=bool).reshape(-1)
+    returns, unfinished_return = _episode_sums(r, reset)
+    if returns.shape[0] > 0:
+      returns[0] += self._episode_return
+      self.add_to_buffer(returns)
+      self._episode_return = 0.0
+    self._episode_return += unfinished_return
+
+  def discard_episode(self):
+    self._episode_return = 0.0
+
 
 class AverageEpisodeLengthMetric(StreamingMetric):
   """Computes the average episode length."""
@@ -168,6 +228,19 @@ class AverageEpisodeLengthMetric(StreamingMetric):
       self.add_to_buffer([self._episode_length])
       self._episode_length = 0
 
+  def call_batch(self, **transitions):
+    reset = np.asarray(transitions["reset"], dtype=bool).reshape(-1)
+    lengths, unfinished_length = _episode_sums(
+        np.ones(reset.shape, dtype=np.int64), reset)
+    if lengths.shape[0] > 0:
+      lengths[0] += self._episode_length
+      self.add_to_buffer(lengths)
+      self._episode_length = 0
+    self._episode_length += int(unfinished_length)
+
+  def discard_episode(self):
+    self._episode_length = 0
+
 
 class EnvironmentSteps(StepMetric):
   """Counts the number of steps taken in the environment."""
@@ -186,6 +259,9 @@ class EnvironmentSteps(StepMetric):
   def call(self, **transition):
     self.environment_steps += 1
 
+  def call_batch(self, **transitions):
+    self.environment_steps += len(transitions["reset"])
+
 
 class NumberOfEpisodes(StepMetric):
   """Counts the number of episodes in the environment."""
@@ -204,4 +280,76 @@ class NumberOfEpisodes(StepMetric):
   def call(self, **transition):
     done = transition["reset"]
     if done:
-      self.num_episodes += 1
\ No newline at end of file
+      self.num_episodes += 1
+
+  def call_batch(self, **transitions):
+    self.num_episodes += int(np.count_nonzero(transitions["reset"]))
+
+
+class ScalarAccumulator(object):
+  """Accumulates count, sum, min and max of scalars in tf.Variables so that they
+  can be updated inside tf.functions at every training step, and writes their
+  mean, min and max as summaries when flushed every few steps.
+
+  Note: this is intentionally not a tf.Module, the accumulators are not part of
+  the checkpoints of their owner.
+  """
+
+  def __init__(self, scope):
+    """
+    Args:
+      scope: name scope of the summaries written by flush.
+    """
+    self._scope = scope
+    self._vars = {}
+
+  def _get_vars(self, name):
+    if name not in self._vars:
+      # created outside of the tf.function that first updates the scalar
+      with tf.init_scope():
+        self._vars[name] = tuple(
+            tf.Variable(v, trainable=False, dtype=tf.float32)
+            for v in (0.0, 0.0, np.inf, -np.inf))
+    return self._vars[name]
+
+  def update(self, name, value):
+    """Adds the mean of value to the scalar called name."""
+    count, total, minimum, maximum = self._get_vars(name)
+    value = tf.cast(tf.reduce_mean(value), tf.float32)
+    count.assign_add(1.0)
+    total.assign_add(value)
+    minimum.assign(tf.minimum(minimum, value))
+    maximum.assign(tf.maximum(maximum, value))
+
+  def reset(self):
+    for count, total, minimum, maximum in self._vars.values():
+      count.assign(0.0)
+      total.assign(0.0)
+      minimum.assign(np.inf)
+      maximum.assign(-np.inf)
+
+  def flush(self, step, step_name=None, prefix=""):
+    """Writes mean, min and max of every scalar updated since the last flush
+    against step and resets them.
+
+    Args:
+      step: step of the summaries, a tf.Variable.
+      step_name: name of the step in the summary tags, defaults to step.name.
+      prefix: added in front of the scalar names in the summary tags.
+    """
+    step_name = step_name if step_name else step.name
+    with tf.name_scope(self._scope):
+      for name, (count, total, minimum, maximum) in self._vars.items():
+        if count.numpy() == 0:
+          continue
+        name = prefix + name
+        tf.summary.scalar(name='{} vs {}'.format(name, step_name),
+                          data=total / count,
+                          step=step)
+        tf.summary.scalar(name='{}_min vs {}'.format(name, step_name),
+                          data=minimum,
+                          step=step)
+        tf.summary.scalar(name='{}_max vs {}'.format(name, step_name),
+                          data=maximum,
+                          step=step)
+    self.reset()
@@ -23,8 +23,10 @@ default_params = {
     "num_batches_per_cycle": 1000,
     "expl_num_episodes_per_cycle": None,
     "expl_num_steps_per_cycle": 1000,
+    "expl_num_envs": 1,  # step copies of the environment together if > 1
     "eval_num_episodes_per_cycle": 0,
     "eval_num_steps_per_cycle": None,
+    "eval_num_workers": 0,  # evaluate in background processes if > 0
     # agent config
     "agent": {
         "offline_batch_size": 256,
@@ -45,6 +47,8 @@ default_params = {
         "reg_loss_weight": 100.,
         "logprob_scale": 1.,
         "min_logprob": -5.0,
+        # compile the training graphs with XLA
+        "jit_compile": False,
     },
     "seed": 0,
 }
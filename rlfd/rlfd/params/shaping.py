@@ -16,6 +16,7 @@ nf_params = {
     "prm_loss_weight": 1.0,
     "reg_loss_weight": 200.0,
     "potential_weight": 3.0,
+    "jit_compile": False,  # compile the training graph with XLA
 }
 # OpenAI Gym
 gym_mujoco_nf_params = deepcopy(nf_params)
@@ -38,6 +39,7 @@ gan_params = {
     "gp_lambda": 0.1,
     "critic_iter": 5,
     "potential_weight": 3.0,
+    "jit_compile": False,  # compile the training graph with XLA
 }
 # OpenAI Gym
 gym_mujoco_gan_params = deepcopy(gan_params)
@@ -23,8 +23,10 @@ default_params = {
     "num_batches_per_cycle": 1000,
     "expl_num_episodes_per_cycle": None,
     "expl_num_steps_per_cycle": 1000,
+    "expl_num_envs": 1,  # step copies of the environment together if > 1
     "eval_num_episodes_per_cycle": 5,
     "eval_num_steps_per_cycle": None,
+    "eval_num_workers": 0,  # evaluate in background processes if > 0
     # agent config
     "agent": {
         "gamma": 0.99,
@@ -57,6 +59,11 @@ default_params = {
         # double q learning
         "soft_target_tau": 5e-3,
         "target_update_freq": 1,
+        # critic ensemble, min over num_target_critics random critics (REDQ)
+        "num_critics": 2,
+        "num_target_critics": 2,
+        # compile the training graphs with XLA
+        "jit_compile": False,
     },
     "seed": 0,
 }
@@ -0,0 +1,91 @@
+"""Population based training (Jaderberg et al., 2017) of the trials of a sweep.
+
+Every perturbation_interval epochs Tune gives the trials at the bottom of the
+population the weights of trials at the top (exploit) and perturbs their
+hyperparameters (explore). Weights move between trials in memory, as the
+Agent.get_weights and EnsembleShaping.get_weights dicts returned by
+Trainable._save, never through the ckpts directory of the trials.
+Hyperparameters are changed in place (Agent.set_hyperparameters), graphs are
+not retraced.
+"""
+import numpy as np
+from ray import tune
+from ray.tune import schedulers
+
+from rlfd import shapings, train
+
+# Hyperparameters perturbed by PBT, the params.json entry they are read from,
+# and how new values are sampled.
+HYPERPARAMETERS = {
+    "q_lr": ("agent", lambda: 10**np.random.uniform(-5, -2)),
+    "pi_lr": ("agent", lambda: 10**np.random.uniform(-5, -2)),
+    "alpha": ("agent", lambda: 10**np.random.uniform(-3, 0)),
+    "potential_weight": ("shaping", None),  # relative to the initial value
+}
+
+
+class Trainable(tune.Trainable):
+  """Runs train.Trainer one epoch per Tune iteration."""
+
+  def _setup(self, config):
+    self._trainer = train.Trainer(config)
+    self._trainer.set_hyperparameters(**config["hyperparameters"])
+
+  def _train(self):
+    result = self._trainer.train_epoch()
+    result["done"] = self._trainer.done
+    return result
+
+  def _save(self, checkpoint_dir):
+    return self._trainer.get_state()  # serialized by Tune
+
+  def _restore(self, checkpoint):
+    self._trainer.set_state(checkpoint)
+
+  def reset_config(self, new_config):
+    self._trainer.set_hyperparameters(**new_config["hyperparameters"])
+    self.config = new_config
+    return True
+
+  def _stop(self):
+    self._trainer.close()
+
+
+def get_hyperparameters(dir_param_dict, search_params_dict):
+  """Returns the initial value of the hyperparameters perturbed in the trials
+  (config["hyperparameters"]) and their mutations. Grid searched
+  hyperparameters start from the value of their trial, others from the
+  common value of params.json. Hyperparameters the trials do not have (alpha
+  for TD3, potential_weight without shaping or with a shaping without one) are
+  not perturbed.
+  """
+  params = next(iter(dir_param_dict.values()))
+  hyperparameters, mutations = {}, {}
+  for name, (entry, sample) in HYPERPARAMETERS.items():
+    if not name in params.get(entry, {}):
+      continue
+    if entry == "shaping" and not shapings.SHAPINGS[
+        params["shaping"]["shaping_type"]].has_potential_weight:
+      continue
+    if name in search_params_dict:
+      hyperparameters[name] = tune.sample_from(
+          lambda spec, name=name: spec.config[name])
+    else:
+      hyperparameters[name] = params[entry][name]
+    if sample is None:
+      initial = params[entry][name]
+      sample = lambda initial=initial: initial * 2**np.random.uniform(-1, 1)
+    mutations[name] = sample
+  return hyperparameters, mutations
+
+
+def make_scheduler(mutations, perturbation_interval):
+  """PBT scheduler perturbing every perturbation_interval epochs of a trial
+  (trial_epoch, see train.Trainer.train_epoch).
+  """
+  return schedulers.PopulationBasedTraining(
+      time_attr="trial_epoch",
+      metric="average_return",
+      mode="max",
+      perturbation_interval=perturbation_interval,
+      hyperparam_mutations={"hyperparameters": mutations})
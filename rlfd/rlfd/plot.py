@@ -9,13 +9,10 @@ from functools import reduce
 import matplotlib
 import matplotlib.pyplot as plt
 import numpy as np
-import pandas as pd
-import tensorflow as tf
 from matplotlib import cm
-from tensorboard.backend.event_processing import event_accumulator
 
 from rlfd.utils.cmd_util import ArgParser
-from rlfd.utils.reader_util import load_csv
+from rlfd.utils.results_util import ResultsStore
 
 matplotlib.use("Agg")  # Can change to 'Agg' for non-interactive mode
 matplotlib.rcParams["pdf.fonttype"] = 42
@@ -67,37 +64,14 @@ def smooth_reward_curve(x, y, size=50):
   return xsmoo, ysmoo
 
 
-def convert_tensorboard_data_to_csv(path,
-                                    source_dir="summaries",
-                                    target_dir="csv_summaries"):
-  summary_iterator = event_accumulator.EventAccumulator(
-      osp.join(path, source_dir),
-      size_guidance={
-          "tensors": 0
-      },
-  ).Reload()
-  tags = summary_iterator.Tags()
-  for tag in tags["tensors"]:
-    # This is hardcoded in the tensorboard output
-    try:
-      y_label, x_label = tag.split(" vs ")
-    except ValueError:
-      y_label = tag
-      x_label = "Step"
-    xy_data = np.array([(event.step, tf.make_ndarray(event.tensor_proto))
-                        for event in summary_iterator.Tensors(tag)])
-    df = pd.DataFrame({y_label: xy_data[:, 1], x_label: xy_data[:, 0]})
-    tag = tag.replace("/", "_")
-    os.makedirs(osp.join(path, target_dir), exist_ok=True)
-    df.to_csv(osp.join(path, target_dir, tag))
-
-
-def load_results(root_dir_or_dirs):
+def load_results(root_dir_or_dirs, num_workers=None):
   """
   Load summaries of runs from a list of directories (including subdirectories)
-  Looking for directories with both params.json and progress.csv.
+  Looking for directories with both params.json and summaries.
 
   Arguments:
+      num_workers - number of processes converting the runs, defaults to the
+                    number of cpus
 
   Returns:
       allresults - list of dicts that contains "summaries" and "params".
@@ -109,28 +83,9 @@ def load_results(root_dir_or_dirs):
   allresults = []
   for rootdir in rootdirs:
     assert osp.exists(rootdir), "%s doesn't exist" % rootdir
-    for dirname, subdirs, files in os.walk(rootdir):
-      if (all([file in files for file in ["params.json"]]) and
-          "summaries" in subdirs):
-        result = {"dirname": dirname}
-        result["progress"] = dict()
-        source_dir = "summaries"
-        target_dir = "csv_summaries"
-        if source_dir in subdirs:
-          convert_tensorboard_data_to_csv(dirname, source_dir, target_dir)
-          for csv in os.listdir(osp.join(dirname, target_dir)):
-            progress = load_csv(osp.join(dirname, target_dir, csv))
-            result["progress"][csv] = progress
-        # load parameters
-        paramsjson = osp.join(
-            dirname, "params_renamed.json")  # search for the renamed file first
-        if not osp.exists(paramsjson):
-          paramsjson = osp.join(dirname, "params.json")
-        with open(paramsjson, "r") as f:
-          result["params"] = json.load(f)
-
-        allresults.append(result)
-
+    store = ResultsStore(rootdir)
+    store.update(num_workers)
+    allresults += store.to_results()
   return allresults
 
 
@@ -272,8 +227,15 @@ def plot_results(allresults, xys, save_dir, save_name, smooth=False):
   plt.show()
 
 
-def main(dirs, xys, save_dir=None, save_name="", smooth=False, **kwargs):
-  results = load_results(reduce(lambda a, b: a + glob.glob(b), dirs, []))
+def main(dirs,
+         xys,
+         save_dir=None,
+         save_name="",
+         smooth=False,
+         num_workers=None,
+         **kwargs):
+  results = load_results(reduce(lambda a, b: a + glob.glob(b), dirs, []),
+                         num_workers)
   # get directory to save results
   save_dir = save_dir if save_dir else dirs[0]
   plot_results(results, xys, save_dir, save_name, smooth)
@@ -315,5 +277,10 @@ if __name__ == "__main__":
                                  help="smooth the plot",
                                  type=bool,
                                  default=False)
+  exp_parser.parser.add_argument(
+      "--num_workers",
+      help="number of processes converting summaries, defaults to all cpus",
+      type=int,
+      default=None)
   exp_parser.parse(sys.argv)
   main(**exp_parser.get_dict())
@@ -0,0 +1,106 @@
+"""Low overhead wall-clock profiler of the training loop.
+
+Phases are timed with a context manager and nest, a phase entered inside
+another one is recorded under "outer/inner":
+
+  from rlfd import profiler
+
+  with profiler.phase("expl_rollout"):
+    with profiler.phase("env_step"):
+      ...
+
+The process-wide profiler accumulates the total time and number of calls of
+every phase until it is reset, usually once per epoch after reporting.
+"""
+import collections
+import json
+import time
+
+import tensorflow as tf
+
+
+class _Phase(object):
+  __slots__ = ("_profiler", "_name", "_start")
+
+  def __init__(self, profiler, name):
+    self._profiler = profiler
+    self._name = name
+
+  def __enter__(self):
+    stack = self._profiler._stack
+    stack.append(stack[-1] + "/" + self._name if stack else self._name)
+    self._start = time.perf_counter()
+    return self
+
+  def __exit__(self, *args):
+    elapsed = time.perf_counter() - self._start
+    path = self._profiler._stack.pop()
+    self._profiler._times[path] += elapsed
+    self._profiler._counts[path] += 1
+
+
+class _NoPhase(object):
+
+  def __enter__(self):
+    return self
+
+  def __exit__(self, *args):
+    pass
+
+
+_NO_PHASE = _NoPhase()
+
+
+class Profiler(object):
+
+  def __init__(self, enabled=True):
+    self.enabled = enabled
+    self._stack = []
+    self._times = collections.defaultdict(float)
+    self._counts = collections.defaultdict(int)
+
+  def phase(self, name):
+    """Returns a context manager timing the enclosed block as phase name."""
+    if not self.enabled:
+      return _NO_PHASE
+    return _Phase(self, name)
+
+  def reset(self):
+    self._times.clear()
+    self._counts.clear()
+
+  def summary(self):
+    """Returns {phase path: {"time": total seconds, "count": number of calls}}
+    sorted by phase path so that sub-phases follow their parents.
+    """
+    return collections.OrderedDict(
+        (k, dict(time=self._times[k], count=self._counts[k]))
+        for k in sorted(self._times.keys()))
+
+  def summarize(self, step, step_name="epoch"):
+    """Writes the time of every phase to the default summary writer."""
+    for path, v in self.summary().items():
+      tf.summary.scalar(name="{} vs {}".format(path, step_name),
+                        data=v["time"],
+                        step=step)
+
+  def dump(self, path, **info):
+    """Appends the phase times together with info as a line of JSON to path."""
+    with open(path, "a") as f:
+      f.write(json.dumps(dict(phases=self.summary(), **info)) + "\n")
+
+  def report(self):
+    """Returns a flat dict of phase times for tune.report."""
+    return {"profile/" + k: v["time"] for k, v in self.summary().items()}
+
+
+_PROFILER = Profiler()
+
+
+def get_profiler():
+  return _PROFILER
+
+
+def phase(name):
+  """Times the enclosed block as phase name of the process-wide profiler."""
+  return _PROFILER.phase(name)
@@ -82,4 +82,4 @@ done
 
 # Launch the training process
 let NUM_CPUS=${NUM_CPU_PER_NODE}*${NUM_NODES} NUM_GPUS=${NUM_GPU_PER_NODE}*${NUM_NODES}
-python -u -m rlfd.launch --redis_password $redis_password --ip_head $ip_address_port --num_cpus $NUM_CPUS --num_gpus $NUM_GPUS --targets train:${TRAINING_FILE}
+python -u -m rlfd.launch --redis_password $redis_password --ip_head $ip_address_port --num_cpus $NUM_CPUS --num_gpus $NUM_GPUS --resume --snapshot_epochs 5 --targets train:${TRAINING_FILE}
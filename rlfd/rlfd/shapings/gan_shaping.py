@@ -7,6 +7,7 @@ tfl = tfk.layers
 
 from rlfd import normalizer
 from rlfd.shapings import shaping
+from rlfd.utils import tf_util
 
 
 class Generator(tfk.Model):
@@ -54,7 +55,8 @@ class Discriminator(tfk.Model):
 class GANShaping(shaping.Shaping):
 
   def __init__(self, dims, max_u, potential_weight, layer_sizes, latent_dim,
-               gp_lambda, critic_iter, norm_obs, norm_eps, norm_clip, **kwargs):
+               gp_lambda, critic_iter, norm_obs, norm_eps, norm_clip,
+               jit_compile=False, **kwargs):
     self.init_args = locals()
 
     super(GANShaping, self).__init__()
@@ -67,8 +69,11 @@ class GANShaping(shaping.Shaping):
     self.norm_obs = norm_obs
     self.norm_eps = norm_eps
     self.norm_clip = norm_clip
-    self.potential_weight = potential_weight
+    self.potential_weight = tf.Variable(potential_weight,
+                                        dtype=tf.float32,
+                                        trainable=False)
     self.critic_iter = critic_iter
+    self.jit_compile = jit_compile
     self.gp_lambda = gp_lambda
 
     # normalizer for observation.
@@ -112,8 +117,8 @@ class GANShaping(shaping.Shaping):
   def before_training_hook(self, batch, **kwargs):
     self._update_stats(batch)
 
-  @tf.function
-  def _train_graph(self, o, u):
+  @tf_util.compiled_method
+  def _train_graph(self, o, u, train_generator):
 
     o = self.o_stats.normalize(o)
     state = tf.concat(axis=1, values=[o, u / self.max_u])
@@ -144,10 +149,11 @@ class GANShaping(shaping.Shaping):
 
     self.disc_optimizer.apply_gradients(
         zip(disc_grads, self.discriminator.trainable_weights))
-    if self.train_gen % self.critic_iter == 0:
+    if train_generator:  # python bool, traced separately
       self.gen_optimizer.apply_gradients(
           zip(gen_grads, self.generator.trainable_weights))
     self.train_gen.assign_add(1)
+    self._stats.update("loss", disc_loss)
 
     return disc_loss
 
@@ -156,14 +162,8 @@ class GANShaping(shaping.Shaping):
     o_tf = tf.convert_to_tensor(o, dtype=tf.float32)
     u_tf = tf.convert_to_tensor(u, dtype=tf.float32)
 
-    disc_loss_tf = self._train_graph(o_tf, u_tf)
-
-    with tf.name_scope('GANShapingLosses'):
-      tf.summary.scalar(name=name + ' loss vs training_step',
-                        data=disc_loss_tf,
-                        step=self.training_step)
-
-    return disc_loss_tf.numpy()
+    train_generator = bool(self.train_gen % self.critic_iter == 0)
+    return self._train_graph(o_tf, u_tf, train_generator)
 
   def _evaluate(self, o, u, name="", **kwargs):
     o_tf = tf.convert_to_tensor(o, dtype=tf.float32)
@@ -176,22 +176,28 @@ class GANShaping(shaping.Shaping):
                         step=self.training_step)
     return potential
 
+  def get_weights(self):
+    return {
+        "o_stats": self.o_stats.get_weights(),
+        "discriminator": self.discriminator.get_weights(),
+        "generator": self.generator.get_weights(),
+    }
+
+  def set_weights(self, weights):
+    self.o_stats.set_weights(weights["o_stats"])
+    self.discriminator.set_weights(weights["discriminator"])
+    self.generator.set_weights(weights["generator"])
+
   def __getstate__(self):
     state = {
         k: v
         for k, v in self.init_args.items()
         if not k in ["self", "__class__"]
     }
-    state["tf"] = {
-        "o_stats": self.o_stats.get_weights(),
-        "discriminator": self.discriminator.get_weights(),
-        "generator": self.generator.get_weights(),
-    }
+    state["tf"] = self.get_weights()
     return state
 
   def __setstate__(self, state):
     stored_vars = state.pop("tf")
     self.__init__(**state)
-    self.o_stats.set_weights(stored_vars["o_stats"])
-    self.discriminator.set_weights(stored_vars["discriminator"])
-    self.generator.set_weights(stored_vars["generator"])
\ No newline at end of file
+    self.set_weights(stored_vars)
\ No newline at end of file
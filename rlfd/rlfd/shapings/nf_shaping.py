@@ -8,6 +8,7 @@ tfb = tfp.bijectors
 
 from rlfd import normalizer
 from rlfd.shapings import shaping
+from rlfd.utils import tf_util
 
 
 class ClippedAutoregressiveNetwork(tf.Module):
@@ -53,7 +54,7 @@ class NFShaping(shaping.Shaping):
 
   def __init__(self, dims, max_u, num_bijectors, layer_sizes, num_masked,
                potential_weight, norm_obs, norm_eps, norm_clip, prm_loss_weight,
-               reg_loss_weight, **kwargs):
+               reg_loss_weight, jit_compile=False, **kwargs):
     self.init_args = locals()
 
     super(NFShaping, self).__init__()
@@ -69,7 +70,10 @@ class NFShaping(shaping.Shaping):
     self.norm_clip = norm_clip
     self.prm_loss_weight = prm_loss_weight
     self.reg_loss_weight = reg_loss_weight
-    self.potential_weight = tf.constant(potential_weight, dtype=tf.float64)
+    self.jit_compile = jit_compile
+    self.potential_weight = tf.Variable(potential_weight,
+                                        dtype=tf.float64,
+                                        trainable=False)
 
     #
     self.learning_rate = 2e-4
@@ -114,7 +118,7 @@ class NFShaping(shaping.Shaping):
   def before_training_hook(self, batch, **kwargs):
     self._update_stats(batch)
 
-  @tf.function
+  @tf_util.compiled_method
   def _train_graph(self, o, u):
 
     o = self.o_stats.normalize(o)
@@ -137,6 +141,7 @@ class NFShaping(shaping.Shaping):
     self.optimizer.apply_gradients(zip(grads, self.nf.trainable_variables))
 
     loss = tf.cast(loss, tf.float32)
+    self._stats.update("loss", loss)
 
     return loss
 
@@ -145,14 +150,7 @@ class NFShaping(shaping.Shaping):
     o_tf = tf.convert_to_tensor(o, dtype=tf.float32)
     u_tf = tf.convert_to_tensor(u, dtype=tf.float32)
 
-    loss_tf = self._train_graph(o_tf, u_tf)
-
-    with tf.name_scope('NFShapingLosses'):
-      tf.summary.scalar(name=name + ' loss vs training_step',
-                        data=loss_tf,
-                        step=self.training_step)
-
-    return loss_tf.numpy()
+    return self._train_graph(o_tf, u_tf)
 
   def _evaluate(self, o, u, name="", **kwargs):
     o_tf = tf.convert_to_tensor(o, dtype=tf.float32)
@@ -165,22 +163,28 @@ class NFShaping(shaping.Shaping):
                         step=self.training_step)
     return potential
 
+  def get_weights(self):
+    return {
+        "o_stats": self.o_stats.get_weights(),
+        "nf": list(map(lambda v: v.numpy(), self.nf.variables)),
+    }
+
+  def set_weights(self, weights):
+    self.o_stats.set_weights(weights["o_stats"])
+    list(
+        map(lambda v: v[0].assign(v[1]), zip(self.nf.variables,
+                                             weights["nf"])))
+
   def __getstate__(self):
     state = {
         k: v
         for k, v in self.init_args.items()
         if not k in ["self", "__class__"]
     }
-    state["tf"] = {
-        "o_stats": self.o_stats.get_weights(),
-        "nf": list(map(lambda v: v.numpy(), self.nf.variables)),
-    }
+    state["tf"] = self.get_weights()
     return state
 
   def __setstate__(self, state):
     stored_vars = state.pop("tf")
     self.__init__(**state)
-    self.o_stats.set_weights(stored_vars["o_stats"])
-    list(
-        map(lambda v: v[0].assign(v[1]),
-            zip(self.nf.variables, stored_vars["nf"])))
\ No newline at end of file
+    self.set_weights(stored_vars)
\ No newline at end of file
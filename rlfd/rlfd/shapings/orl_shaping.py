@@ -1,15 +1,16 @@
 import os.path as osp
-import pickle
 
 import numpy as np
 import tensorflow as tf
 
 from rlfd import normalizer
+from rlfd import agents
 from rlfd.agents import td3_networks
 from rlfd.shapings import shaping
 
 
 class OfflineRLShaping(shaping.Shaping):
+  has_potential_weight = False
 
   def __init__(self, **kwargs):
     self.init_args = locals()
@@ -23,9 +24,18 @@ class OfflineRLShaping(shaping.Shaping):
     return self._policy.estimate_q_graph(o, u)
 
   def before_training_hook(self, data_dir, **kwargs):
-    policy = osp.join(data_dir, "pretrained.pkl")
-    with open(policy, "rb") as f:
-      self._policy = pickle.load(f)
+    self._policy = agents.load_policy(osp.join(data_dir, "pretrained.pkl"))
+
+  def get_weights(self):
+    return self._policy.get_weights()
+
+  def set_weights(self, weights):
+    self._policy.set_weights(weights)
+
+  def set_potential_weight(self, potential_weight):
+    raise ValueError(
+        "OfflineRLShaping has no potential weight, its potential is the Q "
+        "value of the pretrained policy.")
 
   def __getstate__(self):
     state = {k: v for k, v in self.init_args.items() if not k == "self"}
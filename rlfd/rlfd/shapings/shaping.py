@@ -10,7 +10,8 @@ import tensorflow as tf
 import tensorflow_probability as tfp
 tfd = tfp.distributions
 
-from rlfd import memory
+from rlfd import memory, metrics, profiler
+from rlfd.utils import artifact_util
 
 SHAPINGS = {}
 
@@ -28,10 +29,23 @@ class EnsembleShaping(object):
     self.shaping_type = shaping_type
     self.num_epochs = num_epochs
     self.batch_size = batch_size
+    # File the shaping was last saved to or loaded from, policies refer to it
+    # instead of pickling the shaping again (see Agent.save). None once the
+    # shaping changed.
+    self.saved_path = None
 
-  def before_training_hook(self, data_dir, env):
+  def before_training_hook(self, data_dir, env, offline_dataset=None):
     self._data_dir = data_dir
     self._env = env
+    # Shared by the trials, see train.load_offline_dataset
+    if offline_dataset is not None:
+      if self._fix_T and not env.has_dataset:
+        self._dataset = memory.EpisodeBaseReplayBuffer.construct_shared(
+            offline_dataset)
+      else:
+        self._dataset = memory.StepBaseReplayBuffer.construct_shared(
+            offline_dataset)
+      return
     # D4RL
     experiences = env.get_dataset()
     if experiences:  # T not fixed by default
@@ -41,7 +55,7 @@ class EnsembleShaping(object):
       self._dataset.store(experiences)
     else:
       # Ours
-      demo_file = osp.join(data_dir, "demo_data.npz")
+      demo_file = artifact_util.resolve(osp.join(data_dir, "demo_data.npz"))
       assert osp.isfile(demo_file), "Demostrations not available."
       if self._fix_T:
         self._dataset = memory.EpisodeBaseReplayBuffer.construct_from_file(
@@ -50,7 +64,10 @@ class EnsembleShaping(object):
         self._dataset = memory.StepBaseReplayBuffer.construct_from_file(
             data_file=demo_file)
 
-  def train(self):
+  def train(self, report=True):
+    """Trains the shapings one after the other. Epochs are reported to Tune if
+    report, trial schedulers expect the results of train.Trainer only.
+    """
     for i, shaping in enumerate(self.shapings):
       dataset_iter = self._dataset.sample(return_iterator=True,
                                           shuffle=False,
@@ -59,23 +76,24 @@ class EnsembleShaping(object):
                                    batch=next(dataset_iter))
 
       self.training_step = self.shapings[i].training_step
-      with tf.summary.record_if(lambda: self.training_step % 200 == 0):
-        for epoch in range(self.num_epochs):
-          dataset_iter = self._dataset.sample(return_iterator=True,
-                                              shuffle=True,
-                                              include_partial_batch=True)
-          dataset_iter(self.batch_size)
+      for epoch in range(self.num_epochs):
+        dataset_iter = self._dataset.sample(return_iterator=True,
+                                            shuffle=True,
+                                            include_partial_batch=True)
+        dataset_iter(self.batch_size)
+        with profiler.phase("shaping_train"):
           for batch in dataset_iter:
             shaping.train(**batch, name="model_" + str(i))
-          # TODO: should be done on validation set
+        # TODO: should be done on validation set
+        with profiler.phase("shaping_evaluate"):
           shaping.evaluate(**batch, name="model_" + str(i))
 
-          # For ray status updates
-          if ray.is_initialized():
-            try:
-              tune.report(mode="shaping", epoch=epoch)  # ray 0.8.6
-            except:
-              tune.track.log(mode="shaping", epoch=epoch)  # previous versions
+        # For ray status updates
+        if report and ray.is_initialized():
+          try:
+            tune.report(mode="shaping", epoch=epoch)  # ray 0.8.6
+          except:
+            tune.track.log(mode="shaping", epoch=epoch)  # previous versions
 
       shaping.after_training_hook()
 
@@ -83,8 +101,41 @@ class EnsembleShaping(object):
     pass
 
   def save(self, path):
-    with open(path, "wb") as f:
+    # replace rather than overwrite, path may be linked to a stored artifact
+    # (see artifact_util)
+    tmp = "{}.tmp-{}".format(path, os.getpid())
+    with open(tmp, "wb") as f:
       pickle.dump(self, f)
+    os.replace(tmp, path)
+    self.saved_path = osp.abspath(path)
+
+  @staticmethod
+  def load(path):
+    with open(artifact_util.resolve(path), "rb") as f:
+      shaping = pickle.load(f)
+    shaping.saved_path = osp.abspath(path)
+    return shaping
+
+  def get_weights(self):
+    """Returns a copy of the weights of all shapings."""
+    return [shaping.get_weights() for shaping in self.shapings]
+
+  def set_weights(self, weights):
+    """Loads weights returned by get_weights."""
+    self.saved_path = None
+    for shaping, w in zip(self.shapings, weights):
+      shaping.set_weights(w)
+
+  def set_hyperparameters(self, potential_weight=None):
+    """Changes the potential weight of all shapings, see
+    Agent.set_hyperparameters.
+    """
+    if potential_weight is not None:
+      if potential_weight != self.init_args["kwargs"].get("potential_weight"):
+        self.saved_path = None
+      self.init_args["kwargs"]["potential_weight"] = potential_weight
+      for shaping in self.shapings:
+        shaping.set_potential_weight(potential_weight)
 
   @tf.function
   def potential(self, o, u):
@@ -110,6 +161,9 @@ class EnsembleShaping(object):
 
 
 class Shaping(object, metaclass=abc.ABCMeta):
+  # whether the potential is scaled by a potential_weight variable, see
+  # set_potential_weight
+  has_potential_weight = True
 
   @classmethod
   def __init_subclass__(cls, **kwargs):
@@ -119,11 +173,17 @@ class Shaping(object, metaclass=abc.ABCMeta):
   def __init__(self):
     """Implement the state, action based potential"""
     self.training_step = tf.Variable(0, trainable=False, dtype=tf.int64)
+    # Training statistics, updated in graph and flushed to summaries.
+    self._stats = metrics.ScalarAccumulator(type(self).__name__ + "Losses")
 
-  def train(self, *args, **kwargs):
+  def train(self, *args, name="", **kwargs):
     """train the shaping potential"""
-    result = self._train(*args, **kwargs)
+    result = self._train(*args, name=name, **kwargs)
     self.training_step.assign_add(1)
+    if self.training_step % 200 == 0:
+      self._stats.flush(self.training_step,
+                        step_name="training_step",
+                        prefix=name + " ")
     return result
 
   def evaluate(self, *args, **kwargs):
@@ -140,6 +200,19 @@ class Shaping(object, metaclass=abc.ABCMeta):
   def potential(self, o, u):
     """return the shaping potential, has to be a tf.function"""
 
+  @abc.abstractmethod
+  def get_weights(self):
+    """return a copy of the weights of the potential"""
+
+  @abc.abstractmethod
+  def set_weights(self, weights):
+    """load weights returned by get_weights"""
+
+  def set_potential_weight(self, potential_weight):
+    """change the scale of the potential, see EnsembleShaping"""
+    self.init_args["potential_weight"] = potential_weight
+    self.potential_weight.assign(potential_weight)
+
   def _train(self, *args, **kwargs):
     """train the shaping potential (implementation)"""
 
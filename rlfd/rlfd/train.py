@@ -1,7 +1,9 @@
+import functools
 import json
 import logging
 import os
 import pickle
+import random
 import sys
 osp = os.path
 
@@ -10,234 +12,596 @@ import tensorflow as tf
 import ray
 from ray import tune
 
-from rlfd import (agents, metrics, policies, env_manager, drivers, shapings)
+from rlfd import (agents, metrics, policies, env_manager, drivers, evaluator,
+                  profiler, shapings)
 
-from rlfd.utils.util import set_global_seeds
+from rlfd.utils import artifact_util
+from rlfd.utils.util import configure_cpu_threads, set_global_seeds
 
 
-def get_env_constructor_and_config(params):
+def get_env_constructor_and_config(params, num_envs=None):
+  """Returns a constructor of the environment, of num_envs copies of it stepped
+  together if given (see env_manager.EnvManager.get_vec_env), and the
+  environment config of the agents.
+  """
   manager = env_manager.EnvManager(env_name=params["env_name"],
                                    env_args=params["env_args"],
                                    r_scale=params["r_scale"],
                                    r_shift=params["r_shift"])
-  tmp_env = manager.get_env()
-  tmp_env.reset()
-  obs, _, _, _ = tmp_env.step(tmp_env.action_space.sample())
-  dims = dict(o=tmp_env.observation_space.shape, u=tmp_env.action_space.shape)
+  env_spec = manager.get_env_spec()
   info = dict(env_name=params["env_name"],
               env_args=params["env_args"],
               r_scale=params["r_scale"],
               r_shift=params["r_shift"])
-  config = dict(eps_length=tmp_env.eps_length,
+  config = dict(eps_length=env_spec["eps_length"],
                 fix_T=params["fix_T"],
-                max_u=tmp_env.max_u,
-                dims=dims,
+                max_u=env_spec["max_u"],
+                dims=dict(env_spec["dims"]),
                 info=info)
+  if num_envs is not None:
+    return functools.partial(manager.get_vec_env, num_envs), config
   return manager.get_env, config
 
 
-def config_driver(fix_T, seed, *args, **kwargs):
-  driver = (drivers.EpisodeBasedDriver(*args, **kwargs)
-            if fix_T else drivers.StepBasedDriver(*args, **kwargs))
+def config_driver(fix_T, seed, *args, vector=False, **kwargs):
+  if vector:
+    assert not fix_T, "Vector environments are step based."
+    driver = drivers.VectorStepBasedDriver(*args, **kwargs)
+  else:
+    driver = (drivers.EpisodeBasedDriver(*args, **kwargs)
+              if fix_T else drivers.StepBasedDriver(*args, **kwargs))
   driver.seed(seed)
   return driver
 
 
-def main(config):
-  # Setup Paths
-  root_dir = os.path.join(
-      config["root_dir"], "config_" + config["config"],
-      *[x + "_" + str(config[x]) for x in config["search_params_list"]])
-
-  logger = logging.getLogger("rlfd")
-  logger.addHandler(logging.FileHandler(osp.join(root_dir, "train.log")))
-  logger.setLevel(logging.DEBUG)
-
-  # Limit gpu memory growth for tensorflow
-  physical_gpus = tf.config.list_physical_devices("GPU")
-  try:
-    for gpu in physical_gpus:
-      tf.config.experimental.set_memory_growth(gpu, True)
-    logical_gpus = tf.config.list_logical_devices("GPU")
-    print("Found", len(physical_gpus), "physical GPUs", len(logical_gpus),
-          "logical GPUs")
-  except RuntimeError as e:
-    print(e)  # Memory growth must be set before GPUs have been initialized
-
-  # Load parameters.
-  param_file = os.path.join(root_dir, "params.json")
-  assert os.path.isfile(param_file), param_file
-  with open(param_file, "r") as f:
-    params = json.load(f)
-
-  # Seed everything.
-  set_global_seeds(params["seed"])
-
-  # Tensorboard summary writer
-  summary_writer_path = osp.join(root_dir, "summaries")
-  summary_writer = tf.summary.create_file_writer(summary_writer_path,
-                                                 flush_millis=10 * 1000)
-  summary_writer.set_as_default()
-
-  make_env, env_params = get_env_constructor_and_config(params=params)
-
-  # Configure shaping
-  shaping = None
-  shaping_file = osp.join(root_dir, "shaping.pkl")
-  if osp.isfile(shaping_file):
-    logger.info("Load shaping.")
-    with open(shaping_file, "rb") as f:
-      shaping = pickle.load(f)
-  if "shaping" in params.keys():
-    logger.info("Train shaping.")
-    shaping = shapings.EnsembleShaping(**params["shaping"], **env_params)
-    shaping.before_training_hook(data_dir=root_dir, env=make_env())
-    shaping.train()
-    shaping.after_training_hook()
-    shaping.save(shaping_file)
-
-  # Configure pre-trained agent
-  pretrained_agent = None
-  if params["pretrained"]:
-    pretrained_file = osp.join(root_dir, params["pretrained"] + ".pkl")
-    logger.info("Load pretrained agent: {}.".format(pretrained_file))
-    with open(pretrained_file, "rb") as f:
-      pretrained_agent = pickle.load(f)
-
-  # Configure agents and drivers.
-  agent_params = params["agent"]
-  agent = agents.AGENTS[params["algo"]](**agent_params, **env_params)
-
-  random_driver = config_driver(
-      params["fix_T"],
-      params["seed"],
-      make_env=make_env,
-      policy=policies.RandomPolicy(env_params["dims"]["o"],
-                                   env_params["dims"]["u"],
-                                   env_params["max_u"]),
-      num_steps=params["expl_num_steps_per_cycle"],
-      num_episodes=params["expl_num_episodes_per_cycle"])
-  expl_driver = config_driver(
-      params["fix_T"],
-      params["seed"],
-      make_env=make_env,
-      policy=agent.expl_policy,
-      num_steps=params["expl_num_steps_per_cycle"],
-      num_episodes=params["expl_num_episodes_per_cycle"])
-  eval_driver = config_driver(
-      params["fix_T"],
-      params["seed"],
-      make_env=make_env,
-      policy=agent.eval_policy,
-      num_steps=params["eval_num_steps_per_cycle"],
-      num_episodes=params["eval_num_episodes_per_cycle"])
-
-  offline_testing_metrics = [
-      metrics.EnvironmentSteps(),
-      metrics.NumberOfEpisodes(),
-      metrics.AverageReturnMetric(),
-      metrics.AverageEpisodeLengthMetric(),
-  ]
-  training_metrics = [
-      metrics.EnvironmentSteps(),
-      metrics.NumberOfEpisodes(),
-      metrics.AverageReturnMetric(),
-      metrics.AverageEpisodeLengthMetric(),
-  ]
-  testing_metrics = [
-      metrics.EnvironmentSteps(),
-      metrics.NumberOfEpisodes(),
-      metrics.AverageReturnMetric(),
-      metrics.AverageEpisodeLengthMetric(),
-  ]
-
-  # Learning parameters
-  offline_num_epochs = params["offline_num_epochs"]
-  offline_num_batches_per_epoch = params["offline_num_batches_per_epoch"]
-  random_exploration_cycles = params["random_expl_num_cycles"]
-  num_epochs = params["num_epochs"]
-  num_cycles_per_epoch = params["num_cycles_per_epoch"]
-  num_batches_per_cycle = params["num_batches_per_cycle"]
-
-  # Setup policy saving
-  save_interval = 0
-  policy_path = osp.join(root_dir, "policies")
-  os.makedirs(policy_path, exist_ok=True)
-  ckpt_path = osp.join(root_dir, "ckpts")
-  if osp.exists(ckpt_path):
-    logger.warning("Loading from an checkpoint. Be careful!")
-    agent.load(ckpt_path)
-  os.makedirs(ckpt_path, exist_ok=True)
-
-  # Load offline data and initialize shaping
-  agent.before_training_hook(data_dir=root_dir,
-                             env=make_env(),
-                             shaping=shaping,
-                             pretrained_agent=pretrained_agent)
-
-  # Train offline
-  agent.before_offline_hook()
-  eval_driver.generate_rollouts(observers=offline_testing_metrics)
-  with tf.name_scope("OfflineTesting"):
-    for metric in offline_testing_metrics[2:]:
-      metric.summarize(step=agent.offline_training_step,
-                       step_metrics=offline_testing_metrics[:2])
-
-  for epoch in range(offline_num_epochs):
-    for _ in range(offline_num_batches_per_epoch):
-      agent.train_offline()
-
-    eval_driver.generate_rollouts(observers=offline_testing_metrics)
-    with tf.name_scope("OfflineTesting"):
-      for metric in offline_testing_metrics[2:]:
-        metric.summarize(step=agent.offline_training_step,
-                         step_metrics=offline_testing_metrics[:2])
-
-    agent.save(osp.join(policy_path, "offline_policy_latest.pkl"), ckpt_path)
-    logger.info("Saving agent after offline training.")
-
-    # For ray status updates
-    if ray.is_initialized():
-      try:
-        tune.report(mode="offline", epoch=epoch)  # ray 0.8.6
-      except:
-        tune.track.log(mode="offline", epoch=epoch)  # previous versions
-
-  # Train online
-  agent.before_online_hook()
-  eval_driver.generate_rollouts(observers=testing_metrics)
-  with tf.name_scope("OnlineTesting"):
-    for metric in testing_metrics[2:]:
-      metric.summarize(step_metrics=training_metrics[:2])
-
-  for _ in range(random_exploration_cycles):
-    experiences = random_driver.generate_rollouts(observers=training_metrics)
-    agent.store_experiences(experiences)
-
-  for epoch in range(num_epochs):
-    for cyc in range(num_cycles_per_epoch):
-      experiences = expl_driver.generate_rollouts(observers=training_metrics)
-      agent.store_experiences(experiences)
-      for _ in range(num_batches_per_cycle):
-        agent.train_online()
-    with tf.name_scope("OnlineTraining"):
-      for metric in training_metrics[2:]:
-        metric.summarize(step_metrics=training_metrics[:2])
-
-    eval_driver.generate_rollouts(observers=testing_metrics)
-    with tf.name_scope("OnlineTesting"):
-      for metric in testing_metrics[2:]:
-        metric.summarize(step_metrics=training_metrics[:2])
+def offline_dataset_key(params, data_dir):
+  """Identifies the offline dataset load_offline_dataset returns for a trial,
+  trials with the same key can share it. None if the trial has no dataset.
+  """
+  manager = env_manager.EnvManager(env_name=params["env_name"],
+                                   env_args=params["env_args"],
+                                   r_scale=params["r_scale"],
+                                   r_shift=params["r_shift"])
+  if manager.get_env_spec()["has_dataset"]:
+    return json.dumps(["d4rl", params["env_name"], params["env_args"]],
+                      sort_keys=True)
+  demo_file = osp.join(data_dir, "demo_data.npz")
+  if not artifact_util.isfile(demo_file):
+    return None
+  return json.dumps(["demo", artifact_util.file_sha1(demo_file)])
+
+
+def load_offline_dataset(params, data_dir):
+  """Loads the offline dataset of a trial as the agents and shapings would: the
+  D4RL dataset of the environment or the demonstrations in data_dir, as
+  float32 arrays so that they can be used as replay buffers without copies.
+  """
+  make_env, _ = get_env_constructor_and_config(params=params)
+  experiences = make_env().get_dataset()
+  if not experiences:
+    demo_file = artifact_util.resolve(osp.join(data_dir, "demo_data.npz"))
+    if not osp.isfile(demo_file):
+      return None
+    experiences = dict(np.load(demo_file))
+  return {
+      k: np.ascontiguousarray(v, dtype=np.float32)
+      for k, v in experiences.items()
+  }
+
+
+def report_profile(root_dir, scope, step, **info):
+  """Writes the phase times of the last epoch to summaries and profile.jsonl,
+  returns them for tune.report and resets the profiler.
+  """
+  prof = profiler.get_profiler()
+  with tf.name_scope(scope):
+    prof.summarize(step=step)
+  prof.dump(osp.join(root_dir, "profile.jsonl"), **info)
+  report = prof.report()
+  prof.reset()
+  return report
+
+
+class _EvaluatedEpoch(object):
+  """Observer recording in epochs[key] the trial epoch of the evaluation whose
+  transitions are passed to it.
+  """
+
+  def __init__(self, epochs, key, trial_epoch):
+    self._epochs = epochs
+    self._key = key
+    self._trial_epoch = trial_epoch
+
+  def call_batch(self, **transitions):
+    self._epochs[self._key] = self._trial_epoch
+
+
+class Trainer(object):
+  """Trains the agent of a trial one epoch at a time, offline epochs first and
+  online epochs after. main runs all epochs, pbt.Trainable one epoch per Tune
+  iteration.
+
+  Every snapshot_epochs epochs (and every snapshot_cycles online cycles) if
+  set in the config, the run state is written to <root_dir>/run_state: epoch
+  and cycle counters, random states, metrics, the online replay buffer and a
+  checkpoint of the agent variables (weights, normalizers, optimizers and
+  training steps). A trainer created for a directory holding a run state
+  continues from it. Environments cannot be restored, drivers start new
+  episodes. Metrics are saved as of the evaluations finished by then, the
+  evaluations still running are not repeated when continuing.
+  """
+
+  def __init__(self, config):
+    # With a trial scheduler (see launch.make_scheduler), wait for the
+    # evaluation of every epoch so that the reported average_return belongs to
+    # that epoch, and do not report shaping epochs to Tune.
+    self._sync_evaluation = config.get("scheduler") is not None
+
+    # Setup Paths
+    root_dir = os.path.join(
+        config["root_dir"], "config_" + config["config"],
+        *[x + "_" + str(config[x]) for x in config["search_params_list"]])
+    self.root_dir = root_dir
+
+    logger = logging.getLogger("rlfd")
+    logger.addHandler(logging.FileHandler(osp.join(root_dir, "train.log")))
+    logger.setLevel(logging.DEBUG)
+    self.logger = logger
+
+    # Size the thread pools to the CPUs allocated to the trial
+    if config.get("cpus_per_trial"):
+      configure_cpu_threads(config["cpus_per_trial"],
+                            pin=config.get("pin_cpus", False))
+
+    # Limit gpu memory growth for tensorflow
+    physical_gpus = tf.config.list_physical_devices("GPU")
+    try:
+      for gpu in physical_gpus:
+        tf.config.experimental.set_memory_growth(gpu, True)
+      logical_gpus = tf.config.list_logical_devices("GPU")
+      print("Found", len(physical_gpus), "physical GPUs", len(logical_gpus),
+            "logical GPUs")
+    except RuntimeError as e:
+      print(e)  # Memory growth must be set before GPUs have been initialized
+
+    # Load parameters.
+    param_file = os.path.join(root_dir, "params.json")
+    assert os.path.isfile(param_file), param_file
+    with open(param_file, "r") as f:
+      params = json.load(f)
+
+    # Seed everything.
+    set_global_seeds(params["seed"])
+    self._seed = params["seed"]
+
+    # Run state of a previous (preempted) run of the trial
+    self._run_state_dir = osp.join(root_dir, "run_state")
+    run_state = None
+    run_state_file = osp.join(self._run_state_dir, "state.pkl")
+    if osp.isfile(run_state_file):
+      logger.info("Resume from the run state.")
+      with open(run_state_file, "rb") as f:
+        run_state = pickle.load(f)
+
+    # Tensorboard summary writer
+    summary_writer_path = osp.join(root_dir, "summaries")
+    summary_writer = tf.summary.create_file_writer(summary_writer_path,
+                                                   flush_millis=10 * 1000)
+    summary_writer.set_as_default()
+
+    make_env, env_params = get_env_constructor_and_config(params=params)
+
+    # Offline dataset put in the object store by the launcher, shared read-only
+    # by the trials of a node (see launch.train_target).
+    offline_dataset = None
+    offline_dataset_ref = config.get("offline_datasets", {}).get(root_dir)
+    if offline_dataset_ref is not None:
+      offline_dataset = ray.get(offline_dataset_ref)
+
+    # Configure shaping
+    shaping = None
+    shaping_file = osp.join(root_dir, "shaping.pkl")
+    if artifact_util.isfile(shaping_file):
+      logger.info("Load shaping.")
+      shaping = shapings.EnsembleShaping.load(shaping_file)
+    if "shaping" in params.keys() and not (run_state and shaping):
+      logger.info("Train shaping.")
+      shaping = shapings.EnsembleShaping(**params["shaping"], **env_params)
+      shaping.before_training_hook(data_dir=root_dir,
+                                   env=make_env(),
+                                   offline_dataset=offline_dataset)
+      with profiler.phase("shaping"):
+        shaping.train(report=not self._sync_evaluation)
+      shaping.after_training_hook()
+      shaping.save(shaping_file)
+      report_profile(root_dir, "ShapingProfile", 0, mode="shaping", epoch=0)
+    self.shaping = shaping
+
+    # Configure pre-trained agent
+    pretrained_agent = None
+    if params["pretrained"]:
+      pretrained_file = osp.join(root_dir, params["pretrained"] + ".pkl")
+      logger.info("Load pretrained agent: {}.".format(pretrained_file))
+      pretrained_agent = agents.load_policy(pretrained_file)
+
+    # Configure agents and drivers.
+    agent_params = params["agent"]
+    agent = agents.AGENTS[params["algo"]](**agent_params, **env_params)
+    self.agent = agent
+
+    # Exploration steps copies of the environment together if expl_num_envs > 1.
+    vector = params["expl_num_envs"] > 1
+    make_expl_env = make_env
+    if vector:
+      make_expl_env, _ = get_env_constructor_and_config(
+          params=params, num_envs=params["expl_num_envs"])
+    self._random_driver = config_driver(
+        params["fix_T"],
+        params["seed"],
+        vector=vector,
+        make_env=make_expl_env,
+        policy=policies.RandomPolicy(env_params["dims"]["o"],
+                                     env_params["dims"]["u"],
+                                     env_params["max_u"]),
+        num_steps=params["expl_num_steps_per_cycle"],
+        num_episodes=params["expl_num_episodes_per_cycle"])
+    self._expl_driver = config_driver(
+        params["fix_T"],
+        params["seed"],
+        vector=vector,
+        make_env=make_expl_env,
+        policy=agent.expl_policy,
+        num_steps=params["expl_num_steps_per_cycle"],
+        num_episodes=params["expl_num_episodes_per_cycle"])
+
+    self._offline_testing_metrics = [
+        metrics.EnvironmentSteps(),
+        metrics.NumberOfEpisodes(),
+        metrics.AverageReturnMetric(),
+        metrics.AverageEpisodeLengthMetric(),
+    ]
+    self._training_metrics = [
+        metrics.EnvironmentSteps(),
+        metrics.NumberOfEpisodes(),
+        metrics.AverageReturnMetric(),
+        metrics.AverageEpisodeLengthMetric(),
+    ]
+    self._testing_metrics = [
+        metrics.EnvironmentSteps(),
+        metrics.NumberOfEpisodes(),
+        metrics.AverageReturnMetric(),
+        metrics.AverageEpisodeLengthMetric(),
+    ]
+
+    # Learning parameters
+    self._offline_num_epochs = params["offline_num_epochs"]
+    self._offline_num_batches_per_epoch = params[
+        "offline_num_batches_per_epoch"]
+    self._random_exploration_cycles = params["random_expl_num_cycles"]
+    self._num_epochs = params["num_epochs"]
+    self._num_cycles_per_epoch = params["num_cycles_per_epoch"]
+    self._num_batches_per_cycle = params["num_batches_per_cycle"]
+
+    # Run state snapshots, see the class docstring
+    self._snapshot_epochs = config.get("snapshot_epochs", 0)
+    self._snapshot_cycles = config.get("snapshot_cycles", 0)
+
+    # Setup policy saving
+    self._save_interval = 0
+    self._policy_path = osp.join(root_dir, "policies")
+    os.makedirs(self._policy_path, exist_ok=True)
+    self._ckpt_path = osp.join(root_dir, "ckpts")
+    if osp.exists(self._ckpt_path) and run_state is None:
+      logger.warning("Loading from an checkpoint. Be careful!")
+      agent.load(self._ckpt_path)
+    os.makedirs(self._ckpt_path, exist_ok=True)
+
+    # Load offline data and initialize shaping
+    with profiler.phase("before_training"):
+      agent.before_training_hook(data_dir=root_dir,
+                                 env=make_env(),
+                                 offline_dataset=offline_dataset,
+                                 shaping=shaping,
+                                 pretrained_agent=pretrained_agent)
+
+    # Evaluate in background workers, after the agent is fully configured.
+    eval_env_config = dict(env_name=params["env_name"],
+                           env_args=params["env_args"],
+                           r_scale=params["r_scale"],
+                           r_shift=params["r_shift"])
+    self._eval_worker = evaluator.Evaluator(
+        agent,
+        eval_env_config,
+        make_env,
+        params["seed"],
+        fix_T=params["fix_T"],
+        num_steps=params["eval_num_steps_per_cycle"],
+        num_episodes=params["eval_num_episodes_per_cycle"],
+        num_workers=params["eval_num_workers"])
+
+    self._offline_epoch = 0
+    self._online_epoch = 0
+    self._cycle = 0
+    # trial epoch of the last finished evaluation of each mode
+    self._evaluated_epochs = dict(offline=None, online=None)
+    self._online_started = False
+    if run_state is not None:
+      self._load_run_state(run_state)
+      return
+    self._start_offline()
+    if self._offline_num_epochs == 0:
+      self._start_online()
+
+  @property
+  def done(self):
+    return (self._offline_epoch >= self._offline_num_epochs and
+            self._online_epoch >= self._num_epochs)
+
+  def train_epoch(self):
+    """Trains the next epoch, returns the results to report to Tune, with the
+    number of epochs trained so far as trial_epoch (the time unit of the trial
+    schedulers). Without a trial scheduler, evaluations finish in the
+    background and average_return is that of the last finished one, trained
+    for evaluation_trial_epoch epochs.
+    """
+    if self._offline_epoch < self._offline_num_epochs:
+      result = self._train_offline_epoch(self._offline_epoch)
+      self._offline_epoch += 1
+      if self._offline_epoch == self._offline_num_epochs:
+        self._start_online()
+    else:
+      result = self._train_online_epoch(self._online_epoch)
+      self._online_epoch += 1
+      self._cycle = 0
+    result["trial_epoch"] = self._offline_epoch + self._online_epoch
+    if (self._snapshot_epochs > 0 and
+        (self._offline_epoch + self._online_epoch) % self._snapshot_epochs
+        == 0):
+      with profiler.phase("snapshot"):
+        self.save_run_state()
+    return result
+
+  def save_run_state(self):
+    """Writes the run state, see the class docstring."""
+    os.makedirs(self._run_state_dir, exist_ok=True)
+    buffer_dir = osp.join(self._run_state_dir, "online_buffer")
+    buffer_manifest = buffer_size = None
+    if self._online_started:
+      buffer = self.agent.online_buffer
+      buffer_manifest = buffer.save_snapshot(buffer_dir)
+      buffer_size = buffer.current_size
+    # own checkpoints, those of the epochs are replaced more often
+    checkpoint = self.agent.save_checkpoint(
+        osp.join(self._run_state_dir, "ckpts"))
+    self.agent.sync_checkpoint()
+    self._eval_worker.poll()
+    run_state = dict(
+        offline_epoch=self._offline_epoch,
+        online_epoch=self._online_epoch,
+        cycle=self._cycle,
+        online_started=self._online_started,
+        online_buffer_manifest=buffer_manifest,
+        online_buffer_size=buffer_size,
+        checkpoint=osp.basename(checkpoint),
+        num_evaluations=self._eval_worker.num_finished,
+        random_state=random.getstate(),
+        np_random_state=np.random.get_state(),
+        offline_testing_metrics=self._offline_testing_metrics,
+        training_metrics=self._training_metrics,
+        testing_metrics=self._testing_metrics,
+        evaluated_epochs=self._evaluated_epochs,
+    )
+    # written last and atomically, the run state only refers to complete files
+    run_state_file = osp.join(self._run_state_dir, "state.pkl")
+    tmp = "{}.tmp-{}".format(run_state_file, os.getpid())
+    with open(tmp, "wb") as f:
+      pickle.dump(run_state, f)
+    os.replace(tmp, run_state_file)
+    # the previous buffer snapshot is only removed once it is not referred to
+    if buffer_manifest is not None:
+      self.agent.online_buffer.prune_snapshots(buffer_dir, buffer_manifest)
+
+  def _load_run_state(self, run_state):
+    self._offline_epoch = run_state["offline_epoch"]
+    self._online_epoch = run_state["online_epoch"]
+    self._cycle = run_state["cycle"]
+    if run_state["online_started"]:
+      self._online_started = True
+      self.agent.before_online_hook()  # before loading, it may set weights
+      self.agent.online_buffer.load_snapshot(
+          osp.join(self._run_state_dir, "online_buffer"),
+          run_state["online_buffer_manifest"])
+      assert (self.agent.online_buffer.current_size ==
+              run_state["online_buffer_size"]), "Inconsistent buffer snapshot."
+    else:
+      self.agent.before_offline_hook()
+    ckpt_path = osp.join(self._run_state_dir, "ckpts")
+    self.agent.load(ckpt_path,
+                    checkpoint=osp.join(ckpt_path, run_state["checkpoint"]))
+    self._eval_worker.num_evaluations = run_state["num_evaluations"]
+    self._offline_testing_metrics = run_state["offline_testing_metrics"]
+    self._training_metrics = run_state["training_metrics"]
+    self._testing_metrics = run_state["testing_metrics"]
+    self._evaluated_epochs = run_state["evaluated_epochs"]
+    random.setstate(run_state["random_state"])
+    np.random.set_state(run_state["np_random_state"])
+    # Drivers start new episodes with new seeds, op seeds of tensorflow are
+    # derived again (the states of its random ops cannot be saved).
+    num_steps = int(self._training_metrics[0].result())
+    seed = int(
+        np.random.SeedSequence([self._seed, num_steps]).generate_state(1)[0])
+    tf.random.set_seed(seed)
+    self._random_driver.seed(seed)
+    self._expl_driver.seed(seed)
+    for metric in self._training_metrics:
+      metric.discard_episode()
+
+  def set_hyperparameters(self, potential_weight=None, **hyperparameters):
+    """Changes hyperparameters of the agent and the potential weight of the
+    shaping, see Agent.set_hyperparameters.
+    """
+    self.logger.info("Set hyperparameters: {}.".format(
+        dict(potential_weight=potential_weight, **hyperparameters)))
+    self.agent.set_hyperparameters(**hyperparameters)
+    if potential_weight is not None:
+      assert self.shaping is not None, "The trial has no shaping."
+      self.shaping.set_hyperparameters(potential_weight=potential_weight)
+
+  def get_state(self):
+    """Returns the progress and a copy of the weights of the trial."""
+    return dict(offline_epoch=self._offline_epoch,
+                online_epoch=self._online_epoch,
+                agent=self.agent.get_weights(),
+                shaping=None
+                if self.shaping is None else self.shaping.get_weights())
+
+  def set_state(self, state):
+    """Continues training from a state returned by get_state, possibly of
+    another trial. Replay buffers and environments are not part of it.
+    """
+    self._offline_epoch = state["offline_epoch"]
+    self._online_epoch = state["online_epoch"]
+    if (self._offline_epoch >= self._offline_num_epochs and
+        not self._online_started):
+      self._start_online()  # before loading the weights, it may replace them
+    self.agent.set_weights(state["agent"])
+    if state["shaping"] is not None:
+      self.shaping.set_weights(state["shaping"])
+
+  def close(self):
+    self.agent.wait_for_saves()
+    self._eval_worker.close()
+
+  def _evaluate(self, offline, trial_epoch):
+    """Evaluates the agent after trial_epoch epochs, see _performance."""
+    key = "offline" if offline else "online"
+    evaluated = _EvaluatedEpoch(self._evaluated_epochs, key, trial_epoch)
+    if offline:
+      self._eval_worker.evaluate(
+          observers=self._offline_testing_metrics + [evaluated],
+          summarized=self._offline_testing_metrics[2:],
+          name_scope="OfflineTesting",
+          step=self.agent.offline_training_step,
+          step_metrics=self._offline_testing_metrics[:2])
+    else:
+      self._eval_worker.evaluate(observers=self._testing_metrics + [evaluated],
+                                 summarized=self._testing_metrics[2:],
+                                 name_scope="OnlineTesting",
+                                 step_metrics=self._training_metrics[:2])
+
+  def _performance(self, offline):
+    if self._sync_evaluation:  # the evaluation of this epoch
+      self._eval_worker.poll(block=True)
+    metric = (self._offline_testing_metrics[2]
+              if offline else self._testing_metrics[2])
+    average_return = float(metric.result())
+    scope = "OfflineTesting" if offline else "OnlineTesting"
+    # the evaluation of an earlier epoch if that of this one is still running
+    evaluated_epoch = self._evaluated_epochs["offline" if offline else "online"]
+    return {
+        "average_return": average_return,
+        "evaluation_trial_epoch": evaluated_epoch,
+        scope + "/AverageReturn": average_return,
+    }
+
+  def _start_offline(self):
+    self.agent.before_offline_hook()
+    with profiler.phase("offline_eval"):
+      self._evaluate(offline=True, trial_epoch=0)
+
+  def _start_online(self):
+    self._online_started = True
+    self.agent.before_online_hook()
+    with profiler.phase("online_eval"):
+      self._evaluate(offline=False,
+                     trial_epoch=self._offline_epoch + self._online_epoch)
+
+    with profiler.phase("random_rollout"):
+      for _ in range(self._random_exploration_cycles):
+        experiences = self._random_driver.generate_rollouts(
+            observers=self._training_metrics)
+        self.agent.store_experiences(experiences)
+
+  def _train_offline_epoch(self, epoch):
+    with profiler.phase("offline_train"):
+      for _ in range(self._offline_num_batches_per_epoch):
+        self.agent.train_offline()
+
+    with profiler.phase("offline_eval"):
+      self._evaluate(offline=True,
+                     trial_epoch=self._offline_epoch + self._online_epoch + 1)
+
+    with profiler.phase("save"):
+      self.agent.save(
+          osp.join(self._policy_path, "offline_policy_latest.pkl"),
+          self._ckpt_path)
+    self.logger.info("Saving agent after offline training.")
+
+    profile = report_profile(self.root_dir,
+                             "OfflineProfile",
+                             epoch,
+                             mode="offline",
+                             epoch=epoch)
+    return dict(mode="offline",
+                epoch=epoch,
+                **self._performance(offline=True),
+                **profile)
+
+  def _train_online_epoch(self, epoch):
+    while self._cycle < self._num_cycles_per_epoch:
+      with profiler.phase("expl_rollout"):
+        experiences = self._expl_driver.generate_rollouts(
+            observers=self._training_metrics)
+      with profiler.phase("store"):
+        self.agent.store_experiences(experiences)
+      with profiler.phase("online_train"):
+        for _ in range(self._num_batches_per_cycle):
+          self.agent.train_online()
+      self._cycle += 1
+      if (self._snapshot_cycles > 0 and
+          self._cycle % self._snapshot_cycles == 0 and
+          self._cycle < self._num_cycles_per_epoch):
+        with profiler.phase("snapshot"):
+          self.save_run_state()
+
+    with profiler.phase("online_eval"):
+      self._evaluate(offline=False,
+                     trial_epoch=self._offline_epoch + self._online_epoch + 1)
+    with profiler.phase("metric_summary"):
+      with tf.name_scope("OnlineTraining"):
+        for metric in self._training_metrics[2:]:
+          metric.summarize(step_metrics=self._training_metrics[:2])
 
     # Save the agent periodically.
-    if (save_interval > 0 and epoch % save_interval == save_interval - 1):
-      agent.save(osp.join(policy_path, "online_policy_{}.pkl".format(epoch)))
-    agent.save(osp.join(policy_path, "online_policy_latest.pkl"), ckpt_path)
-    logger.info("Saving agent after online training.")
+    with profiler.phase("save"):
+      save_interval = self._save_interval
+      if (save_interval > 0 and epoch % save_interval == save_interval - 1):
+        self.agent.save(
+            osp.join(self._policy_path, "online_policy_{}.pkl".format(epoch)))
+      self.agent.save(
+          osp.join(self._policy_path, "online_policy_latest.pkl"),
+          self._ckpt_path)
+    self.logger.info("Saving agent after online training.")
+
+    profile = report_profile(self.root_dir,
+                             "OnlineProfile",
+                             epoch,
+                             mode="online",
+                             epoch=epoch)
+    return dict(mode="online",
+                epoch=epoch,
+                **self._performance(offline=False),
+                **profile)
 
-    # For ray status updates
+
+def main(config):
+  trainer = Trainer(config)
+  while not trainer.done:
+    result = trainer.train_epoch()
+    # For ray status updates and trial schedulers
     if ray.is_initialized():
       try:
-        tune.report(mode="online", epoch=epoch)  # ray 0.8.6
+        tune.report(**result)  # ray 0.8.6
       except:
-        tune.track.log(mode="online", epoch=epoch)  # previous versions
\ No newline at end of file
+        tune.track.log(**result)  # previous versions
+  trainer.close()
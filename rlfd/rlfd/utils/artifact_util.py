@@ -0,0 +1,95 @@
+"""Content-addressed store of the files shared by the trials of an experiment.
+
+The launcher puts pretrained policies (.pkl) and demonstrations (.npz) of the
+experiment directory into <exp_dir>/.artifacts once, named by their sha1, and
+hardlinks them into every trial directory. Where hardlinks are not supported
+it falls back to symlinks and, failing that, to an artifacts.json manifest in
+the trial directory mapping file names to stored paths. Readers go through
+resolve, which handles all three.
+
+Stored files are shared by every trial, never write into them: replace them
+instead (write a temporary file and os.replace it).
+"""
+import hashlib
+import json
+import os
+import shutil
+osp = os.path
+
+STORE_DIR = ".artifacts"
+MANIFEST_FILE = "artifacts.json"
+
+
+def file_sha1(path, chunk_size=1 << 20):
+  """Hex sha1 of the content of a file. Stored artifacts are named by their
+  sha1, it is read from the name instead of the content for them.
+  """
+  path = osp.realpath(resolve(path))
+  if osp.basename(osp.dirname(path)) == STORE_DIR:
+    return osp.splitext(osp.basename(path))[0]
+  digest = hashlib.sha1()
+  with open(path, "rb") as f:
+    for chunk in iter(lambda: f.read(chunk_size), b""):
+      digest.update(chunk)
+  return digest.hexdigest()
+
+
+def store(path, exp_dir):
+  """Adds the file to the store of exp_dir unless an identical file is already
+  there, returns the path of the stored file.
+  """
+  store_dir = osp.join(exp_dir, STORE_DIR)
+  os.makedirs(store_dir, exist_ok=True)
+  stored = osp.join(store_dir, file_sha1(path) + osp.splitext(path)[1])
+  if not osp.isfile(stored):
+    # copy (not link) so that rewriting the source later leaves the stored
+    # file intact, and rename so that it is never seen partially written
+    tmp = "{}.tmp-{}".format(stored, os.getpid())
+    shutil.copyfile(path, tmp)
+    os.replace(tmp, stored)
+  return stored
+
+
+def link(stored, destination):
+  """Makes destination refer to the stored file, replacing what was there."""
+  if osp.lexists(destination):
+    os.remove(destination)
+  try:
+    os.link(stored, destination)
+    return
+  except OSError:  # e.g. the store is on another file system
+    pass
+  try:
+    os.symlink(osp.abspath(stored), destination)
+    return
+  except OSError:
+    pass
+  manifest_file = osp.join(osp.dirname(destination), MANIFEST_FILE)
+  manifest = _read_manifest(osp.dirname(destination))
+  manifest[osp.basename(destination)] = osp.abspath(stored)
+  with open(manifest_file, "w") as f:
+    json.dump(manifest, f, indent=2)
+
+
+def resolve(path):
+  """Path to read the file at path from: path itself if it exists (a regular
+  file, a hardlink or a symlink), otherwise the stored file listed in the
+  manifest of its directory. Returns path if neither exists.
+  """
+  if osp.exists(path):
+    return path
+  manifest = _read_manifest(osp.dirname(path))
+  return manifest.get(osp.basename(path), path)
+
+
+def isfile(path):
+  """osp.isfile for paths that may be resolved through the store."""
+  return osp.isfile(resolve(path))
+
+
+def _read_manifest(directory):
+  manifest_file = osp.join(directory, MANIFEST_FILE)
+  if not osp.isfile(manifest_file):
+    return {}
+  with open(manifest_file, "r") as f:
+    return json.load(f)
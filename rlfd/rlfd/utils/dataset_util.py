@@ -0,0 +1,117 @@
+"""Process-wide, on-disk cache of D4RL datasets.
+
+Each task is converted once into a directory of uncompressed .npy files (one
+per key) plus an index.json holding shapes, dtypes, file sizes and checksums.
+Later calls memory-map the arrays read-only instead of decoding the HDF5 file
+again. Loading checks shapes, dtypes and file sizes only, pages are read when
+they are used. Checksums are computed when the cache is built, for manual
+verification.
+"""
+import hashlib
+import json
+import os
+import shutil
+osp = os.path
+
+import numpy as np
+
+from rlfd.utils.util import get_cache_dir
+
+INDEX_FILE = "index.json"
+FORMAT_VERSION = 2
+
+# Datasets already mapped (and validated) by this process, keyed by env name.
+_DATASETS = {}
+
+
+def _checksum(array, chunk_size=1 << 24):
+  sha1 = hashlib.sha1()
+  flat = array.reshape(-1).view(np.uint8)
+  for start in range(0, flat.shape[0], chunk_size):
+    sha1.update(flat[start:start + chunk_size])
+  return sha1.hexdigest()
+
+
+def _dataset_dir(env_name, cache_dir):
+  cache_dir = cache_dir if cache_dir else get_cache_dir("d4rl")
+  return osp.join(cache_dir, env_name)
+
+
+def _write(dataset_dir, dataset):
+  """Writes the dataset into a temporary directory and renames it into place so
+  that concurrent trials never observe a partially written cache. An invalid
+  cache in its place is renamed away first and removed after, files mapped by
+  other processes stay valid until they are unmapped.
+  """
+  tmp_dir = "{}.tmp-{}".format(dataset_dir, os.getpid())
+  shutil.rmtree(tmp_dir, ignore_errors=True)
+  os.makedirs(tmp_dir)
+  index = {"version": FORMAT_VERSION, "arrays": {}}
+  for k, v in dataset.items():
+    v = np.ascontiguousarray(v)
+    np.save(osp.join(tmp_dir, k + ".npy"), v)
+    index["arrays"][k] = dict(shape=list(v.shape),
+                              dtype=v.dtype.str,
+                              size=osp.getsize(osp.join(tmp_dir, k + ".npy")),
+                              sha1=_checksum(v))
+  with open(osp.join(tmp_dir, INDEX_FILE), "w") as f:
+    json.dump(index, f)
+  stale_dir = "{}.stale-{}".format(dataset_dir, os.getpid())
+  try:
+    os.rename(dataset_dir, stale_dir)
+  except OSError:  # no invalid cache
+    stale_dir = None
+  try:
+    os.rename(tmp_dir, dataset_dir)
+  except OSError:  # another process finished first
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+  if stale_dir is not None:
+    shutil.rmtree(stale_dir, ignore_errors=True)
+
+
+def _read(dataset_dir):
+  """Maps the cached arrays read-only. Returns None if the cache is missing,
+  outdated or truncated.
+  """
+  index_file = osp.join(dataset_dir, INDEX_FILE)
+  if not osp.isfile(index_file):
+    return None
+  with open(index_file, "r") as f:
+    index = json.load(f)
+  if index.get("version") != FORMAT_VERSION:
+    return None
+  dataset = {}
+  for k, meta in index["arrays"].items():
+    array_file = osp.join(dataset_dir, k + ".npy")
+    try:
+      if osp.getsize(array_file) != meta["size"]:
+        return None
+      v = np.load(array_file, mmap_mode="r")
+    except (IOError, OSError, ValueError):
+      return None
+    if list(v.shape) != meta["shape"] or v.dtype.str != meta["dtype"]:
+      return None
+    dataset[k] = v
+  return dataset
+
+
+def load_dataset(env_name, get_dataset, cache_dir=None):
+  """Returns the dataset of a D4RL task as a dict of read-only arrays.
+
+  Args:
+    env_name    (str)      - registered name of the task, including its version
+    get_dataset (function) - returns the dataset as a dict of arrays, only called
+                             when the task is not cached yet
+    cache_dir   (str)      - cache location, defaults to ~/.rlfd/d4rl
+  """
+  if env_name in _DATASETS:
+    return _DATASETS[env_name]
+  dataset_dir = _dataset_dir(env_name, cache_dir)
+  dataset = _read(dataset_dir)
+  if dataset is None:
+    _write(dataset_dir, get_dataset())
+    dataset = _read(dataset_dir)
+    assert dataset is not None, "Failed to cache dataset of {}.".format(
+        env_name)
+  _DATASETS[env_name] = dataset
+  return dataset
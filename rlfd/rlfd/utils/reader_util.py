@@ -1,10 +1,17 @@
 """Mostly adopted from OpenAI baselines: https://github.com/openai/baselines
 """
 import json
+import os
+import struct
+osp = os.path
 
 import numpy as np
 import pandas
 
+# Conversion state of the event files, stored next to the csv files.
+CONVERSION_CACHE = ".conversion_cache.json"
+CONVERSION_CACHE_VERSION = 1
+
 
 def read_json(fname):
   ds = []
@@ -24,7 +31,7 @@ def load_csv(fname):
   if len(lines) < 2:
     return None
   keys = [name.strip() for name in lines[0].split(",")]
-  data = np.genfromtxt(fname, delimiter=",", skip_header=1, filling_values=0.0)
+  data = np.genfromtxt(lines[1:], delimiter=",", filling_values=0.0)
   if data.ndim == 1:
     data = data.reshape(1, -1)
   assert data.ndim == 2
@@ -33,3 +40,108 @@ def load_csv(fname):
   for idx, key in enumerate(keys):
     result[key] = data[:, idx]
   return result
+
+
+def read_events(fname, offset=0):
+  """Reads the records of a TensorBoard event file starting from byte offset.
+  A record that is not completely written yet ends the iteration.
+
+  Yields:
+      (event, end) - the Event proto and the offset right after its record
+  """
+  from tensorboard.compat.proto import event_pb2
+
+  with open(fname, "rb") as f:
+    f.seek(offset)
+    while True:
+      # uint64 length, uint32 length crc, data, uint32 data crc
+      header = f.read(12)
+      if len(header) < 12:
+        return
+      length, = struct.unpack("<Q", header[:8])
+      data = f.read(length)
+      footer = f.read(4)
+      if len(data) < length or len(footer) < 4:
+        return
+      offset += 12 + length + 4
+      yield event_pb2.Event.FromString(data), offset
+
+
+def _write_json(fname, data):
+  tmp_fname = "{}.tmp-{}".format(fname, os.getpid())
+  with open(tmp_fname, "w") as f:
+    json.dump(data, f)
+  os.replace(tmp_fname, fname)
+
+
+def convert_tensorboard_data_to_csv(path,
+                                    source_dir="summaries",
+                                    target_dir="csv_summaries"):
+  """Appends new scalar summaries of the event files in source_dir to one csv
+  file per tag in target_dir. The size, mtime and read offset of every event
+  file are cached so that unchanged files are skipped and growing files are
+  only parsed from where the last conversion stopped.
+  """
+  from tensorboard.util.tensor_util import make_ndarray
+
+  source_path = osp.join(path, source_dir)
+  target_path = osp.join(path, target_dir)
+  cache_file = osp.join(target_path, CONVERSION_CACHE)
+  os.makedirs(target_path, exist_ok=True)
+
+  cache = dict(version=CONVERSION_CACHE_VERSION, events={}, csvs={})
+  if osp.isfile(cache_file):
+    with open(cache_file, "r") as f:
+      cache = json.load(f)
+  event_files = sorted(f for f in os.listdir(source_path) if "tfevents" in f)
+  stats = {f: os.stat(osp.join(source_path, f)) for f in event_files}
+  if (cache.get("version") != CONVERSION_CACHE_VERSION or any(
+      f not in stats or stats[f].st_size < v["offset"]
+      for f, v in cache["events"].items()) or any(
+          not osp.isfile(osp.join(target_path, tag.replace("/", "_")))
+          for tag in cache["csvs"].keys())):  # convert from scratch
+    cache = dict(version=CONVERSION_CACHE_VERSION, events={}, csvs={})
+
+  # Read events that have not been converted yet.
+  new_data = {}
+  for f in event_files:
+    entry = cache["events"].get(f, dict(size=-1, mtime=-1, offset=0))
+    if (entry["size"] == stats[f].st_size and
+        entry["mtime"] == stats[f].st_mtime):
+      continue
+    for event, offset in read_events(osp.join(source_path, f),
+                                     entry["offset"]):
+      for value in event.summary.value:
+        if value.HasField("tensor"):
+          y = float(make_ndarray(value.tensor))
+        elif value.HasField("simple_value"):
+          y = value.simple_value
+        else:
+          continue
+        new_data.setdefault(value.tag, []).append((event.step, y))
+      entry["offset"] = offset
+    entry["size"] = stats[f].st_size
+    entry["mtime"] = stats[f].st_mtime
+    cache["events"][f] = entry
+
+  # Append them to the csv files, dropping anything written after the last
+  # successful conversion.
+  for tag, xy_data in new_data.items():
+    # This is hardcoded in the tensorboard output
+    try:
+      y_label, x_label = tag.split(" vs ")
+    except ValueError:
+      y_label = tag
+      x_label = "Step"
+    csv_file = osp.join(target_path, tag.replace("/", "_"))
+    entry = cache["csvs"].get(tag, dict(rows=0, size=0))
+    with open(csv_file, "a+") as f:
+      f.truncate(entry["size"])
+      if entry["rows"] == 0:
+        f.write(",{},{}\n".format(y_label, x_label))
+      for i, (x, y) in enumerate(xy_data):
+        f.write("{},{},{}\n".format(entry["rows"] + i, repr(y), float(x)))
+      entry["rows"] += len(xy_data)
+      entry["size"] = f.tell()
+    cache["csvs"][tag] = entry
+  _write_json(cache_file, cache)
@@ -0,0 +1,191 @@
+"""Consolidated, columnar store of the summaries of all runs in an experiment
+directory.
+
+The store is a single results.npz file in the experiment directory with one row
+per run (directory, params, signature), one row per series (run, tag, labels,
+offset) and the x/y values of all series concatenated into two flat columns.
+Runs are only re-read when the stats of their event or params files change.
+"""
+import json
+import multiprocessing
+import os
+osp = os.path
+
+import numpy as np
+
+from rlfd.utils.reader_util import convert_tensorboard_data_to_csv, load_csv
+
+STORE_FILE = "results.npz"
+STORE_VERSION = 1
+
+
+def _find_runs(rootdir):
+  """Returns the run directories (those with params.json and summaries) under
+  rootdir without descending into them.
+  """
+  dirnames = []
+  for dirname, subdirs, files in os.walk(rootdir):
+    if "params.json" in files and "summaries" in subdirs:
+      dirnames.append(dirname)
+      subdirs[:] = []
+  return sorted(dirnames)
+
+
+def _signature(dirname, source_dir="summaries"):
+  stats = []
+  for f in ("params.json", "params_renamed.json"):
+    if osp.isfile(osp.join(dirname, f)):
+      stat = os.stat(osp.join(dirname, f))
+      stats.append("{}:{}:{}".format(f, stat.st_size, stat.st_mtime))
+  for f in sorted(os.listdir(osp.join(dirname, source_dir))):
+    stat = os.stat(osp.join(dirname, source_dir, f))
+    stats.append("{}:{}:{}".format(f, stat.st_size, stat.st_mtime))
+  return ";".join(stats)
+
+
+def _read_run(dirname, source_dir="summaries", target_dir="csv_summaries"):
+  """Returns the params and the list of (tag, y_label, x_label, x, y) of a run."""
+  convert_tensorboard_data_to_csv(dirname, source_dir, target_dir)
+  series = []
+  for csv in sorted(os.listdir(osp.join(dirname, target_dir))):
+    if csv.startswith("."):
+      continue
+    progress = load_csv(osp.join(dirname, target_dir, csv))
+    if progress is None:
+      continue
+    y_label, x_label = [k for k in progress.keys() if k != ""]
+    series.append(
+        (csv, y_label, x_label, progress[x_label], progress[y_label]))
+  # search for the renamed file first
+  paramsjson = osp.join(dirname, "params_renamed.json")
+  if not osp.exists(paramsjson):
+    paramsjson = osp.join(dirname, "params.json")
+  with open(paramsjson, "r") as f:
+    params = json.load(f)
+  return params, series
+
+
+class ResultsStore(object):
+
+  def __init__(self, rootdir):
+    """Columnar store of the summaries of all runs under rootdir.
+
+    Args:
+        rootdir (str) - experiment directory, the store is saved in it
+    """
+    self.rootdir = osp.abspath(osp.expanduser(rootdir))
+    self.store_file = osp.join(self.rootdir, STORE_FILE)
+    self._runs = []  # [(dirname, params, signature)]
+    self._series = []  # [(run, tag, y_label, x_label, x, y)]
+    if osp.isfile(self.store_file):
+      self._load()
+
+  def _load(self):
+    with np.load(self.store_file) as data:
+      if int(data["version"]) != STORE_VERSION:
+        return
+      columns = {k: data[k] for k in data.files}
+    self._runs = [(osp.join(self.rootdir, d), json.loads(p), s)
+                  for d, p, s in zip(columns["run_dirs"], columns["run_params"],
+                                     columns["run_signatures"])]
+    offsets = columns["series_offsets"]
+    self._series = [
+        (r, t, yl, xl, columns["x"][b:e], columns["y"][b:e])
+        for r, t, yl, xl, b, e in zip(
+            columns["series_run"], columns["series_tag"],
+            columns["series_y_label"], columns["series_x_label"],
+            offsets[:-1], offsets[1:])
+    ]
+
+  def _save(self):
+    lengths = [len(s[4]) for s in self._series]
+    columns = dict(
+        version=np.array(STORE_VERSION),
+        run_dirs=np.array(
+            [osp.relpath(r[0], self.rootdir) for r in self._runs], dtype=str),
+        run_params=np.array([json.dumps(r[1]) for r in self._runs],
+                            dtype=str),
+        run_signatures=np.array([r[2] for r in self._runs], dtype=str),
+        series_run=np.array([s[0] for s in self._series], dtype=np.int64),
+        series_tag=np.array([s[1] for s in self._series], dtype=str),
+        series_y_label=np.array([s[2] for s in self._series], dtype=str),
+        series_x_label=np.array([s[3] for s in self._series], dtype=str),
+        series_offsets=np.concatenate([[0], np.cumsum(lengths)
+                                      ]).astype(np.int64),
+        x=np.concatenate([np.zeros(0)] + [s[4] for s in self._series]),
+        y=np.concatenate([np.zeros(0)] + [s[5] for s in self._series]),
+    )
+    tmp_file = "{}.tmp-{}.npz".format(self.store_file, os.getpid())
+    np.savez(tmp_file, **columns)
+    os.replace(tmp_file, self.store_file)
+
+  def update(self, num_workers=None):
+    """Adds new runs and re-reads the runs whose files changed since the last
+    update. Runs are read in parallel by num_workers processes, defaults to the
+    number of cpus.
+    """
+    dirnames = _find_runs(self.rootdir)
+    signatures = [_signature(d) for d in dirnames]
+    cached = {r[0]: (i, r[2]) for i, r in enumerate(self._runs)}
+    changed = [
+        d for d, s in zip(dirnames, signatures)
+        if d not in cached or cached[d][1] != s
+    ]
+    if not changed and len(dirnames) == len(self._runs):
+      return False
+
+    num_workers = min(num_workers or os.cpu_count(), len(changed))
+    if num_workers <= 1:
+      read = list(map(_read_run, changed))
+    else:
+      with multiprocessing.Pool(num_workers) as pool:
+        read = pool.map(_read_run, changed, chunksize=1)
+    read = dict(zip(changed, read))
+
+    runs, series = [], []
+    for i, (d, s) in enumerate(zip(dirnames, signatures)):
+      if d in read:
+        params, run_series = read[d]
+        run_series = [(i,) + x for x in run_series]
+      else:
+        old_i = cached[d][0]
+        params = self._runs[old_i][1]
+        run_series = [(i,) + x[1:] for x in self._series if x[0] == old_i]
+      runs.append((d, params, s))
+      series += run_series
+    self._runs, self._series = runs, series
+    self._save()
+    return True
+
+  def query(self, config=None, env_name=None, tag=None):
+    """Returns the series matching the given config, env name and tag (all
+    optional), as a list of dicts with dirname, params, tag and the x/y values
+    under their labels.
+    """
+    csv_name = tag.replace("/", "_") if tag else None
+    results = []
+    for r, t, y_label, x_label, x, y in self._series:
+      dirname, params, _ = self._runs[r]
+      if ((config is not None and params.get("config") != config) or
+          (env_name is not None and params.get("env_name") != env_name) or
+          (csv_name is not None and t != csv_name)):
+        continue
+      results.append({
+          "dirname": dirname,
+          "params": params,
+          "tag": t,
+          y_label: y,
+          x_label: x
+      })
+    return results
+
+  def to_results(self):
+    """Returns the runs in the format of plot.load_results."""
+    results = [{
+        "dirname": d,
+        "params": p,
+        "progress": dict()
+    } for d, p, _ in self._runs]
+    for r, t, y_label, x_label, x, y in self._series:
+      results[r]["progress"][t] = {y_label: y, x_label: x}
+    return results
@@ -0,0 +1,121 @@
+"""Append-only shards of episodes and their merge into a single npz file.
+
+A shard is a directory with one raw binary file per key, to which episodes are
+appended as they finish, plus an index.json holding the dtype and shape of
+every key and the number of complete episodes. The index is replaced after an
+episode is fully written, so a crashed writer loses at most the episode it was
+writing and can be resumed. merge_shards streams the shards into an npz file
+in the format expected by ReplayBuffer.load_from_file and construct_from_file
+without loading them into memory.
+"""
+import json
+import os
+import zipfile
+osp = os.path
+
+import numpy as np
+
+INDEX_FILE = "index.json"
+FORMAT_VERSION = 1
+
+
+def _read_index(shard_dir):
+  index_file = osp.join(shard_dir, INDEX_FILE)
+  if not osp.isfile(index_file):
+    return None
+  with open(index_file, "r") as f:
+    index = json.load(f)
+  if index.get("version") != FORMAT_VERSION:
+    return None
+  return index
+
+
+class ShardWriter(object):
+
+  def __init__(self, shard_dir):
+    """Appends episodes to the shard in shard_dir, after the complete episodes
+    already in it.
+
+    Args:
+        shard_dir (str) - directory of the shard, created if needed
+    """
+    self.shard_dir = shard_dir
+    os.makedirs(shard_dir, exist_ok=True)
+    self._index = _read_index(shard_dir)
+    if self._index is None:
+      self._index = {"version": FORMAT_VERSION, "num_episodes": 0, "keys": {}}
+    self._files = {}
+    for k, v in self._index["keys"].items():
+      self._files[k] = self._open(k, v)
+
+  def _open(self, key, info):
+    f = open(osp.join(self.shard_dir, key + ".bin"), "ab")
+    # drop an episode that was partially written before a crash
+    f.truncate(info["rows"] * np.dtype(info["dtype"]).itemsize *
+               int(np.prod(info["shape"])))
+    return f
+
+  @property
+  def num_episodes(self):
+    return self._index["num_episodes"]
+
+  def append(self, episode):
+    """Appends an episode, a dict of arrays with steps or episodes along their
+    first dimension.
+    """
+    keys = self._index["keys"]
+    if not keys:
+      for k, v in episode.items():
+        keys[k] = dict(dtype=v.dtype.str, shape=list(v.shape[1:]), rows=0)
+        self._files[k] = self._open(k, keys[k])
+    assert episode.keys() == keys.keys(), "Inconsistent keys."
+    for k, v in episode.items():
+      v = np.ascontiguousarray(v, dtype=keys[k]["dtype"])
+      assert list(v.shape[1:]) == keys[k]["shape"], "Inconsistent shape."
+      self._files[k].write(v.tobytes())
+      self._files[k].flush()
+      keys[k]["rows"] += v.shape[0]
+    self._index["num_episodes"] += 1
+    tmp_file = osp.join(self.shard_dir, INDEX_FILE + ".tmp")
+    with open(tmp_file, "w") as f:
+      json.dump(self._index, f)
+    os.replace(tmp_file, osp.join(self.shard_dir, INDEX_FILE))
+
+  def close(self):
+    for f in self._files.values():
+      f.close()
+    self._files = {}
+
+
+def merge_shards(shard_dirs, path, compress=True, chunk_size=1 << 26):
+  """Concatenates the shards, in the given order, into the npz file path."""
+  indices = [_read_index(d) for d in shard_dirs]
+  assert all(indices), "Missing shard index."
+  keys = indices[0]["keys"]
+  for index in indices[1:]:
+    assert index["keys"].keys() == keys.keys(), "Inconsistent keys."
+    for k, info in index["keys"].items():
+      assert info["dtype"] == keys[k]["dtype"], "Inconsistent dtype."
+      assert info["shape"] == keys[k]["shape"], "Inconsistent shape."
+  tmp_path = "{}.tmp-{}".format(path, os.getpid())
+  compression = zipfile.ZIP_DEFLATED if compress else zipfile.ZIP_STORED
+  with zipfile.ZipFile(tmp_path, "w", compression=compression) as zf:
+    for k, info in keys.items():
+      dtype = np.dtype(info["dtype"])
+      rows = sum(index["keys"][k]["rows"] for index in indices)
+      header = dict(descr=np.lib.format.dtype_to_descr(dtype),
+                    fortran_order=False,
+                    shape=tuple([rows] + info["shape"]))
+      with zf.open(k + ".npy", "w", force_zip64=True) as f:
+        np.lib.format.write_array_header_1_0(f, header)
+        row_size = dtype.itemsize * int(np.prod(info["shape"]))
+        for shard_dir, index in zip(shard_dirs, indices):
+          # only the complete episodes recorded in the index
+          remaining = index["keys"][k]["rows"] * row_size
+          with open(osp.join(shard_dir, k + ".bin"), "rb") as shard:
+            while remaining > 0:
+              chunk = shard.read(min(chunk_size, remaining))
+              assert chunk, "Shard is shorter than its index."
+              f.write(chunk)
+              remaining -= len(chunk)
+  os.replace(tmp_path, path)
@@ -0,0 +1,55 @@
+"""TensorFlow helpers shared by agents and shapings."""
+import inspect
+
+import tensorflow as tf
+
+if "jit_compile" in inspect.signature(tf.function).parameters:
+  _JIT_COMPILE_ARG = "jit_compile"
+else:  # tensorflow < 2.5
+  _JIT_COMPILE_ARG = "experimental_compile"
+
+
+def async_checkpoint_options():
+  """Options writing checkpoints in the background (tensorflow >= 2.12), None
+  for versions that only write them synchronously.
+  """
+  if not hasattr(tf.train, "CheckpointOptions"):
+    return None
+  parameters = inspect.signature(tf.train.CheckpointOptions).parameters
+  if not "experimental_enable_async_checkpoint" in parameters:
+    return None
+  return tf.train.CheckpointOptions(experimental_enable_async_checkpoint=True)
+
+
+def function(fn, jit_compile=False):
+  """tf.function of fn, compiled with XLA if jit_compile."""
+  if not jit_compile:
+    return tf.function(fn)
+  return tf.function(fn, **{_JIT_COMPILE_ARG: True})
+
+
+class compiled_method(object):
+  """Decorator that makes a method a tf.function, compiled with XLA if the
+  jit_compile attribute of its instance is True. The tf.function is created on
+  first access and cached in the instance, so jit_compile must be set before
+  the method is first used (usually in __init__).
+
+  Only the ops inside the method are compiled, it must not write summaries or
+  branch on values that change its output shapes. Python arguments (e.g. a bool
+  deciding whether a network is updated this step) are fine, every value is
+  traced and compiled once.
+  """
+
+  def __init__(self, fn):
+    self._fn = fn
+    self._name = fn.__name__
+    self.__doc__ = fn.__doc__
+
+  def __get__(self, instance, owner):
+    if instance is None:
+      return self
+    compiled = function(self._fn.__get__(instance, owner),
+                        jit_compile=getattr(instance, "jit_compile", False))
+    # bypass __setattr__ so that tf.Modules do not track the function
+    instance.__dict__[self._name] = compiled
+    return compiled
@@ -3,11 +3,16 @@
 import functools
 import importlib
 import inspect
+import logging
 import os
 import random
+import socket
+import tempfile
 
 import numpy as np
 
+logger = logging.getLogger(__name__)
+
 
 def set_global_seeds(seed):
   try:
@@ -26,3 +31,103 @@ def set_global_seeds(seed):
 
   np.random.seed(seed)
   random.seed(seed)
+
+
+def get_cache_dir(*subdirs):
+  """Returns (and creates) a directory for on-disk caches shared by all runs on
+  this machine. Override the location with the RLFD_CACHE_DIR variable.
+  """
+  cache_dir = os.environ.get("RLFD_CACHE_DIR",
+                             os.path.join(os.path.expanduser("~"), ".rlfd"))
+  cache_dir = os.path.join(cache_dir, *subdirs)
+  os.makedirs(cache_dir, exist_ok=True)
+  return cache_dir
+
+
+# Environment variables read by the BLAS and OpenMP thread pools when they are
+# first used.
+_THREAD_ENV_VARS = ("OMP_NUM_THREADS", "OPENBLAS_NUM_THREADS",
+                    "MKL_NUM_THREADS", "VECLIB_MAXIMUM_THREADS",
+                    "NUMEXPR_NUM_THREADS")
+# Lock files of the cores claimed by this process, kept open until it exits or
+# claims cores again, and the cores it could run on before.
+_CORE_LOCKS = []
+_AFFINITY = None
+
+
+def _core_lock_dir():
+  """Directory of the core lock files, local to this machine: shared memory,
+  or the temporary directory (with the host name in case it is shared).
+  """
+  if os.path.isdir("/dev/shm"):
+    lock_dir = "/dev/shm/rlfd_cpu_locks"
+  else:
+    lock_dir = os.path.join(tempfile.gettempdir(),
+                            "rlfd_cpu_locks_" + socket.gethostname())
+  os.makedirs(lock_dir, exist_ok=True)
+  return lock_dir
+
+
+def _claim_cores(num_cores):
+  """Claims num_cores of the cores this process may run on that are not
+  claimed by another process on this machine, using one lock file per core.
+  Returns the claimed cores, fewer than num_cores if not enough are free.
+  Cores claimed by a previous call are released first.
+  """
+  import fcntl
+  global _AFFINITY
+
+  while _CORE_LOCKS:
+    _CORE_LOCKS.pop().close()  # releases the lock
+  if _AFFINITY is None:
+    _AFFINITY = os.sched_getaffinity(0)
+  lock_dir = _core_lock_dir()
+  cores = []
+  for core in sorted(_AFFINITY):
+    if len(cores) == num_cores:
+      break
+    f = open(os.path.join(lock_dir, "core_{}.lock".format(core)), "w")
+    try:
+      fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+      f.close()
+      continue
+    _CORE_LOCKS.append(f)
+    cores.append(core)
+  return cores
+
+
+def configure_cpu_threads(num_threads, pin=False):
+  """Limits the tensorflow, numpy (BLAS) and OpenMP thread pools of this
+  process to num_threads, the CPUs allocated to it (e.g. the CPUs of a Ray
+  trial), so that concurrent processes do not oversubscribe the machine. Call
+  it before tensorflow is first used.
+
+  If pin, the process is also bound to num_threads cores not claimed by other
+  processes that called this function with pin (Linux only).
+  """
+  num_threads = max(int(num_threads), 1)
+  if pin and hasattr(os, "sched_setaffinity"):
+    cores = _claim_cores(num_threads)
+    if cores:
+      os.sched_setaffinity(0, cores)
+    else:
+      logger.warning("No free core to pin to, process not pinned.")
+  for var in _THREAD_ENV_VARS:
+    os.environ[var] = str(num_threads)
+  try:
+    # BLAS pools that already exist, e.g. the one of numpy
+    import threadpoolctl
+    threadpoolctl.threadpool_limits(num_threads)
+  except ImportError:
+    pass
+  try:
+    import tensorflow as tf
+    tf.config.threading.set_intra_op_parallelism_threads(num_threads)
+    # training graphs are mostly sequential, few independent ops run at once
+    tf.config.threading.set_inter_op_parallelism_threads(min(num_threads, 2))
+  except ImportError:
+    logger.warning("Tensorflow not installed, its threads are not limited.")
+  except RuntimeError as e:
+    # thread pools must be set before tensorflow is initialized
+    logger.warning("Tensorflow threads not limited: %s", e)
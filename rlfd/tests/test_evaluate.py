@@ -0,0 +1,45 @@
+import pickle
+
+import numpy as np
+import pytest
+
+import gym_rlfd.synthetic
+from rlfd import agents, evaluate, train
+from rlfd.params import sac, td3
+
+
+def _make_agent(algo_params):
+  env_id = gym_rlfd.synthetic.register_synthetic(obs_dim=5,
+                                                 action_dim=2,
+                                                 eps_length=10,
+                                                 dataset_size=100)
+  params = dict(algo_params, env_name=env_id)
+  _, env_params = train.get_env_constructor_and_config(params)
+  agent_params = dict(params["agent"], buffer_size=100)
+  return agents.AGENTS[params["algo"]](**agent_params, **env_params)
+
+
+@pytest.mark.parametrize("algo_params",
+                         [td3.default_params, sac.default_params])
+def test_load_pickled_policy(algo_params, tmp_path):
+  agent = _make_agent(algo_params)
+  agent.shaping = None  # set by before_training_hook
+  policy_file = str(tmp_path / "policy.pkl")
+  with open(policy_file, "wb") as f:
+    pickle.dump(agent, f)
+
+  agent_class, state = evaluate._load_state(policy_file)
+  assert agent_class is type(agent)
+  loaded = evaluate._get_agent(agent_class, state)
+  assert loaded.shaping is None
+
+  expected, actual = agent.get_weights(), loaded.get_weights()
+  for k, v in expected["tf_var"].items():
+    np.testing.assert_array_equal(actual["tf_var"][k], v)
+  for k, v in expected["tf_model"].items():
+    for a, b in zip(actual["tf_model"][k], v):
+      np.testing.assert_array_equal(a, b)
+
+  # policies with the same init args share the agent
+  _, state = evaluate._load_state(policy_file)
+  assert evaluate._get_agent(agent_class, state) is loaded
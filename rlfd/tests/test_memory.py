@@ -0,0 +1,114 @@
+import os
+
+import numpy as np
+
+from rlfd import memory
+
+
+def _transitions(start, size):
+  o = np.arange(start, start + size, dtype=np.float32)
+  return dict(o=np.stack([o, -o], axis=1), r=o[:, None])
+
+
+def _episodes(start, size, T):
+  o = np.arange(start * T, (start + size) * T, dtype=np.float32)
+  return dict(o=o.reshape((size, T, 1)), r=-o.reshape((size, T, 1)))
+
+
+def _assert_same_content(buffer, restored):
+  assert restored.current_size == buffer.current_size
+  for k, v in buffer.buffers.items():
+    np.testing.assert_array_equal(restored.buffers[k][:buffer.current_size],
+                                  v[:buffer.current_size])
+
+
+def test_step_based_snapshot_round_trip(tmp_path):
+  directory = str(tmp_path / "buffer")
+  shapes = dict(o=(2,), r=(1,))
+  buffer = memory.StepBaseReplayBuffer(shapes, 10)
+  buffer.store(_transitions(0, 6))
+  first = buffer.save_snapshot(directory)
+  buffer.store(_transitions(6, 3))
+  manifest = buffer.save_snapshot(directory)  # only the new transitions
+  assert len(memory._read_manifest(directory, manifest)["chunks"]) == 2
+  assert memory.latest_snapshot(directory) == manifest
+
+  # the previous snapshot stays intact until pruned
+  previous = memory.StepBaseReplayBuffer(shapes, 10)
+  previous.load_snapshot(directory, first)
+  assert previous.current_size == 6
+  buffer.prune_snapshots(directory, manifest)
+  assert not os.path.exists(os.path.join(directory, first))
+
+  restored = memory.StepBaseReplayBuffer(shapes, 10)
+  restored.load_snapshot(directory, manifest)
+  _assert_same_content(buffer, restored)
+
+  # both continue storing at the same slot, overwriting the oldest ones
+  buffer.store(_transitions(9, 4))
+  restored.store(_transitions(9, 4))
+  _assert_same_content(buffer, restored)
+
+  # later snapshots of the restored buffer append to the loaded ones
+  restored.save_snapshot(directory)
+  again = memory.StepBaseReplayBuffer(shapes, 10)
+  again.load_snapshot(directory)
+  _assert_same_content(buffer, again)
+
+
+def test_snapshot_compaction(tmp_path):
+  directory = str(tmp_path / "buffer")
+  shapes = dict(o=(2,), r=(1,))
+  buffer = memory.StepBaseReplayBuffer(shapes, 4)
+  for i in range(5):
+    buffer.store(_transitions(3 * i, 3))
+    manifest = buffer.save_snapshot(directory)
+    buffer.prune_snapshots(directory, manifest)
+  chunks = memory._read_manifest(directory, manifest)["chunks"]
+  assert sum(c["size"] for c in chunks) <= 2 * buffer.current_size
+  chunk_ids = set(c["id"] for c in chunks)
+  for f in os.listdir(directory):
+    if f.startswith("chunk-"):
+      assert int(f.split("-")[1]) in chunk_ids
+
+  restored = memory.StepBaseReplayBuffer(shapes, 4)
+  restored.load_snapshot(directory)
+  _assert_same_content(buffer, restored)
+
+
+def test_episode_based_snapshot_round_trip(tmp_path):
+  directory = str(tmp_path / "buffer")
+  shapes = dict(o=(3, 1), r=(3, 1))
+  buffer = memory.EpisodeBaseReplayBuffer(shapes, 12, 3)
+  buffer.store(_episodes(0, 2, 3))
+  buffer.save_snapshot(directory)
+  buffer.store(_episodes(2, 1, 3))
+  buffer.save_snapshot(directory)
+
+  restored = memory.EpisodeBaseReplayBuffer(shapes, 12, 3)
+  restored.load_snapshot(directory)
+  _assert_same_content(buffer, restored)
+  assert restored.stored_episodes == 3
+
+
+def test_load_shared_does_not_copy():
+  data = _transitions(0, 8)
+  for v in data.values():
+    v.setflags(write=False)  # as arrays of the object store
+  buffer = memory.StepBaseReplayBuffer.construct_shared(data)
+  assert buffer.current_size == buffer.capacity == 8
+  for k, v in data.items():
+    assert buffer.buffers[k] is v
+
+  batch = buffer.sample(batch_size=4)
+  np.testing.assert_array_equal(batch["o"][:, 0], batch["r"][:, 0])
+  assert set(batch["r"][:, 0]) <= set(data["r"][:, 0])
+
+
+def test_load_shared_episodes():
+  data = _episodes(0, 4, 3)
+  buffer = memory.EpisodeBaseReplayBuffer.construct_shared(data)
+  assert buffer.T == 3
+  assert buffer.stored_episodes == 4
+  assert buffer.stored_steps == 12
+  assert buffer.buffers["o"] is data["o"]
@@ -0,0 +1,41 @@
+import numpy as np
+import tensorflow as tf
+
+from rlfd import metrics
+
+
+def _values(accumulator, name):
+  return [float(v.numpy()) for v in accumulator._vars[name]]
+
+
+def test_scalar_accumulator():
+  accumulator = metrics.ScalarAccumulator("Training")
+  accumulator.update("loss", 1.0)
+  accumulator.update("loss", np.array([2.0, 4.0]))  # adds the mean
+  accumulator.update("loss", -1.0)
+  assert _values(accumulator, "loss") == [3.0, 3.0, -1.0, 3.0]
+
+
+def test_scalar_accumulator_in_tf_function():
+  accumulator = metrics.ScalarAccumulator("Training")
+
+  @tf.function
+  def train_step(value):
+    accumulator.update("q", value)
+
+  for value in (0.5, 1.5, 1.0):
+    train_step(tf.constant(value))
+  assert _values(accumulator, "q") == [3.0, 3.0, 0.5, 1.5]
+
+
+def test_scalar_accumulator_flush_resets(tmp_path):
+  accumulator = metrics.ScalarAccumulator("Training")
+  accumulator.update("loss", 2.0)
+  step = tf.Variable(10, dtype=tf.int64, name="step")
+  writer = tf.summary.create_file_writer(str(tmp_path))
+  with writer.as_default():
+    accumulator.flush(step)
+    accumulator.flush(step)  # nothing updated since, nothing written
+  writer.close()
+  assert _values(accumulator, "loss") == [0.0, 0.0, np.inf, -np.inf]
+  assert any(f.name.startswith("events") for f in tmp_path.iterdir())